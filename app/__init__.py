@@ -3,6 +3,8 @@ from flask_login import LoginManager
 from flask_babel import Babel
 from .config import Config
 from .db import DB
+from .cache import Cache
+from .order_feed import OrderFeed
 
 
 login = LoginManager()
@@ -15,6 +17,8 @@ def create_app():
     app.config.from_object(Config)
 
     app.db = DB(app)
+    app.cache = Cache(app)
+    app.order_feed = OrderFeed(app)
     login.init_app(app)
     babel.init_app(app)
 
@@ -42,4 +46,7 @@ def create_app():
     from .coupon import bp as coupon_bp
     app.register_blueprint(coupon_bp)
 
+    from .charts import bp as charts_bp
+    app.register_blueprint(charts_bp)
+
     return app
@@ -0,0 +1,360 @@
+import fcntl
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from urllib.parse import urlparse
+
+
+class Cache:
+    """Two-tier cache for entities the models load by id (products, users,
+    coupons), so that every worker does not re-query the same rows.
+
+    The first tier is a bounded in-process LRU.  Its entries live for only
+    LOCAL_TTL_SECONDS, which bounds how long a worker can serve a row that
+    another worker has changed.  The optional second tier is shared by all
+    workers and configured with CACHE_URL:
+        redis://host:port/db        a Redis server (needs the redis package)
+        file:///path/to/directory   a directory of files, a stand-in for
+                                    Redis on one machine (tests, the VM)
+    Without CACHE_URL only the in-process tier is used.
+
+    Shared keys are versioned per entity: a value is stored under the key
+    of the entity's current version, and invalidating the entity bumps the
+    version, so a value loaded from before a write is never read back even
+    if its store races with the write.  Values read by a transaction with
+    uncommitted writes are not cached at all, since that transaction may
+    still roll back.  Concurrent misses on the same entity are collapsed:
+    one worker (and one thread within it) holds a short lease and loads the
+    row while the others wait for its result.
+
+    Hit, miss and load counts of this process are kept in stats."""
+
+    LOCAL_SIZE = 4096
+    LOCAL_TTL_SECONDS = 5
+    SHARED_TTL_SECONDS = 10 * 60
+    LEASE_SECONDS = 2  # a crashed loader's lease expires after this long
+    LEASE_WAIT_SECONDS = 0.5  # how long to wait for another loader before loading anyway
+    KEY_PREFIX = 'amazon:2:'  # bump the number when cached classes change shape
+
+    def __init__(self, app):
+        self.local = LRUTier(self.LOCAL_SIZE)
+        self.shared = shared_tier(app.config.get('CACHE_URL'))
+        self.stats = Counter()
+        self._leases = set()  # keys this process is loading
+        self._leases_lock = threading.Lock()
+        self._db = app.db
+
+    def get(self, entity, id, load):
+        """Return the entity with the given id, calling load(id) to fetch it
+        on a miss.  None results are not cached."""
+        return self.get_many(entity, [id], lambda ids: {id: load(id)}).get(id)
+
+    def get_many(self, entity, ids, load_many):
+        """Return a dict of the entities with the given ids, calling
+        load_many(ids) once with all the ids missing from both tiers, which
+        must return a dict by id (leaving out ids that do not exist)."""
+        found = {}
+        missing = []
+        for id in ids:
+            value = self.local.get((entity, id))
+            if value is not None:
+                self.stats['local_hits'] += 1
+                found[id] = value
+            elif id not in missing:
+                missing.append(id)
+        if not missing:
+            return found
+
+        versions = self._versions(entity, missing)
+        for id, value in zip(missing, self.shared.get_many(
+                [self._key(entity, id, versions[id]) for id in missing])):
+            if value is not None:
+                self.stats['shared_hits'] += 1
+                self.local.set((entity, id), value, self.LOCAL_TTL_SECONDS)
+                found[id] = value
+        missing = [id for id in missing if id not in found]
+        if not missing:
+            return found
+        self.stats['misses'] += len(missing)
+
+        # load what nobody else is loading; wait a little for the rest
+        leased = [id for id in missing if self._lease(self._key(entity, id, versions[id]))]
+        try:
+            if leased:
+                found.update(self._load(entity, leased, versions, load_many))
+        finally:
+            for id in leased:
+                self._release(self._key(entity, id, versions[id]))
+
+        # wait while another loader holds the lease; if it released the lease without storing a value (the entity
+        # does not exist, or its load failed) or takes too long, load the entity here
+        waiting = [id for id in missing if id not in leased]
+        deadline = time.monotonic() + self.LEASE_WAIT_SECONDS
+        while waiting and time.monotonic() < deadline:
+            time.sleep(0.01)
+            for id, value, is_leased in zip(list(waiting), *self._peek(entity, waiting, versions)):
+                if value is not None:
+                    self.stats['waits'] += 1
+                    found[id] = value
+                if value is not None or not is_leased:
+                    waiting.remove(id)
+        missing = [id for id in missing if id not in found and id not in leased]
+        if missing:
+            found.update(self._load(entity, missing, versions, load_many))
+        return found
+
+    def invalidate(self, entity, *ids):
+        """Drop the cached copies of the given entities after their rows have
+        been changed.  This happens right away and again once the current
+        transaction has ended, so that a reload racing with the write cannot
+        leave the old row cached."""
+        def drop():
+            for id in ids:
+                self.local.delete((entity, id))
+                version = self.shared.incr(self._version_key(entity, id))
+                self.shared.delete(self._key(entity, id, version - 1))  # unreachable now, free it
+
+        self.stats['invalidations'] += len(ids)
+        drop()
+        self._db.after_transaction(drop)
+
+    def _load(self, entity, ids, versions, load_many):
+        self.stats['loads'] += 1
+        loaded = {id: value for id, value in load_many(ids).items() if value is not None}
+        if self._db.has_uncommitted_writes():
+            # read inside a transaction that has written, so it may see rows that are rolled back later; keep it out
+            # of both tiers, which other requests read too
+            self.stats['uncached_loads'] += 1
+            return loaded
+        for id, value in loaded.items():
+            self.shared.set(self._key(entity, id, versions[id]), value, self.SHARED_TTL_SECONDS)
+            self.local.set((entity, id), value, self.LOCAL_TTL_SECONDS)
+        return loaded
+
+    def _peek(self, entity, ids, versions):
+        """Return the values of the given entities now in either tier and
+        whether each is still being loaded (under its lease)."""
+        keys = [self._key(entity, id, versions[id]) for id in ids]
+        values = self.shared.get_many(keys)
+        leases = self.shared.get_many([key + ':lease' for key in keys])
+        with self._leases_lock:
+            is_leased = [key in self._leases or lease is not None for key, lease in zip(keys, leases)]
+        return ([value if value is not None else self.local.get((entity, id)) for id, value in zip(ids, values)],
+                is_leased)
+
+    def _versions(self, entity, ids):
+        versions = self.shared.get_counters([self._version_key(entity, id) for id in ids])
+        return dict(zip(ids, versions))
+
+    def _key(self, entity, id, version):
+        return '{}{}:{}:{}'.format(self.KEY_PREFIX, entity, id, version)
+
+    def _version_key(self, entity, id):
+        return '{}{}:{}:version'.format(self.KEY_PREFIX, entity, id)
+
+    def _lease(self, key):
+        with self._leases_lock:
+            if key in self._leases:
+                return False
+            self._leases.add(key)
+        if self.shared.add(key + ':lease', 1, self.LEASE_SECONDS):
+            return True
+        with self._leases_lock:
+            self._leases.discard(key)
+        return False
+
+    def _release(self, key):
+        self.shared.delete(key + ':lease')
+        with self._leases_lock:
+            self._leases.discard(key)
+
+
+def shared_tier(url):
+    """Return the shared tier configured by url (see Cache)."""
+    if not url:
+        return NullTier()
+    parsed = urlparse(url)
+    if parsed.scheme in ('redis', 'rediss', 'unix'):
+        return RedisTier(url)
+    if parsed.scheme == 'file':
+        return FileTier(parsed.path)
+    raise ValueError('Unsupported CACHE_URL: ' + url)
+
+
+class LRUTier:
+    """Bounded in-process tier: the least recently used entry is evicted
+    once it holds more than size entries."""
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()  # key -> (expires at, value)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+class NullTier:
+    """Shared tier used when none is configured: stores nothing and grants
+    every lease, leaving single-flight to the in-process leases."""
+    def get_many(self, keys):
+        return [None] * len(keys)
+
+    def get_counters(self, keys):
+        return [0] * len(keys)
+
+    def set(self, key, value, ttl):
+        pass
+
+    def add(self, key, value, ttl):
+        return True
+
+    def delete(self, key):
+        pass
+
+    def incr(self, key):
+        return 0
+
+
+class FileTier:
+    """Shared tier kept as one pickle file per key in a directory, which
+    every worker on the machine can reach.  Writes go through a temporary
+    file and a rename, so readers never see a partial value; counters are
+    updated under an exclusive lock on one lock file.  Every
+    SWEEP_INTERVAL_SECONDS a worker writing to the directory deletes the
+    files of expired values and leases, and temporary files left behind by
+    a crashed writer, so that the directory does not grow without bound."""
+    SWEEP_INTERVAL_SECONDS = 60
+    TEMP_PREFIX = '.tmp'
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._lock_path = os.path.join(directory, '.counters.lock')
+        self._next_sweep = time.time() + self.SWEEP_INTERVAL_SECONDS
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                expires_at, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return value
+
+    def get_many(self, keys):
+        return [self._read(self._path(key)) for key in keys]
+
+    def get_counters(self, keys):
+        return [self._read(self._path(key)) or 0 for key in keys]
+
+    def set(self, key, value, ttl):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=self.TEMP_PREFIX)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((time.time() + ttl if ttl else None, value), f)
+        os.replace(tmp, self._path(key))
+        if time.time() >= self._next_sweep:
+            self._next_sweep = time.time() + self.SWEEP_INTERVAL_SECONDS
+            self.sweep()
+
+    def add(self, key, value, ttl):
+        path = self._path(key)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                if self._read(path) is not None:
+                    return False
+                self.delete(key)  # expired; take it over
+                continue
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((time.time() + ttl, value), f)
+            return True
+        return False
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def incr(self, key):
+        path = self._path(key)
+        with open(self._lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            value = int(self._read(path) or 0) + 1
+            self.set(key, value, None)
+            return value
+
+    def sweep(self):
+        """Delete the files of expired values and leases, and temporary
+        files older than a sweep interval.  Counters never expire."""
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.startswith(self.TEMP_PREFIX):
+                    if entry.stat().st_mtime < now - self.SWEEP_INTERVAL_SECONDS:
+                        os.remove(entry.path)
+                    continue
+                if entry.name.startswith('.'):
+                    continue
+                with open(entry.path, 'rb') as f:
+                    expires_at, _ = pickle.load(f)
+                if expires_at is not None and expires_at <= now:
+                    os.remove(entry.path)
+            except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+                continue  # removed or replaced by another worker meanwhile
+
+
+class RedisTier:
+    """Shared tier on a Redis server."""
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_URL points to Redis, but the redis package is not installed')
+        self.client = redis.Redis.from_url(url)
+
+    def get_many(self, keys):
+        return [pickle.loads(value) if value is not None else None for value in self.client.mget(keys)]
+
+    def get_counters(self, keys):
+        return [int(value or 0) for value in self.client.mget(keys)]
+
+    def set(self, key, value, ttl):
+        self.client.set(key, pickle.dumps(value), ex=ttl)
+
+    def add(self, key, value, ttl):
+        return bool(self.client.set(key, pickle.dumps(value), ex=ttl, nx=True))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def incr(self, key):
+        return self.client.incr(key)
@@ -7,9 +7,8 @@ from flask_babel import _, lazy_gettext as _l
 
 
 from .models.cart import Cart
+from .models.checkout import Checkout
 from .models.product_in_cart import ProductInCart
-from .models.purchase import Purchase
-from .inventory import InventoryEntry
 from .models.user import User
 from .models.coupon import Coupon
 from .errors import *
@@ -36,9 +35,7 @@ def view_cart():
         total_price = current_cart.get_total_current_price(None)
         form = AddCouponForm()
 
-        page_num = 1
-        if request.args.get('page'):
-            page_num = int(request.args.get('page'))
+        cursor = request.args.get('cursor')
 
         if request.method == 'POST':
             if form.validate_on_submit():
@@ -62,11 +59,10 @@ def view_cart():
 
         return render_template(
             'cart.html',
-            products_in_cart=current_cart.get_products_in_cart(page_num),
+            products_in_cart=current_cart.get_products_in_cart(paginated=True, cursor=cursor),
             total_cart_price=total_price,
-            user_can_order=total_price <= User.get(current_user.id).balance,
-            form=form,
-            page_num=page_num
+            user_can_order=total_price <= User.get_balance(current_user.id),
+            form=form
         )
 
     return redirect(url_for('users.login'))
@@ -75,22 +71,21 @@ def view_cart():
 """
 This method gets a purchased cart with the given cart id  
 """
-@bp.route('/order/<cart_id>')
+@bp.route('/order/<int:cart_id>')
 def view_purchased_cart(cart_id):
     if current_user.is_authenticated:
 
-        page_num = int(request.args.get('page'))
+        cursor = request.args.get('cursor')
 
         purchased_cart = Cart.get_cart_by_id(cart_id)
-        purchases = purchased_cart.get_purchases(page_num)
+        purchases = purchased_cart.get_purchases(paginated=True, cursor=cursor)
         coupon = None
         if purchased_cart.coupon_applied:
             coupon = Coupon.get(purchased_cart.coupon_applied)
 
-        final_price = 0
-        for purchase in purchased_cart.get_purchases():
-            final_price += purchase.get_total_price_paid(coupon)
-        purchased_cart.get_products_in_cart()
+        final_price = purchased_cart.total_price
+        if final_price is None:  # bought before order totals were kept and not backfilled yet
+            final_price = sum(purchase.get_total_price_paid(coupon) for purchase in purchased_cart.get_purchases())
 
         return render_template(
             'purchase.html',
@@ -98,8 +93,7 @@ def view_purchased_cart(cart_id):
             purchases=purchases,
             total_cart_price=final_price,
             cart_id=cart_id,
-            coupon=coupon,
-            page_num=page_num
+            coupon=coupon
         )
     return redirect(url_for('users.login'))
 
@@ -111,7 +105,8 @@ This method add an item from a specific seller to the user's current cart
 def add_item_to_cart(product_id, seller_id):
     if current_user.is_authenticated:
         current_cart = Cart.get_current_cart(current_user.id)
-        ProductInCart.add_to_cart(product_id, seller_id, current_cart.id)
+        if ProductInCart.add_to_cart(product_id, seller_id, current_cart.id) is None:
+            flash(NOT_ENOUGH_INVENTORY.format(product_id))
         return redirect(request.referrer)
     return redirect(url_for('users.login'))
 
@@ -150,79 +145,18 @@ def remove_item_from_cart(product_in_cart_id):
 
 
 """
-This method converts the user's current cart into a purchase by:
-    for each product in the cart,
-    1) validating the buyer has enough money 
-    2) validating the seller has enough inventory
-    3) subtracting from the buyer's balance
-    4) adding to the seller's balance
-    5) subtracting from the seller's inventory
-    6) adding the product to purchases
-Finally, the cart is marked purchased and a new cart is created for the user
-
-This method calls some methods that may seem repeated, but this is necessary because these methods must run as part of a 
-transaction in order to rollback if the user runs out of money or a seller runs out of inventory. Since the SQL
-in our codebase is automatically committed in all other places, some methods used here must be repetitive. 
+This method converts the user's current cart into a purchase. All of the validation and bookkeeping (balances,
+inventories, purchases and the user's new cart) is done by Checkout in one transaction; if the cart cannot be purchased
+the reason is shown to the user and nothing is changed
 """
 @bp.route('/order_cart')
 def order_cart():
-
     if current_user.is_authenticated:
         current_cart = Cart.get_current_cart(current_user.id)
 
-        if len(current_cart.get_products_in_cart()) == 0:
-            flash("You have nothing in your cart!")
+        error = Checkout.order_cart(current_cart)
+        if error:
+            flash(error)
             return redirect(request.referrer)
-
-        with app.db.engine.begin() as conn:
-
-            for product_in_cart in current_cart.get_products_in_cart():  # TODO need to add final prices somehow
-
-                # get product price
-                total_product_price = product_in_cart.get_total_price_to_pay(Coupon.get(current_cart.coupon_applied))
-
-                # ensure user has enough money
-                user_has_enough_money = User.get(current_user.id).balance >= total_product_price
-                if not user_has_enough_money:
-                    flash(NOT_ENOUGH_MONEY)
-                    conn.rollback()
-                    return redirect(request.referrer)
-
-                # ensure seller has enough inventory
-                seller_product_inventory = InventoryEntry.get_amount_available(
-                    product_in_cart.seller_id,
-                    product_in_cart.product.id
-                )
-                seller_has_enough_inventory = product_in_cart.quantity <= seller_product_inventory
-                if not seller_has_enough_inventory:
-                    flash(NOT_ENOUGH_INVENTORY.format(product_in_cart.product.id))
-                    conn.rollback()
-                    return redirect(request.referrer)
-
-                # take from buyer balance
-                User.get(current_user.id).decrease_balance_without_commit(conn, total_product_price)
-                # take from seller inventory
-                InventoryEntry.decrease_seller_inventory_without_commit(
-                    conn,
-                    product_in_cart.product.id,
-                    product_in_cart.seller_id,
-                    product_in_cart.quantity
-                )
-                # add to seller balance
-                User.get(product_in_cart.seller_id).increase_balance_without_commit(conn, total_product_price)
-
-                # add purchase for user
-                Purchase.insert_new_purchase_without_commit(
-                    conn,
-                    product_in_cart.id,
-                    current_user.id,
-                    current_cart.id,
-                    product_in_cart.product.price
-                )
-
-            conn.commit()
-            current_cart.mark_as_purchased()
-            Cart.create_new_cart(current_user.id)
-            return redirect(url_for('order.view_orders')+'?page=1')
+        return redirect(url_for('order.view_orders'))
     return redirect(url_for('users.login'))
-
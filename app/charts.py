@@ -0,0 +1,77 @@
+from flask import request, abort, make_response
+import hashlib
+
+from .models.rating_chart import RatingChart, TITLES, STARS, AVERAGE_BINS, CHART_MAX_AGE_SECONDS, MAX_COUNT
+from flask import Blueprint
+
+
+bp = Blueprint('charts', __name__)
+
+"""
+Serves the rating distribution chart of a product or seller. The query arguments are the whole chart, so the same URL
+always produces the same image; they must carry the signature RatingChart gave them
+"""
+@bp.route('/charts/rating_distribution.png')
+def rating_distribution():
+    subject = parse_subject()
+    counts = parse_counts(len(STARS))
+    if sum(counts) == 0:
+        abort(404)
+    key = verified_key('rating_distribution', subject, counts)
+    return chart_response(key, lambda: RatingChart.render_rating_distribution(subject, counts))
+
+"""
+Serves the average rating distribution chart of a product category or of all sellers
+"""
+@bp.route('/charts/average_distribution.png')
+def average_distribution():
+    subject = parse_subject()
+    counts = parse_counts(len(AVERAGE_BINS) - 1)
+    highlight = request.args.get('highlight', type=int)
+    percentile = request.args.get('percentile', type=int)
+    if highlight is None or not 0 <= highlight < len(counts) or percentile is None or not 0 <= percentile <= 100:
+        abort(404)
+    key = verified_key('average_distribution', subject, counts, highlight, percentile)
+    return chart_response(key, lambda: RatingChart.render_average_distribution(subject, counts, highlight, percentile))
+
+
+def parse_subject():
+    subject = request.args.get('subject')
+    if subject not in TITLES:
+        abort(404)
+    return subject
+
+
+def parse_counts(expected_length):
+    try:
+        counts = tuple(int(count) for count in request.args.get('counts', '').split(','))
+    except ValueError:
+        abort(404)
+    if len(counts) != expected_length or min(counts) < 0 or max(counts) > MAX_COUNT:
+        abort(404)
+    return counts
+
+
+def verified_key(kind, subject, counts, *params):
+    key = RatingChart.key(kind, subject, counts, *params)
+    if not RatingChart.verify(key, request.args.get('sig')):
+        abort(404)
+    return key
+
+
+"""
+Since a chart's key fully determines the image, its ETag is derived from the key alone (not from the URL, whose other
+query arguments do not change the image). A browser revalidating a chart it already has therefore gets a 304 without the
+chart being rendered (or even looked up) again
+"""
+def chart_response(key, render):
+    etag = hashlib.sha1(key.encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(render())
+        response.mimetype = 'image/png'
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = CHART_MAX_AGE_SECONDS
+    return response
@@ -8,3 +8,6 @@ class Config(object):
                 os.environ.get('DB_PASSWORD'),
                 os.environ.get('DB_NAME'))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    CHECKOUT_ISOLATION_LEVEL = os.environ.get('CHECKOUT_ISOLATION_LEVEL', 'READ COMMITTED')
+    CACHE_URL = os.environ.get('CACHE_URL')  # shared model cache, see app/cache.py
+    ORDER_FEED = os.environ.get('ORDER_FEED')  # 'postgres' (default) or 'local', see app/order_feed.py
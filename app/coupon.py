@@ -1,7 +1,8 @@
 from flask_login import current_user
-from flask import redirect, url_for, request
+from flask import redirect, url_for, request, flash
 
-from .models.coupon import Coupon
+from .models.coupon import Coupon, MAX_COUPONS_PER_BATCH
+from .errors import INVALID_COUPON_COUNT, COUPONS_GENERATED
 from flask import Blueprint
 
 
@@ -17,3 +18,20 @@ def generate_coupon(product_id, seller_id):
             Coupon.generate_new_coupon(product_id, seller_id)
         return redirect(request.referrer)
     return redirect(url_for('users.login'))
+
+
+"""
+This method generates a batch of new coupons (e.g. for a promotion) for a specific product from the seller who is
+logged in
+"""
+@bp.route('/generate_coupons/<product_id>/<seller_id>', methods=['POST'])
+def generate_coupons(product_id, seller_id):
+    if current_user.is_authenticated and int(seller_id) == current_user.id:
+        count = request.form.get('count', type=int)
+        if count is None or not 1 <= count <= MAX_COUPONS_PER_BATCH:
+            flash(INVALID_COUPON_COUNT.format(MAX_COUPONS_PER_BATCH))
+        else:
+            codes = Coupon.generate_new_coupons(product_id, seller_id, count)
+            flash(COUPONS_GENERATED.format(len(codes), product_id, ', '.join(codes[:10]) + (', ...' if len(codes) > 10 else '')))
+        return redirect(request.referrer or url_for('inventory.inventory'))
+    return redirect(url_for('users.login'))
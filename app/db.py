@@ -1,11 +1,24 @@
+from contextlib import contextmanager
+
+from flask import g, has_app_context
 from sqlalchemy import create_engine, text
 
 
 class DB:
-    """Hosts all functions for querying the database."""
+    """Hosts all functions for querying the database.
+
+    While a Flask app context is active (i.e. during a request), every
+    statement runs on one connection bound to flask.g, inside one
+    transaction that is committed once when the request finishes
+    successfully and rolled back otherwise, including when it responds with
+    an error status.  Outside of an app context each call checks out its own
+    connection and commits immediately."""
     def __init__(self, app):
         self.engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], future=True)
 
+        app.after_request(self.commit_request)
+        app.teardown_appcontext(self.close_connection)
+
         self.execute_with_no_return(
             """
             PREPARE insert_purchase AS
@@ -18,6 +31,135 @@ class DB:
     def connect(self):
         return self.engine.connect()
 
+    @staticmethod
+    def values(name, rows):
+        """Build the body of a multi-row VALUES list for rows (a list of
+        equal-length tuples), returning the SQL and the bind parameters to pass
+        to execute.  Each value gets its own :name_row_column placeholder, e.g.
+
+            sql, params = app.db.values('line', [(1, 2), (3, 4)])
+            app.db.execute('... FROM (VALUES ' + sql + ') AS line(a, b) ...', **params)
+        """
+        placeholders = []
+        params = {}
+        for i, row in enumerate(rows):
+            keys = ['{}_{}_{}'.format(name, i, j) for j in range(len(row))]
+            params.update(zip(keys, row))
+            placeholders.append('(' + ', '.join(':' + key for key in keys) + ')')
+        return ', '.join(placeholders), params
+
+    def connection(self):
+        """Return the connection bound to the current app context, checking
+        one out of the pool on first use.  Returns None when there is no app
+        context, in which case callers fall back to a connection of their own."""
+        if not has_app_context():
+            return None
+        if 'db_conn' not in g:
+            g.db_conn = self.engine.connect()
+        return g.db_conn
+
+    def commit(self):
+        """Commit the work done so far in the current unit of work.  The next
+        statement automatically begins a new transaction on the same connection."""
+        conn = g.get('db_conn') if has_app_context() else None
+        if conn is not None and conn.in_transaction():
+            conn.commit()
+        self._end_transaction(committed=True)
+
+    def rollback(self):
+        """Discard the work done so far in the current unit of work."""
+        conn = g.get('db_conn') if has_app_context() else None
+        if conn is not None and conn.in_transaction():
+            conn.rollback()
+        self._end_transaction()
+
+    def after_transaction(self, callback):
+        """Call callback() once the current unit of work has been committed
+        or rolled back, e.g. to drop cached copies of rows it changed only
+        when other requests can no longer read the old values from the
+        database.  Without an open transaction it is called right away."""
+        conn = g.get('db_conn') if has_app_context() else None
+        if conn is None or not conn.in_transaction():
+            callback()
+            return
+        if 'db_after_transaction' not in g:
+            g.db_after_transaction = []
+        g.db_after_transaction.append(callback)
+
+    def after_commit(self, callback):
+        """Call callback() once the current unit of work has been committed,
+        e.g. to tell other requests about rows it wrote only once they can
+        read them.  It is dropped if the unit of work is rolled back instead.
+        Without an open transaction it is called right away."""
+        conn = g.get('db_conn') if has_app_context() else None
+        if conn is None or not conn.in_transaction():
+            callback()
+            return
+        if 'db_after_commit' not in g:
+            g.db_after_commit = []
+        g.db_after_commit.append(callback)
+
+    def has_uncommitted_writes(self):
+        """Whether the current unit of work has written (or locked) rows that
+        it has not committed yet, i.e. whether what it reads may differ from
+        what other requests can see."""
+        conn = g.get('db_conn') if has_app_context() else None
+        if conn is None or not conn.in_transaction():
+            return False
+        # Postgres assigns a transaction id on the first write
+        return conn.execute(text('SELECT txid_current_if_assigned() IS NOT NULL')).scalar()
+
+    def _end_transaction(self, committed=False):
+        callbacks = g.pop('db_after_transaction', []) if has_app_context() else []
+        commit_callbacks = g.pop('db_after_commit', []) if has_app_context() else []
+        for callback in callbacks + (commit_callbacks if committed else []):
+            callback()
+
+    @contextmanager
+    def savepoint(self):
+        """Run a block of statements inside a SAVEPOINT of the current unit of
+        work.  The savepoint is released when the block exits normally and
+        rolled back if it raises; callers may also roll it back explicitly
+        through the yielded transaction object.  Needs an active app context,
+        since that is what holds the connection the savepoint belongs to."""
+        conn = self.connection()
+        if conn is None:
+            raise RuntimeError('DB.savepoint() requires an active app context')
+
+        nested = conn.begin_nested()
+        try:
+            yield nested
+        except Exception:
+            if nested.is_active:
+                nested.rollback()
+            raise
+        else:
+            if nested.is_active:
+                nested.commit()
+
+    def commit_request(self, response):
+        """after_request hook: commit the request's unit of work so that a
+        failed commit still turns into an error response.  Error responses
+        (status 400 and up, e.g. from abort() or an error handler) roll it
+        back instead, so that a request failing half way through does not
+        keep the writes it made before failing."""
+        if response.status_code >= 400:
+            self.rollback()
+        else:
+            self.commit()
+        return response
+
+    def close_connection(self, exc):
+        """teardown_appcontext hook: roll back anything left uncommitted (the
+        request raised, or the context was not a request) and return the
+        connection to the pool."""
+        conn = g.pop('db_conn', None)
+        if conn is not None:
+            if conn.in_transaction():
+                conn.rollback()
+            conn.close()
+        self._end_transaction()
+
     def execute(self, sqlstr, **kwargs):
         """Execute sqlstr and return a list of result tuples.  sqlstr will be
         wrapped automatically in a
@@ -28,6 +170,10 @@ class DB:
         https://docs.sqlalchemy.org/en/14/core/connections.html#sqlalchemy.engine.CursorResult
         for additional details.  See models/*.py for examples of
         calling this function."""
+        conn = self.connection()
+        if conn is not None:
+            return list(conn.execute(text(sqlstr), kwargs).fetchall())
+
         with self.engine.connect() as conn:
             result = list(conn.execute(text(sqlstr), kwargs).fetchall())
             conn.commit()
@@ -39,6 +185,10 @@ class DB:
     The use of .fetchall() causes the execute method to error for SQL that does not return rows (i.e. UPDATE)
     """
     def execute_with_no_return(self, sqlstr, **kwargs):
+        conn = self.connection()
+        if conn is not None:
+            return conn.execute(text(sqlstr), kwargs)
+
         with self.engine.connect() as conn:
             result = conn.execute(text(sqlstr), kwargs)
             conn.commit()
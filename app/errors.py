@@ -4,3 +4,8 @@ COUPON_SUCCESSFUL = "Coupon {0} is applied and has given you {1}% off 1 unit of
 COUPON_FOR_ITEM_NOT_IN_CART = "Coupon {0} cannot be applied. Product {1} sold by seller {2} is not in your cart"
 COUPON_EXPIRED = "Coupon {0} is no longer valid!"
 NOT_ENOUGH_INVENTORY = "The seller of product {0} does not enough inventory (check product page to see if inventory changed)"
+EMPTY_CART = "You have nothing in your cart!"
+INVALID_COUPON_COUNT = "You can generate between 1 and {0} coupons at a time"
+COUPONS_GENERATED = "Generated {0} coupons for product {1}: {2}"
+NOTHING_TO_FULFILL = "Select the purchases you want to fulfill"
+PURCHASES_FULFILLED = "Fulfilled {0} purchase(s)"
@@ -21,42 +21,43 @@ from flask import Blueprint
 bp = Blueprint('inventory', __name__)
 bp.config = {}
 
+
+def _current_coupons(items: List[InventoryEntry]):
+    """
+    Returns the code of the current coupon of each listed product (by product id), looked up for the whole page at once
+    """
+    return {product_id: coupon.code for (product_id, seller_id), coupon in
+            Coupon.get_current_coupons_for_product_sellers(
+                [(item.product_id, item.seller_id) for item in items]).items()}
+
+
 @bp.route('/inventory', methods=['GET'])
 def inventory():
-    page_num = int(request.args.get('page'))
+    cursor = request.args.get('cursor')
     if not current_user.is_authenticated:
         return redirect(url_for('index.index'))
 
     items: List[InventoryEntry] = InventoryEntry.get_all_entries_by_seller(
-        page_num, seller_id=current_user.id)
-
-    coupons = {}
-    for item in items:
-        coupon = Coupon.get_current_coupon_for_product_seller(item.product_id, item.seller_id)
-        if coupon:
-            coupons[item.product_id] = coupon.code
-    return render_template('products_sold.html', inventory=items, page_num=page_num, max_pages=len(items), coupons=coupons)
+        cursor, seller_id=current_user.id)
+
+    coupons = _current_coupons(items)
+    return render_template('products_sold.html', inventory=items, coupons=coupons, pag_tag="/inventory?cursor=")
     
 @bp.route('/increment_quantity', methods=['GET'])
 def increment_quantity():
     if not current_user.is_authenticated:
         return redirect(url_for('index.index'))
     
-    page_num = int(request.args.get('page'))
+    cursor = request.args.get('cursor')
     prod_id = int(request.args.get('id'))
     
     InventoryEntry.increase_quantity(prod_id, current_user.id)
     items: List[InventoryEntry] = InventoryEntry.get_all_entries_by_seller(
-        page_num, seller_id=current_user.id)
+        cursor, seller_id=current_user.id)
 
-    coupons = {}
-    for item in items:
-        coupon = Coupon.get_current_coupon_for_product_seller(item.product_id, item.seller_id)
-        if coupon:
-            coupons[item.product_id] = coupon.code
+    coupons = _current_coupons(items)
 
-    return render_template('products_sold.html', inventory=items, page_num=page_num, max_pages=len(items), coupons=coupons,
-                            pag_tag = "/increment_quantity?id=" + str(prod_id) + "&page=")
+    return render_template('products_sold.html', inventory=items, coupons=coupons, pag_tag="/inventory?cursor=")
 
 
 @bp.route('/decrement_quantity', methods=['GET'])
@@ -64,21 +65,16 @@ def decrement_quantity():
     if not current_user.is_authenticated:
         return redirect(url_for('index.index'))
 
-    page_num = int(request.args.get('page'))
+    cursor = request.args.get('cursor')
     prod_id = int(request.args.get('id'))
     
     InventoryEntry.decrease_quantity(prod_id, current_user.id)
     items: List[InventoryEntry] = InventoryEntry.get_all_entries_by_seller(
-        page_num, seller_id=current_user.id)
+        cursor, seller_id=current_user.id)
 
-    coupons = {}
-    for item in items:
-        coupon = Coupon.get_current_coupon_for_product_seller(item.product_id, item.seller_id)
-        if coupon:
-            coupons[item.product_id] = coupon.code
+    coupons = _current_coupons(items)
 
-    return render_template('products_sold.html', inventory=items, page_num=page_num, max_pages=len(items), coupons=coupons,
-                            pag_tag = "/decrement_quantity?id=" + str(prod_id) + "&page=")
+    return render_template('products_sold.html', inventory=items, coupons=coupons, pag_tag="/inventory?cursor=")
 
 
 @bp.route('/delete_product', methods=['GET'])
@@ -87,7 +83,7 @@ def delete_product():
     Marks the Sells.is_available = false for this seller/item.
     """
 
-    page_num = int(request.args.get('page'))
+    cursor = request.args.get('cursor')
     prod_id = int(request.args.get('id'))
 
     if not current_user.is_authenticated:
@@ -95,16 +91,11 @@ def delete_product():
 
     InventoryEntry.delete_item(prod_id, current_user.id)
     items: List[InventoryEntry] = InventoryEntry.get_all_entries_by_seller(
-        page_num, seller_id=current_user.id)
+        cursor, seller_id=current_user.id)
 
-    coupons = {}
-    for item in items:
-        coupon = Coupon.get_current_coupon_for_product_seller(item.product_id, item.seller_id)
-        if coupon:
-            coupons[item.product_id] = coupon.code
+    coupons = _current_coupons(items)
 
-    return render_template('products_sold.html', inventory=items, page_num=page_num, max_pages=len(items), coupons=coupons,
-                            pag_tag = "/delete_product?id=" + str(prod_id) + "&page=")
+    return render_template('products_sold.html', inventory=items, coupons=coupons, pag_tag="/inventory?cursor=")
 
 class AddProductForm(FlaskForm):
     name = StringField(_l('* Product Name'), validators=[DataRequired()])
@@ -137,7 +128,7 @@ def add_product():
                 prod_id = Product.add_product(form.name.data, form.description.data, form.price.data, form.category.data, form.image.data.filename, current_user)
                 for restaurant in form.restaurant.data:
                     InventoryEntry.add_product_to_inventory(current_user, restaurant, prod_id, form.inventory.data)
-                return redirect(url_for('inventory.inventory', page=1))
+                return redirect(url_for('inventory.inventory'))
             else:
                 flash('Incorrect file type [png, jpg, jpeg accepted]')
                 render_template('add_product.html', form=form)
@@ -179,26 +170,26 @@ def edit_product():
 
         if form.name.data != "":
             Product.update_name(product_id, form.name.data)
-            return redirect(url_for('inventory.inventory', page=1))
+            return redirect(url_for('inventory.inventory'))
         if form.description.data != "":
             Product.update_description(product_id, form.description.data)
-            return redirect(url_for('inventory.inventory', page=1))
+            return redirect(url_for('inventory.inventory'))
         if form.price.data != None:
             Product.update_price(product_id, form.price.data)
-            return redirect(url_for('inventory.inventory', page=1))
+            return redirect(url_for('inventory.inventory'))
         if form.category.data != "":
             Product.update_category(product_id, form.category.data)
-            return redirect(url_for('inventory.inventory', page=1))
+            return redirect(url_for('inventory.inventory'))
         if form.restaurant.data != "":
             for restaurant in form.restaurant.data:
                 InventoryEntry.update_restaurant(current_user, product_id, restaurant)
-                return redirect(url_for('inventory.inventory', page=1))
+                return redirect(url_for('inventory.inventory'))
         if form.inventory.data != None:
             InventoryEntry.update_inventory(current_user, product_id, form.inventory.data)
-            return redirect(url_for('inventory.inventory', page=1))
+            return redirect(url_for('inventory.inventory'))
         if form.available.data != None:
             Product.update_availability(product_id, form.available.data)
-            return redirect(url_for('inventory.inventory', page=1))
+            return redirect(url_for('inventory.inventory'))
         else:
             return render_template('edit_product.html', form=form)
     return render_template('edit_product.html', form=form)
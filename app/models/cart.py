@@ -3,8 +3,14 @@ from .product import Product
 from .purchase import Purchase
 from .product_in_cart import ProductInCart
 from .coupon import Coupon
+from .pagination import keyset, paginate
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
+
+# the columns a Cart is built from, in the order of its __init__ parameters
+CART_COLUMNS = 'id, user_id, is_current, time_purchased, is_fulfilled, coupon_applied, item_count, subtotal, ' \
+               'total_price, discount'
+ORDER_TOTALS_BATCH_SIZE = 1000
 
 """
 This class represents a user's cart. Each user has one current cart and the rest of their carts are past orders
@@ -20,7 +26,11 @@ class Cart:
             is_current: bool,
             time_purchased: Optional[datetime] = None,
             is_fulfilled: Optional[bool] = False,
-            coupon_applied: Optional[str] = None
+            coupon_applied: Optional[str] = None,
+            item_count: int = 0,
+            subtotal: float = 0,
+            total_price: Optional[float] = None,
+            discount: Optional[float] = None
     ):
         self.id = id
         self.user_id = user_id
@@ -28,64 +38,74 @@ class Cart:
         self.time_purchased = time_purchased
         self.is_fulfilled = is_fulfilled
         self.coupon_applied = coupon_applied
-        self.number_of_items = 0
+        # kept up to date by the ProductInCart methods that change the cart's lines
+        self.item_count = item_count
+        self.subtotal = subtotal
+        # set by Checkout.order_cart when the cart is purchased (see migration 0007)
+        self.total_price = total_price
+        self.discount = discount
 
     """
-    Get a list of the products currently in a user's cart 
+    Get a list of the products currently in a user's cart. With paginated set, only the page of products the cursor
+    points to is returned (see pagination.py)
     """
-    def get_products_in_cart(self, page_num: Optional[int]=None) -> Optional[List[ProductInCart]]:
+    def get_products_in_cart(self, paginated: bool = False, cursor: Optional[str] = None) -> Optional[List[ProductInCart]]:
+        condition, order_by, params = keyset(['product_id', 'id'], cursor)
         query_string = """
             SELECT id, product_id, seller_id, quantity
             FROM ProductInCart
             WHERE cart_id = :cart_id
             ORDER BY product_id
             """
-        if page_num:
+        if paginated:
             query_string = """
             SELECT id, product_id, seller_id, quantity
             FROM ProductInCart
             WHERE cart_id = :cart_id
-            ORDER BY product_id
-            LIMIT 20
-            OFFSET ((:page_num - 1) * 20)
+            AND """ + condition + """
+            ORDER BY """ + order_by + """
+            LIMIT :page_limit
             """
 
         rows = app.db.execute(
             query_string,
             cart_id=self.id,
-            page_num=page_num
+            **params
         )
 
-        products_in_cart = []
-        for product_in_cart_row in rows:
-            products_in_cart.append(
-                ProductInCart(
-                    id=product_in_cart_row[0],
-                    product=Product.get(product_in_cart_row[1]),
-                    cart_id=self.id,
-                    seller_id=product_in_cart_row[2],
-                    quantity=product_in_cart_row[3]
-                ))
-            self.number_of_items += product_in_cart_row[3]
-        return products_in_cart
+        products = Product.get_many([row[1] for row in rows])
+
+        def build(product_in_cart_row):
+            return ProductInCart(
+                id=product_in_cart_row[0],
+                product=products.get(product_in_cart_row[1]),
+                cart_id=self.id,
+                seller_id=product_in_cart_row[2],
+                quantity=product_in_cart_row[3]
+            )
+
+        if paginated:
+            return paginate(rows, cursor, key=lambda row: (row[1], row[0]), build=build)
+        return [build(product_in_cart_row) for product_in_cart_row in rows]
 
     """
     Get a list of the purchases in a user's cart. This method is only applicable if the cart has been purchased and 
     is not the user's current cart
     """
-    def get_purchases(self, page_num: Optional[int]=None) -> Optional[List[Purchase]]:
-        purchases = Purchase.get_by_cart(self.id, page_num)
+    def get_purchases(self, paginated: bool = False, cursor: Optional[str] = None) -> Optional[List[Purchase]]:
+        purchases = Purchase.get_by_cart(self.id, paginated, cursor)
         return purchases
 
     """
-    Returns the current price of the cart based on the price at this moment of the products in the cart.
+    Returns the current price of the cart based on the price at this moment of the products in the cart, i.e. its
+    subtotal less the coupon's discount on one unit of its product.
     Not meant to return the "final" price that was actually paid for a cart
     """
-    def get_total_current_price(self, coupon: Optional[Coupon]) -> int:
-        total_price = 0
-        for product_in_cart in self.get_products_in_cart():
-            total_price += product_in_cart.get_total_price_to_pay(coupon)
-        return total_price
+    def get_total_current_price(self, coupon: Optional[Coupon]) -> float:
+        total_price = float(self.subtotal)
+        if coupon and self.is_product_by_seller_in_cart(coupon.product_id, coupon.seller_id):
+            total_price -= float(Product.get(coupon.product_id).price) * (coupon.percent_off / 100)
+        return round(total_price, 2)
 
     """
     Changes a current cart to a purchased cart
@@ -156,7 +176,7 @@ class Cart:
     def get_cart_by_id(cart_id: Optional[int]) -> "Cart":
         rows = app.db.execute(
             """
-            SELECT id, user_id, is_current, time_purchased, is_fulfilled, coupon_applied
+            SELECT """ + CART_COLUMNS + """
             FROM Cart
             WHERE id = :cart_id
             """,
@@ -171,7 +191,7 @@ class Cart:
     def get_current_cart(user_id: int) -> "Cart":
         rows = app.db.execute(
             """
-            SELECT id, user_id, is_current, time_purchased, is_fulfilled, coupon_applied
+            SELECT """ + CART_COLUMNS + """
             FROM Cart
             WHERE user_id = :user_id
             AND is_current
@@ -180,20 +200,11 @@ class Cart:
         )
         if not rows:  # no cart found for user
             print('no cart for user')
-            cart_id = Cart.create_new_cart(user_id)
-            coupon_applied = None
+            current_cart = Cart(id=Cart.create_new_cart(user_id), user_id=user_id, is_current=True)
         else:
-            cart_id = rows[0][0]
-            coupon_applied = rows[0][5]
+            current_cart = Cart(*(rows[0]))
 
-        current_cart = Cart(
-            id=cart_id,
-            user_id=user_id,
-            is_current=True,
-            coupon_applied=coupon_applied
-        )
-
-        coupon = Coupon.get(coupon_applied)
+        coupon = Coupon.get(current_cart.coupon_applied)
         if coupon and (coupon.expiration_date < datetime.now() or not current_cart.is_product_by_seller_in_cart(
                 coupon.product_id, coupon.seller_id
         )):
@@ -244,25 +255,111 @@ class Cart:
         return rows[0][0]
 
     """
-    Gets all purchased carts for a user
+    Gets one page (see pagination.py) of the purchased carts of a user, most recent first
+    """
+    @staticmethod
+    def get_purchased_carts(user_id: int, cursor: Optional[str] = None) -> List[Optional['Cart']]:
+        return Cart.get_filtered_purchased_carts(user_id, cursor=cursor)
+
+    """
+    Gets one page (see pagination.py) of the purchased carts of a user, most recent first, keeping only the fulfilled
+    (fulfilled=True) or unfulfilled (fulfilled=False) ones and/or the ones purchased in the last purchased_within_days
+    days. The filters are applied in the query before the page is cut, so every page but the last is full
     """
     @staticmethod
-    def get_purchased_carts(user_id: int, page_num: int) -> List[Optional['Cart']]:
+    def get_filtered_purchased_carts(
+            user_id: int,
+            fulfilled: Optional[bool] = None,
+            purchased_within_days: Optional[int] = None,
+            cursor: Optional[str] = None
+    ) -> List[Optional['Cart']]:
+        condition, order_by, params = keyset(['time_purchased', 'id'], cursor, descending=True,
+                                             types=[datetime, int])
+        filters = ''
+        if fulfilled is not None:
+            filters += ' AND is_fulfilled = :fulfilled'
+            params['fulfilled'] = fulfilled
+        if purchased_within_days is not None:
+            filters += ' AND time_purchased >= :purchased_since'
+            params['purchased_since'] = datetime.now() - timedelta(days=purchased_within_days)
+
         rows = app.db.execute(
             """
-            SELECT id, user_id, is_current, time_purchased, is_fulfilled, coupon_applied
+            SELECT """ + CART_COLUMNS + """
             FROM Cart
             WHERE user_id = :user_id
-            AND NOT is_current
-            ORDER BY time_purchased DESC, id DESC
-            LIMIT 20
-            OFFSET ((:page_num - 1) * 20)
+            AND NOT is_current""" + filters + """
+            AND """ + condition + """
+            ORDER BY """ + order_by + """
+            LIMIT :page_limit
             """,
             user_id=user_id,
-            page_num=page_num
+            **params
         )
 
-        return [Cart(*row) for row in rows] if rows else []
+        return paginate(rows, cursor, key=lambda row: (row[3], row[0]), build=lambda row: Cart(*row))
+
+    """
+    Totals up to batch_size of the purchased carts that have no total yet (those bought before migration 0007) from
+    their purchases, the same way Checkout.order_cart totals a cart being bought, and returns how many it totalled.
+    Carts locked by another transaction are skipped, to be totalled in a later batch
+    """
+    @staticmethod
+    def backfill_order_totals(batch_size: int = ORDER_TOTALS_BATCH_SIZE) -> int:
+        return app.db.execute(
+            """
+            WITH batch AS (
+                SELECT id, coupon_applied
+                FROM Cart
+                WHERE NOT is_current
+                AND total_price IS NULL
+                ORDER BY id
+                LIMIT :batch_size
+                FOR UPDATE SKIP LOCKED
+            ), line AS (
+                SELECT batch.id AS cart_id, ProductInCart.quantity, Purchase.final_unit_price,
+                       Purchase.final_unit_price * coupon.percent_off / 100.0 AS discount
+                FROM batch
+                JOIN Purchase ON Purchase.cart_id = batch.id
+                JOIN ProductInCart ON ProductInCart.id = Purchase.product_in_cart_id
+                LEFT JOIN LATERAL (
+                    SELECT percent_off
+                    FROM Coupon
+                    WHERE code = batch.coupon_applied
+                    AND product_id = ProductInCart.product_id
+                    AND seller_id = ProductInCart.seller_id
+                    UNION ALL
+                    SELECT percent_off
+                    FROM CouponArchive
+                    WHERE code = batch.coupon_applied
+                    AND product_id = ProductInCart.product_id
+                    AND seller_id = ProductInCart.seller_id
+                    LIMIT 1
+                ) AS coupon ON TRUE
+            ), totals AS (
+                SELECT batch.id AS cart_id,
+                       COALESCE(SUM(line.quantity), 0) AS item_count,
+                       COALESCE(SUM(line.quantity * line.final_unit_price), 0) AS subtotal,
+                       COALESCE(SUM(ROUND(line.quantity * line.final_unit_price - COALESCE(line.discount, 0), 2)), 0)
+                           AS total_price
+                FROM batch
+                LEFT JOIN line ON line.cart_id = batch.id
+                GROUP BY batch.id
+            ), totalled AS (
+                UPDATE Cart
+                SET item_count = totals.item_count,
+                    subtotal = totals.subtotal,
+                    total_price = totals.total_price,
+                    discount = totals.subtotal - totals.total_price
+                FROM totals
+                WHERE Cart.id = totals.cart_id
+                RETURNING Cart.id
+            )
+            SELECT COUNT(*)
+            FROM totalled
+            """,
+            batch_size=batch_size
+        )[0][0]
 
     # #Gets the number of products in a cart
     # def get_num_of_items(self) -> Optional[int]:
@@ -0,0 +1,243 @@
+from flask import current_app as app
+from sqlalchemy.exc import DBAPIError
+from typing import Optional
+from datetime import datetime
+import random
+import time
+
+from .cart import Cart
+from ..errors import EMPTY_CART, NOT_ENOUGH_INVENTORY, NOT_ENOUGH_MONEY
+
+"""
+This class converts a user's current cart into a purchase. Every step works on the whole cart at once, so checking out
+issues the same number of statements whether the cart holds one product or seventy.
+
+Concurrent checkouts of the same products are made safe by locking the affected Sells and Users rows up front, always in
+the same order (Sells by seller then product, then Users by id) so two checkouts can never wait on each other in a
+cycle. A checkout that still fails with a serialization failure or deadlock (e.g. when CHECKOUT_ISOLATION_LEVEL is
+SERIALIZABLE) is retried from scratch a bounded number of times
+"""
+
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 0.05
+RETRYABLE_SQLSTATES = {'40001', '40P01'}  # serialization_failure, deadlock_detected
+ISOLATION_LEVELS = {'READ COMMITTED', 'REPEATABLE READ', 'SERIALIZABLE'}
+
+
+class Checkout:
+
+    """
+    Purchases the given cart by:
+        1) marking the cart purchased (which also stops the same cart from being checked out twice at once)
+        2) loading every line of the cart with its current price and applicable coupon
+        3) locking the Sells rows of those lines and the Users rows of the buyer and sellers
+        4) subtracting the purchased quantities from the sellers' inventories, but only where enough is left
+        5) subtracting the total from the buyer's balance, but only if they have enough money
+        6) adding each seller's share to their balance
+        7) adding every line to purchases
+        8) storing the order's item count, subtotal, discount and total on the cart
+        9) announcing the order to its sellers' open incoming orders pages (see app/order_feed.py)
+        10) creating a new current cart for the user
+    Whatever the request did before is committed first, so the checkout is a transaction of its own that can be rolled
+    back, or retried with a fresh snapshot (re-reading the cart, and including the commit), on its own. Returns None on success, otherwise the message explaining why
+    the cart could not be purchased
+    """
+    @staticmethod
+    def order_cart(cart: Cart) -> Optional[str]:
+        if not cart.item_count:  # nothing to load, lock or charge
+            return EMPTY_CART
+        app.db.commit()
+
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                Checkout._set_isolation_level()
+                # every attempt works from the cart as it is in its own snapshot, e.g. with the coupon now applied
+                current_cart = Cart.get_cart_by_id(cart.id)
+                if current_cart is None or not current_cart.is_current or not current_cart.item_count:
+                    error = EMPTY_CART
+                else:
+                    error = Checkout._purchase(current_cart)
+
+                if error:
+                    app.db.rollback()
+                else:
+                    app.db.commit()  # under SERIALIZABLE, serialization failures are often only raised here
+            except DBAPIError as e:
+                app.db.rollback()
+                if attempt == MAX_ATTEMPTS or getattr(e.orig, 'pgcode', None) not in RETRYABLE_SQLSTATES:
+                    raise
+                time.sleep(RETRY_BACKOFF_SECONDS * attempt * (1 + random.random()))
+                continue
+
+            return error
+
+    """
+    Sets the isolation level of the checkout transaction from the CHECKOUT_ISOLATION_LEVEL setting. This has to be the
+    first statement of the transaction
+    """
+    @staticmethod
+    def _set_isolation_level():
+        isolation_level = app.config.get('CHECKOUT_ISOLATION_LEVEL', 'READ COMMITTED').upper()
+        if isolation_level not in ISOLATION_LEVELS:
+            raise ValueError('Unsupported CHECKOUT_ISOLATION_LEVEL: ' + isolation_level)
+        app.db.execute_with_no_return('SET TRANSACTION ISOLATION LEVEL ' + isolation_level)
+
+    @staticmethod
+    def _purchase(cart: Cart) -> Optional[str]:
+        claimed = app.db.execute(
+            """
+            UPDATE Cart
+            SET is_current = False, time_purchased = :time_purchased
+            WHERE id = :cart_id
+            AND is_current
+            RETURNING id
+            """,
+            time_purchased=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            cart_id=cart.id
+        )
+        if not claimed:  # already purchased by another request
+            return EMPTY_CART
+
+        lines = app.db.execute(
+            """
+            SELECT ProductInCart.id, ProductInCart.product_id, ProductInCart.seller_id, ProductInCart.quantity,
+                   Product.price, Coupon.percent_off
+            FROM ProductInCart
+            JOIN Product ON Product.id = ProductInCart.product_id
+            LEFT JOIN Coupon ON Coupon.code = :coupon_code
+                AND Coupon.product_id = ProductInCart.product_id
+                AND Coupon.seller_id = ProductInCart.seller_id
+            WHERE ProductInCart.cart_id = :cart_id
+            ORDER BY ProductInCart.seller_id, ProductInCart.product_id
+            """,
+            coupon_code=cart.coupon_applied,
+            cart_id=cart.id
+        )
+        if not lines:
+            return EMPTY_CART
+
+        quantities = {}  # (seller_id, product_id) -> quantity, merging any repeated lines
+        seller_credits = {}  # seller_id -> amount
+        purchases = []
+        item_count = 0
+        subtotal = 0
+        total_price = 0
+        for product_in_cart_id, product_id, seller_id, quantity, price, percent_off in lines:
+            discount = float(price) * (percent_off / 100) if percent_off else 0
+            line_price = round((float(price) * quantity) - discount, 2)
+
+            quantities[(seller_id, product_id)] = quantities.get((seller_id, product_id), 0) + quantity
+            seller_credits[seller_id] = seller_credits.get(seller_id, 0) + line_price
+            purchases.append((product_in_cart_id, cart.user_id, cart.id, price, seller_id))
+            item_count += quantity
+            subtotal += float(price) * quantity
+            total_price += line_price
+
+        Checkout._lock_rows(list(quantities), [cart.user_id] + list(seller_credits))
+
+        # take from seller inventory; rows without enough inventory are left untouched and not returned
+        values, params = app.db.values('line', [key + (quantity,) for key, quantity in quantities.items()])
+        decremented = app.db.execute(
+            """
+            UPDATE Sells
+            SET inventory = Sells.inventory - line.quantity
+            FROM (VALUES """ + values + """) AS line(seller_id, product_id, quantity)
+            WHERE Sells.seller_id = line.seller_id
+            AND Sells.product_id = line.product_id
+            AND Sells.inventory >= line.quantity
+            RETURNING Sells.seller_id, Sells.product_id
+            """,
+            **params
+        )
+        if len(decremented) < len(quantities):
+            short_seller_id, short_product_id = next(
+                key for key in quantities if key not in {tuple(row) for row in decremented})
+            return NOT_ENOUGH_INVENTORY.format(short_product_id)
+
+        # take from buyer balance
+        debited = app.db.execute(
+            """
+            UPDATE Users
+            SET balance = balance - :total_price
+            WHERE id = :user_id
+            AND balance >= :total_price
+            RETURNING balance
+            """,
+            total_price=round(total_price, 2),
+            user_id=cart.user_id
+        )
+        if not debited:
+            return NOT_ENOUGH_MONEY
+
+        # add to seller balances
+        values, params = app.db.values('credit', list(seller_credits.items()))
+        app.db.execute_with_no_return(
+            """
+            UPDATE Users
+            SET balance = Users.balance + credit.amount
+            FROM (VALUES """ + values + """) AS credit(seller_id, amount)
+            WHERE Users.id = credit.seller_id
+            """,
+            **params
+        )
+        app.cache.invalidate('user', cart.user_id, *seller_credits)
+
+        # add purchases for user
+        values, params = app.db.values('purchase', purchases)
+        app.db.execute_with_no_return(
+            """
+            INSERT INTO Purchase(product_in_cart_id, user_id, cart_id, final_unit_price, seller_id)
+            VALUES """ + values,
+            **params
+        )
+
+        # keep the order's totals for the order history (see migration 0007)
+        app.db.execute_with_no_return(
+            """
+            UPDATE Cart
+            SET item_count = :item_count, subtotal = :subtotal, total_price = :total_price, discount = :discount
+            WHERE id = :cart_id
+            """,
+            item_count=item_count,
+            subtotal=round(subtotal, 2),
+            total_price=round(total_price, 2),
+            discount=round(subtotal - total_price, 2),
+            cart_id=cart.id
+        )
+
+        # tell the sellers watching their incoming orders, once this commits
+        app.order_feed.publish(list(seller_credits), cart.id)
+
+        Cart.create_new_cart(cart.user_id)
+        return None
+
+    """
+    Locks the Sells rows being bought from and the Users rows whose balances change, in a fixed order (Sells by
+    seller then product, then Users by id) that every checkout follows, so that concurrent checkouts queue up behind
+    each other instead of deadlocking
+    """
+    @staticmethod
+    def _lock_rows(sells_keys, user_ids):
+        values, params = app.db.values('sells', sorted(sells_keys))
+        app.db.execute(
+            """
+            SELECT Sells.seller_id, Sells.product_id
+            FROM Sells
+            JOIN (VALUES """ + values + """) AS line(seller_id, product_id)
+            ON Sells.seller_id = line.seller_id
+            AND Sells.product_id = line.product_id
+            ORDER BY Sells.seller_id, Sells.product_id
+            FOR UPDATE OF Sells
+            """,
+            **params
+        )
+        app.db.execute(
+            """
+            SELECT id
+            FROM Users
+            WHERE id = ANY(:user_ids)
+            ORDER BY id
+            FOR UPDATE
+            """,
+            user_ids=sorted(set(user_ids))
+        )
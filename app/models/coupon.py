@@ -1,13 +1,26 @@
 from datetime import datetime
 from flask import current_app as app
-import string
+from typing import Optional
 import random
 import datetime
 from .product import Product
 from .user import User
+from . import metadata_cache
 
-letters = string.ascii_lowercase
 PERCENT_OFF = 50  # currently a constant half off, but could change in the future
+COUPON_LIFETIME = datetime.timedelta(days=7)
+MAX_COUPONS_PER_BATCH = 10000
+COUPON_POOL_SIZE = 500  # how many valid coupons get_random_coupon picks from
+COUPON_POOL_TTL_SECONDS = 60
+
+COUPON_COLUMNS = "Coupon.code, Coupon.expiration_date, Coupon.product_id, Coupon.seller_id, Coupon.percent_off"
+# the coupon columns plus the names of its product and seller, for queries FROM COUPON_WITH_NAMES
+COUPON_WITH_NAMES_COLUMNS = COUPON_COLUMNS + ", Product.name, Users.first_name || ' ' || Users.last_name"
+COUPON_WITH_NAMES = """
+Coupon
+JOIN Product ON Product.id = Coupon.product_id
+JOIN Users ON Users.id = Coupon.seller_id
+"""
 
 """
 This class represents a coupon that a user may use to get some percent off a specific product from a specific seller
@@ -24,6 +37,8 @@ class Coupon:
             product_id: int,
             seller_id: int,
             percent_off: float,
+            product_name: Optional[str] = None,
+            seller_name: Optional[str] = None,
     ):
         self.code = code
         self.expiration_date = expiration_date
@@ -31,8 +46,22 @@ class Coupon:
         self.seller_id = seller_id
         self.percent_off = percent_off
 
-        self.product_name = self.get_product_name()
-        self.seller_name = self.get_seller_name()
+        # loaded along with the coupon when the query joins them in (see COUPON_WITH_NAMES), otherwise looked up the
+        # first time they are used
+        self._product_name = product_name
+        self._seller_name = seller_name
+
+    @property
+    def product_name(self):
+        if self._product_name is None:
+            self._product_name = self.get_product_name()
+        return self._product_name
+
+    @property
+    def seller_name(self):
+        if self._seller_name is None:
+            self._seller_name = self.get_seller_name()
+        return self._seller_name
 
     """
     Checks if the coupon has expired
@@ -53,13 +82,26 @@ class Coupon:
         seller = User.get(self.seller_id)
         return seller.first_name + " " + seller.last_name
 
+    """
+    Returns the coupon with the given code, from app.cache when it is in it. Expired coupons that have been archived
+    (see CouponMaintenance) are still found, so that purchased carts can show the coupon they used
+    """
     @staticmethod
     def get(code):
+        return app.cache.get('coupon', code, Coupon._load)
+
+    @staticmethod
+    def _load(code):
         rows = app.db.execute(
             """
-            SELECT code, expiration_date, product_id, seller_id, percent_off
+            SELECT """ + COUPON_COLUMNS + """
             FROM Coupon
             WHERE code = :code
+            UNION ALL
+            SELECT code, expiration_date, product_id, seller_id, percent_off
+            FROM CouponArchive
+            WHERE code = :code
+            LIMIT 1
             """,
             code=code
         )
@@ -74,10 +116,13 @@ class Coupon:
     def get_current_coupon_for_product_seller(product_id, seller_id):
         rows = app.db.execute(
             """
-            SELECT code, expiration_date, product_id, seller_id, percent_off
+            SELECT """ + COUPON_COLUMNS + """
             FROM Coupon
             WHERE expiration_date >= :now
             AND product_id = :product_id
+            AND seller_id = :seller_id
+            ORDER BY expiration_date DESC
+            LIMIT 1
             """,
             product_id=product_id,
             seller_id=seller_id,
@@ -88,42 +133,132 @@ class Coupon:
         return Coupon(*(rows[0]))
 
     """
-    Generates a new coupon for the specific product and seller. The expiration date is automatically set to 1 week in
-    the future and the discount is automatically set to 50% off. THis could be changed to be more flexible in 
-    the future
+    Gets the current valid coupon for each of the given (product_id, seller_id) pairs with one query, as a dict from
+    the pair to its coupon. Pairs without a valid coupon are left out. Each pair is one probe of
+    coupon_product_seller_expiration_index.
+    """
+    @staticmethod
+    def get_current_coupons_for_product_sellers(pairs):
+        pairs = list({(int(product_id), int(seller_id)) for product_id, seller_id in pairs})
+        if not pairs:
+            return {}
+        values, params = app.db.values('pair', pairs)
+        rows = app.db.execute(
+            """
+            SELECT """ + COUPON_COLUMNS + """
+            FROM (VALUES """ + values + """) AS pair(product_id, seller_id),
+            LATERAL (
+                SELECT *
+                FROM Coupon
+                WHERE Coupon.product_id = pair.product_id
+                AND Coupon.seller_id = pair.seller_id
+                AND Coupon.expiration_date >= :now
+                ORDER BY Coupon.expiration_date DESC
+                LIMIT 1
+            ) AS Coupon
+            """,
+            now=datetime.datetime.now(),
+            **params
+        )
+        return {(row[2], row[3]): Coupon(*row) for row in rows}
+
+    """
+    Generates a new coupon for the specific product and seller and returns its code. The expiration date is
+    automatically set to 1 week in the future and the discount is automatically set to 50% off. This could be changed
+    to be more flexible in the future
     """
     @staticmethod
     def generate_new_coupon(product_id, seller_id):
-        new_code = ''.join(random.choice(letters) for _ in range(random.randint(10, 12)))
-        while Coupon.get(new_code):
-            new_code = ''.join(random.choice(letters) for _ in range(random.randint(10, 12)))
-        expiration_date = datetime.datetime.now() + datetime.timedelta(days=7)
+        return Coupon.generate_new_coupons(product_id, seller_id, 1)[0]
 
-        app.db.execute_with_no_return(
+    """
+    Generates count new coupons for the specific product and seller with one statement (e.g. for a promotion) and
+    returns their codes. Each code comes from coupon_code(nextval('coupon_code_seq')) (see migration 0004), which never
+    repeats, so the codes do not need to be checked against the existing coupons first
+    """
+    @staticmethod
+    def generate_new_coupons(product_id, seller_id, count):
+        rows = app.db.execute(
             """
-            INSERT INTO Coupon
-            VALUES (:code, :expiration_date, :product_id, :seller_id, :percent_off)
+            INSERT INTO Coupon(code, expiration_date, product_id, seller_id, percent_off)
+            SELECT coupon_code(nextval('coupon_code_seq')), :expiration_date, :product_id, :seller_id, :percent_off
+            FROM generate_series(1, :count)
+            RETURNING code
             """,
-            code=new_code,
-            expiration_date=expiration_date,
+            expiration_date=datetime.datetime.now() + COUPON_LIFETIME,
             product_id=product_id,
             seller_id=seller_id,
-            percent_off=PERCENT_OFF
+            percent_off=PERCENT_OFF,
+            count=count
         )
+        return [row[0] for row in rows]
 
     """
-    Returns a random coupon from all valid coupons
+    Returns a random valid coupon. Rather than fetching every valid coupon on each call, it picks from a pool of up to
+    COUPON_POOL_SIZE valid coupon codes that is sampled from the table at most once per COUPON_POOL_TTL_SECONDS, and
+    then loads just the picked coupon
     """
     @staticmethod
     def get_random_coupon():
+        now = datetime.datetime.now()
+        pool = metadata_cache.cached((metadata_cache.COUPON_POOL,), Coupon._sample_valid_codes, COUPON_POOL_TTL_SECONDS)
+        candidates = [code for code, expiration_date in pool if expiration_date >= now]
+        while candidates:
+            code = random.choice(candidates)
+            rows = app.db.execute(
+                """
+                SELECT """ + COUPON_WITH_NAMES_COLUMNS + """
+                FROM """ + COUPON_WITH_NAMES + """
+                WHERE Coupon.code = :code
+                AND Coupon.expiration_date >= :now
+                """,
+                code=code,
+                now=now
+            )
+            if rows:
+                return Coupon(*(rows[0]))
+            candidates.remove(code)  # deleted since the pool was sampled
+        return None  # coupon not found
+
+    """
+    Samples the (code, expiration_date) of up to COUPON_POOL_SIZE valid coupons. TABLESAMPLE reads only a few random
+    pages of the table, sized from the planner's row count estimate (summed over the partitions of Coupon) so that
+    enough valid coupons turn up; when it finds none (e.g. a small table that is mostly expired), the valid coupons are
+    read directly instead
+    """
+    @staticmethod
+    def _sample_valid_codes():
+        now = datetime.datetime.now()
+        estimate = app.db.execute(
+            """
+            SELECT COALESCE(SUM(GREATEST(reltuples, 0)), 0)
+            FROM pg_class
+            WHERE oid = 'coupon'::regclass
+            OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = 'coupon'::regclass)
+            """
+        )[0][0]
+        percent = min(100.0, 100.0 * COUPON_POOL_SIZE * 4 / max(estimate, 1))
         rows = app.db.execute(
             """
-            SELECT code, expiration_date, product_id, seller_id, percent_off
-            FROM Coupon
+            SELECT code, expiration_date
+            FROM Coupon TABLESAMPLE SYSTEM (CAST(:percent AS REAL))
             WHERE expiration_date >= :now
+            ORDER BY random()
+            LIMIT :pool_size
             """,
-            now=datetime.datetime.now()
+            percent=percent,
+            now=now,
+            pool_size=COUPON_POOL_SIZE
         )
-        if not rows:  # coupon not found
-            return None
-        return Coupon(*(random.choice(rows)))
+        if not rows and percent < 100:
+            rows = app.db.execute(
+                """
+                SELECT code, expiration_date
+                FROM Coupon
+                WHERE expiration_date >= :now
+                LIMIT :pool_size
+                """,
+                now=now,
+                pool_size=COUPON_POOL_SIZE
+            )
+        return [tuple(row) for row in rows]
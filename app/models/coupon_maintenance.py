@@ -0,0 +1,90 @@
+from flask import current_app as app
+import datetime
+
+PARTITION_MONTHS_AHEAD = 3  # how many months past the current one to have Coupon partitions ready for
+ARCHIVE_BATCH_SIZE = 5000
+
+"""
+This class holds the periodic upkeep of the Coupon table (see migration 0003), run by reap_coupons.py: creating the
+monthly partitions coupons will go to before they are needed, moving expired coupons to CouponArchive in small batches
+so that no statement holds its locks for long, and dropping the partitions of past months once they are empty
+"""
+
+
+class CouponMaintenance:
+
+    """
+    Makes sure Coupon has a partition for the current month and each of the next months_ahead months
+    """
+    @staticmethod
+    def ensure_partitions(months_ahead=PARTITION_MONTHS_AHEAD):
+        app.db.execute(
+            """
+            SELECT ensure_coupon_partition(month_start::date)
+            FROM generate_series(date_trunc('month', now()),
+                                 date_trunc('month', now()) + :months_ahead * interval '1 month',
+                                 interval '1 month') AS month_start
+            """,
+            months_ahead=months_ahead
+        )
+
+    """
+    Moves up to batch_size of the coupons that have expired to CouponArchive, oldest first, and returns how many it
+    moved. Coupons locked by another transaction are skipped, to be moved in a later batch
+    """
+    @staticmethod
+    def archive_expired(batch_size=ARCHIVE_BATCH_SIZE):
+        return app.db.execute(
+            """
+            WITH expired AS (
+                SELECT code, expiration_date
+                FROM Coupon
+                WHERE expiration_date < :now
+                ORDER BY expiration_date
+                LIMIT :batch_size
+                FOR UPDATE SKIP LOCKED
+            ), moved AS (
+                DELETE FROM Coupon
+                USING expired
+                WHERE Coupon.code = expired.code
+                AND Coupon.expiration_date = expired.expiration_date
+                RETURNING Coupon.code, Coupon.expiration_date, Coupon.product_id, Coupon.seller_id,
+                          Coupon.percent_off
+            ), archived AS (
+                INSERT INTO CouponArchive(code, expiration_date, product_id, seller_id, percent_off)
+                SELECT code, expiration_date, product_id, seller_id, percent_off
+                FROM moved
+                ON CONFLICT (code) DO NOTHING
+            )
+            SELECT COUNT(*)
+            FROM moved
+            """,
+            now=datetime.datetime.now(),
+            batch_size=batch_size
+        )[0][0]
+
+    """
+    Detaches and drops the partitions of months that have ended and no longer hold any coupons, returning their names
+    """
+    @staticmethod
+    def drop_empty_partitions():
+        rows = app.db.execute(
+            r"""
+            SELECT partition.relname
+            FROM pg_inherits
+            JOIN pg_class AS partition ON partition.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = 'coupon'::regclass
+            AND partition.relname ~ '^coupon_\d{4}_\d{2}$'
+            AND to_date(substr(partition.relname, 8), 'YYYY_MM') < date_trunc('month', now())
+            ORDER BY partition.relname
+            """
+        )
+        dropped = []
+        for (name,) in rows:
+            # names are checked against the pattern above, so they are safe to put into the statements
+            if app.db.execute('SELECT EXISTS (SELECT 1 FROM ' + name + ')')[0][0]:
+                continue
+            app.db.execute_with_no_return('ALTER TABLE Coupon DETACH PARTITION ' + name)
+            app.db.execute_with_no_return('DROP TABLE ' + name)
+            dropped.append(name)
+        return dropped
@@ -0,0 +1,22 @@
+from flask import g, has_app_context
+
+"""
+Per-request identity maps. Each entity type gets a dict, keyed by id, of the objects already loaded during the current
+request so that the same row is never fetched twice while rendering one page. The maps live on flask.g and are
+discarded with it; outside of an app context a fresh (throwaway) dict is returned.
+"""
+
+
+def identity_map(entity: str) -> dict:
+    if not has_app_context():
+        return {}
+    if 'identity_maps' not in g:
+        g.identity_maps = {}
+    return g.identity_maps.setdefault(entity, {})
+
+
+def forget(entity: str, id):
+    """
+    Drops an object from the current request's identity map after the underlying row has been changed
+    """
+    identity_map(entity).pop(id, None)
@@ -1,6 +1,8 @@
 from flask import current_app as app
 from typing import List
-from sqlalchemy import text
+
+from .pagination import keyset, paginate
+from . import metadata_cache
 
 
 class InventoryEntry:
@@ -31,10 +33,12 @@ class InventoryEntry:
 
 
     @staticmethod
-    def get_all_entries_by_seller(page_num, seller_id: int):
+    def get_all_entries_by_seller(cursor, seller_id: int):
         """
-        Created an inventory entry for units the seller is selling. Displays it as a table with rows. 
+        Created an inventory entry for units the seller is selling. Displays it as a table with rows, one page (see
+        pagination.py) at a time in product order.
         """
+        condition, order_by, params = keyset(['Sells.product_id'], cursor)
         rows = app.db.execute(
             """
             SELECT Sells.seller_affiliation, Sells.seller_id, Sells.product_id, Sells.inventory,
@@ -45,30 +49,15 @@ class InventoryEntry:
             FROM Sells JOIN Product ON Product.id=Sells.product_id
             WHERE seller_id = :seller_id
             AND Sells.is_available = true
-            LIMIT 20
-            OFFSET ((:page_num - 1) * 20)
+            AND """ + condition + """
+            ORDER BY """ + order_by + """
+            LIMIT :page_limit
             """,
             seller_id=seller_id,
-            page_num=page_num
+            **params
         )
 
-        return [InventoryEntry(
-                    seller_affiliation=seller_affiliation,
-                    seller_id=seller_id,
-                    product_id=product_id,
-                    inventory=inventory,
-                    name=name,
-                    category=category,
-                    price=price,
-                    is_available=is_available
-                ) for (seller_affiliation, 
-                       seller_id,
-                       product_id,
-                       inventory,
-                       name, 
-                       category, 
-                       price, 
-                       is_available) in rows]
+        return paginate(rows, cursor, key=lambda row: (row[2],), build=lambda row: InventoryEntry(*row))
 
     @staticmethod
     def add_product_to_inventory(current_seller, restaurant, product_id, inventory):
@@ -81,6 +70,7 @@ class InventoryEntry:
             seller_id=current_seller.id,
             product_id=product_id,
             inventory=inventory)
+        metadata_cache.invalidate(metadata_cache.CATEGORIES)
 
     @staticmethod
     def update_inventory(current_user, product_id, inventory):
@@ -175,6 +165,7 @@ class InventoryEntry:
             product_id=product_id,
             seller_id=seller_id
         )
+        metadata_cache.invalidate(metadata_cache.CATEGORIES)
 
     @staticmethod
     def get_amount_available(seller_id, product_id):
@@ -191,26 +182,3 @@ class InventoryEntry:
             seller_id=seller_id,
             product_id=product_id
         )[0][0]
-
-    
-    @staticmethod
-    def decrease_seller_inventory_without_commit(conn, product_id, seller_id, quantity):
-        """
-        This method is used to decrease seller inventory of a product without committing to allow 
-        for rollback when purchasing a cart
-        """
-        conn.execute(text(
-            """
-            UPDATE Sells
-            SET inventory = inventory - :quantity
-            WHERE seller_id = :seller_id
-            AND product_id = :product_id
-            """),
-            {
-                "product_id": product_id,
-                "seller_id": seller_id,
-                "quantity": quantity
-            },
-        )
-
-
@@ -0,0 +1,49 @@
+from flask import current_app as app
+import threading
+import time
+
+"""
+In-process cache for small catalog metadata that nearly every page renders but that rarely changes, such as the
+categories of the products on sale. Each entry is loaded at most once per CACHE_TTL_SECONDS per worker process.
+
+Writes that can change an entry call invalidate() with its kind, which drops the entry right away and again once the
+writing transaction has ended (see DB.after_transaction), so that a reload racing with the write cannot keep the old
+value. Other worker processes pick up the change when their copy expires.
+"""
+
+CACHE_TTL_SECONDS = 5 * 60
+
+# entry kinds; an entry's key is a tuple starting with its kind, followed by whatever else its value depends on
+CATEGORIES = 'categories'
+COUPON_POOL = 'coupon_pool'
+
+_entries = {}  # key -> (expires at, value)
+_lock = threading.Lock()
+
+
+def cached(key: tuple, load, ttl: float = CACHE_TTL_SECONDS):
+    """
+    Returns the cached value for key, calling load() to (re)fill the entry when it is missing or expired
+    """
+    now = time.monotonic()
+    entry = _entries.get(key)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    value = load()
+    with _lock:
+        _entries[key] = (now + ttl, value)
+    return value
+
+
+def invalidate(*kinds: str):
+    """
+    Drops every entry of the given kinds
+    """
+    def drop():
+        with _lock:
+            for key in [key for key in _entries if key[0] in kinds]:
+                del _entries[key]
+
+    drop()
+    app.db.after_transaction(drop)
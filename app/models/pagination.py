@@ -0,0 +1,138 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence
+
+"""
+Keyset (seek) pagination shared by every paged listing. Instead of skipping (page - 1) * PAGE_SIZE rows with OFFSET,
+which gets slower the deeper the page, a page is fetched by seeking directly past the sort key of the last row the user
+has seen, which an index on the sort columns answers in the same time for every page.
+
+The position in a listing travels between requests as an opaque cursor token (URL-safe base64 of the sort key and the
+direction to read in), passed around as the `cursor` query argument. A listing model method:
+    1) gets the SQL for its WHERE condition, ORDER BY and LIMIT from keyset() for its sort columns and the token
+    2) turns the rows it fetched into a Page with paginate(), which also works out the Next and Previous cursors
+The sort columns must identify a row uniquely (end them with the id) and all sort in the same direction. Their values
+travel as JSON, so keyset() is told the Python type of each (int, float or datetime; int unless said otherwise) to
+check and convert a token's values back to.
+"""
+
+PAGE_SIZE = 20
+
+
+class Cursor:
+    def __init__(self, key: Sequence, before: bool = False):
+        self.key = list(key)
+        self.before = before  # read the page that ends right before key instead of the one starting after it
+
+    def encode(self) -> str:
+        data = json.dumps([self.key, self.before], default=str, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode(token: Optional[str], types: Optional[Sequence[type]] = None) -> Optional['Cursor']:
+        """
+        Returns None (i.e. the first page) for a missing, damaged or tampered token. With types, the token must also
+        hold one value of each of those types (see _parse_value), which the returned key holds converted to them
+        """
+        if not token:
+            return None
+        try:
+            key, before = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        except (ValueError, TypeError, binascii.Error):
+            return None
+        if not isinstance(key, list) or not isinstance(before, bool):
+            return None
+        if types is not None:
+            if len(key) != len(types):  # e.g. a token from some other listing
+                return None
+            key = [_parse_value(value, expected) for value, expected in zip(key, types)]
+            if any(value is None for value in key):
+                return None
+        return Cursor(key, before)
+
+
+def _parse_value(value, expected: type):
+    """
+    Returns the value of a decoded cursor key converted to the expected type, or None if it is not one: ints must be
+    JSON integers, floats JSON numbers and datetimes the ISO strings encode() writes for them
+    """
+    if isinstance(value, bool):
+        return None
+    if expected is int:
+        return value if isinstance(value, int) else None
+    if expected is float:
+        return float(value) if isinstance(value, (int, float)) else None
+    if expected is datetime:
+        try:
+            return datetime.fromisoformat(value) if isinstance(value, str) else None
+        except ValueError:
+            return None
+    return value if isinstance(value, expected) else None
+
+
+class Page(list):
+    """
+    One page of a listing: a list of its items plus the cursor tokens of the neighbouring pages (None when there are
+    none) and the token this page was fetched with, so that links can come back to it
+    """
+    def __init__(self, items, cursor: Optional[str] = None, next_cursor: Optional[str] = None,
+                 prev_cursor: Optional[str] = None):
+        super().__init__(items)
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+def keyset(columns: List[str], token: Optional[str], descending: bool = False,
+           types: Optional[Sequence[type]] = None):
+    """
+    Returns the (condition, order_by, params) SQL pieces that select the page of a listing sorted on columns (whose
+    values have the given types, all int by default) that the cursor token points to, e.g.
+
+        condition, order_by, params = keyset(['price', 'id'], token, types=[float, int])
+        rows = app.db.execute('SELECT ... WHERE ... AND ' + condition + ' ORDER BY ' + order_by + ' LIMIT :page_limit',
+                              ..., **params)
+        return paginate(rows, token, key=lambda row: (row[4], row[0]), build=lambda row: Product(*row))
+    """
+    cursor = Cursor.decode(token, types or [int] * len(columns))
+
+    # reading backwards flips both the comparison and the sort order; paginate() puts the rows back in order
+    backwards = cursor is not None and cursor.before
+    reverse_order = descending != backwards
+    params = {'page_limit': PAGE_SIZE + 1}
+
+    condition = 'TRUE'
+    if cursor is not None:
+        placeholders = []
+        for i, value in enumerate(cursor.key):
+            params['cursor_{}'.format(i)] = value
+            placeholders.append(':cursor_{}'.format(i))
+        condition = '({}) {} ({})'.format(', '.join(columns), '<' if reverse_order else '>', ', '.join(placeholders))
+
+    order_by = ', '.join(column + (' DESC' if reverse_order else '') for column in columns)
+    return condition, order_by, params
+
+
+def paginate(rows, token: Optional[str], key: Callable, build: Callable = lambda row: row) -> Page:
+    """
+    Builds the Page for rows fetched with the SQL from keyset() (at most PAGE_SIZE + 1 of them): key(row) gives a row's
+    values of the sort columns and build(row) the item to list for it
+    """
+    # a token keyset() ignored holds values of other types than the rows' sort columns, and is ignored here too
+    cursor = Cursor.decode(token, [type(value) for value in key(rows[0])]) if rows else Cursor.decode(token)
+    backwards = cursor is not None and cursor.before
+    has_more = len(rows) > PAGE_SIZE
+    rows = list(rows[:PAGE_SIZE])
+    if backwards:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_more or backwards:
+            next_cursor = Cursor(key(rows[-1])).encode()
+        if (has_more and backwards) or (cursor is not None and not backwards):
+            prev_cursor = Cursor(key(rows[0]), before=True).encode()
+
+    return Page([build(row) for row in rows], cursor=token, next_cursor=next_cursor, prev_cursor=prev_cursor)
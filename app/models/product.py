@@ -1,6 +1,13 @@
 from flask import current_app as app
 import random
 
+from .identity_map import identity_map, forget
+from .pagination import keyset, paginate
+from . import metadata_cache
+
+# the on-campus venues products are sold at, by Sells.seller_affiliation
+SELLER_AFFILIATIONS = {1: 'Beyu Blue', 2: 'The Loop', 3: 'McDonalds', 4: 'Panda Express', 5: 'Il Forno', 6: 'Sazón'}
+
 class Product:
     def __init__(
             self,
@@ -24,29 +31,45 @@ class Product:
 
     @staticmethod
     def get(id):
+        return Product.get_many([id]).get(int(id))
+
+# method to load many products with one query; products already loaded during this request are not fetched again, and
+# the rest come from app.cache when they are in it
+    @staticmethod
+    def get_many(ids):
+        loaded = identity_map('product')
+        ids = [int(id) for id in ids]
+        missing = list({id for id in ids if id not in loaded})
+        if missing:
+            loaded.update(app.cache.get_many('product', missing, Product._load_many))
+        return {id: loaded[id] for id in ids if id in loaded}
+
+    @staticmethod
+    def _load_many(ids):
         rows = app.db.execute('''
 SELECT id, name, description, category, price, is_available, creator_id, image
 FROM Product
-WHERE id = :id
+WHERE id = ANY(:ids)
 ''',
-                              id=id)
-        return Product(*(rows[0])) if rows is not None else None
+                              ids=ids)
+        return {row[0]: Product(*row) for row in rows}
 
-# method to return products served by a specific on-campus resturant venue
+# method to return products served by a specific on-campus resturant venue, one page (see pagination.py) at a time
     @staticmethod
-    def get_specific(seller_affiliation, page_num):
+    def get_specific(seller_affiliation, cursor=None):
+        condition, order_by, params = keyset(['id'], cursor)
         rows = app.db.execute('''
 SELECT DISTINCT id, name, description, category, price, Sells.is_available, creator_id, image
 FROM Product
 RIGHT OUTER JOIN Sells ON Product.id=Sells.product_id
 WHERE seller_affiliation = :seller_affiliation AND Sells.is_available = True
-ORDER BY id
-LIMIT 20
-OFFSET ((:page_num - 1) * 20)
+AND ''' + condition + '''
+ORDER BY ''' + order_by + '''
+LIMIT :page_limit
 ''',
                                 seller_affiliation=seller_affiliation,
-                                page_num=page_num)
-        return [Product(*row) for row in rows] if rows is not None else None                 
+                                **params)
+        return paginate(rows, cursor, key=lambda row: (row[0],), build=lambda row: Product(*row))
 
 # method to return all available products
     @staticmethod
@@ -60,8 +83,15 @@ WHERE Sells.is_available = :is_available
                               is_available=is_available)
         return [Product(*row) for row in rows]
 
+# method to return the categories of the products on sale, from the metadata cache; writes that can change them
+# (adding a product, changing its category, a seller taking one off sale) invalidate it
     @staticmethod
     def get_categories(is_available=True):
+        return metadata_cache.cached((metadata_cache.CATEGORIES, is_available),
+                                     lambda: Product._load_categories(is_available))
+
+    @staticmethod
+    def _load_categories(is_available):
         rows = app.db.execute('''
 SELECT DISTINCT category
 FROM Product
@@ -71,82 +101,105 @@ WHERE Sells.is_available = :is_available
                                 is_available=is_available)
         return rows 
 
+# method to return the venue names by seller_affiliation
+    @staticmethod
+    def get_seller_affiliations():
+        return SELLER_AFFILIATIONS
+
 # method to return filtered view of venue products by category (entrées, beverages, etc.)
     @staticmethod
-    def filteredCat(seller_affiliation, category, page_num):
+    def filteredCat(seller_affiliation, category, cursor=None):
+        condition, order_by, params = keyset(['id'], cursor)
         rows = app.db.execute('''
 SELECT DISTINCT id, name, description, category, price, Sells.is_available, creator_id, image
 FROM Product
 RIGHT OUTER JOIN Sells ON Product.id=Sells.product_id
 WHERE seller_affiliation = :seller_affiliation AND Sells.is_available = True AND category = :category
-ORDER BY id
-LIMIT 20
-OFFSET ((:page_num - 1) * 20)
+AND ''' + condition + '''
+ORDER BY ''' + order_by + '''
+LIMIT :page_limit
 ''',
                               seller_affiliation=seller_affiliation,
                               category=category,
-                              page_num=page_num)
-        return [Product(*row) for row in rows]  
+                              **params)
+        return paginate(rows, cursor, key=lambda row: (row[0],), build=lambda row: Product(*row))
 
-# method to filter by price (ordered from lowest to highest)
+# method to filter by price (ordered from lowest to highest, ties by id)
     @staticmethod
-    def filteredPrice(seller_affiliation, page_num):
+    def filteredPrice(seller_affiliation, cursor=None):
+        condition, order_by, params = keyset(['price', 'id'], cursor, types=[float, int])
         rows = app.db.execute('''
 SELECT DISTINCT id, name, description, category, price, Sells.is_available, creator_id, image
 FROM Product RIGHT OUTER JOIN Sells ON Product.id=Sells.product_id
 WHERE seller_affiliation = :seller_affiliation AND Sells.is_available = True
-ORDER BY price ASC
-LIMIT 20
-OFFSET ((:page_num - 1) * 20)
+AND ''' + condition + '''
+ORDER BY ''' + order_by + '''
+LIMIT :page_limit
 ''',
                                 seller_affiliation=seller_affiliation,
-                                page_num=page_num)
-        return [Product(*row) for row in rows] 
+                                **params)
+        return paginate(rows, cursor, key=lambda row: (row[4], row[0]), build=lambda row: Product(*row))
 
 # method to return filtered view of venue products by their current average rating
     @staticmethod
-    def filteredRating(stars, page_num):
+    def filteredRating(stars, cursor=None):
+        condition, order_by, params = keyset(['id'], cursor)
         rows = app.db.execute('''
 SELECT DISTINCT id, name, description, category, price, is_available, creator_id, image
 FROM Product FULL OUTER JOIN Feedback ON Product.id = Feedback.product_id
+WHERE ''' + condition + '''
 GROUP BY id
 HAVING AVG(rating) >= :stars
-ORDER BY id
-LIMIT 20
-OFFSET ((:page_num - 1) * 20)
+ORDER BY ''' + order_by + '''
+LIMIT :page_limit
 ''',
                             stars=stars,
-                            page_num=page_num)
-        return [Product(*row) for row in rows] 
+                            **params)
+        return paginate(rows, cursor, key=lambda row: (row[0],), build=lambda row: Product(*row))
 
-# method to return filtered view of venue products by search query
+# method to return products matching a search query, most relevant first. A product matches if its name or description
+# contains the words searched for (full-text search), if its name contains the query as typed, or if its name contains a
+# word similar to the query (trigram similarity, which tolerates typos and unfinished words). All three are answered
+# from the GIN indexes on Product instead of by scanning the table. relevance is a float8 (both scores are float4) so
+# that its value in a cursor, which goes through a Python float, compares exactly equal to the one in the table
     @staticmethod
-    def search_filter(search, page_num):
+    def search_filter(search, cursor=None):
+        condition, order_by, params = keyset(['relevance', 'id'], cursor, descending=True, types=[float, int])
         rows = app.db.execute('''
-SELECT DISTINCT id, name, description, category, price, is_available, creator_id, image
-FROM Product
-WHERE LOWER(name) LIKE '%' || :search || '%' OR UPPER(name) LIKE '%' || :search || '%' OR name LIKE '%' || :search || '%'
-LIMIT 20
-OFFSET ((:page_num - 1) * 20)
+SELECT id, name, description, category, price, is_available, creator_id, image, relevance
+FROM (
+    SELECT id, name, description, category, price, is_available, creator_id, image,
+           ts_rank(search_vector, query)::float8 + word_similarity(:search, name)::float8 AS relevance
+    FROM Product, websearch_to_tsquery('english', :search) AS query
+    WHERE search_vector @@ query
+    OR name ILIKE '%' || :pattern || '%'
+    OR :search <% name
+) AS matches
+WHERE ''' + condition + '''
+ORDER BY ''' + order_by + '''
+LIMIT :page_limit
 ''',
                             search=search,
-                            page_num=page_num)
-        return [Product(*row) for row in rows] 
+                            pattern=search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'),
+                            **params)
+        return paginate(rows, cursor, key=lambda row: (row[8], row[0]), build=lambda row: Product(*row[:8]))
 
     @staticmethod
-    def search_id(id, page_num):
+    def search_id(id, cursor=None):
+        condition, order_by, params = keyset(['id'], cursor)
         rows = app.db.execute('''
 SELECT DISTINCT id, name, description, category, price, Sells.is_available, creator_id, image
 FROM Product
 RIGHT OUTER JOIN Sells ON Product.id=Sells.product_id
 WHERE id = :id
 AND Sells.is_available = true
-LIMIT 20
-OFFSET ((:page_num - 1) * 20)
+AND ''' + condition + '''
+ORDER BY ''' + order_by + '''
+LIMIT :page_limit
 ''',
                             id=id,
-                            page_num=page_num)
-        return [Product(*row) for row in rows] 
+                            **params)
+        return paginate(rows, cursor, key=lambda row: (row[0],), build=lambda row: Product(*row))
 
     @staticmethod
     def add_product(name, description, price, category, image, current_user):
@@ -164,6 +217,7 @@ RETURNING id
         is_available=True
         )
         id = rows[0][0]
+        metadata_cache.invalidate(metadata_cache.CATEGORIES)
         return id
 
     @staticmethod
@@ -175,6 +229,8 @@ WHERE id = :product_id
         ''',
             name=name,
             product_id=product_id)
+        forget('product', int(product_id))
+        app.cache.invalidate('product', int(product_id))
 
     @staticmethod
     def update_description(product_id, description):
@@ -185,9 +241,27 @@ WHERE id = :product_id
         ''',
             description=description,
             product_id=product_id)
+        forget('product', int(product_id))
+        app.cache.invalidate('product', int(product_id))
 
     @staticmethod
     def update_price(product_id, price):
+        # reprice the units of the product in current carts, whose subtotals are at the products' current prices
+        app.db.execute_with_no_return('''
+UPDATE Cart
+SET subtotal = Cart.subtotal + changed.quantity * (:price - Product.price)
+FROM (
+    SELECT cart_id, SUM(quantity) AS quantity
+    FROM ProductInCart
+    WHERE product_id = :product_id
+    GROUP BY cart_id
+) AS changed, Product
+WHERE Cart.id = changed.cart_id
+AND Cart.is_current
+AND Product.id = :product_id
+        ''',
+            price=price,
+            product_id=product_id)
         rows = app.db.execute_with_no_return('''
 UPDATE Product
 SET price = :price
@@ -195,6 +269,8 @@ WHERE id = :product_id
         ''',
             price=price,
             product_id=product_id)
+        forget('product', int(product_id))
+        app.cache.invalidate('product', int(product_id))
 
     @staticmethod
     def update_category(product_id, category):
@@ -205,6 +281,9 @@ WHERE id = :product_id
         ''',
             category=category,
             product_id=product_id)
+        forget('product', int(product_id))
+        app.cache.invalidate('product', int(product_id))
+        metadata_cache.invalidate(metadata_cache.CATEGORIES)
 
     @staticmethod
     def update_availability(product_id, available):
@@ -215,5 +294,7 @@ WHERE id = :product_id
         ''',
             available=available,
             product_id=product_id)
+        forget('product', int(product_id))
+        app.cache.invalidate('product', int(product_id))
         
         
\ No newline at end of file
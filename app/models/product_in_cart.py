@@ -1,6 +1,6 @@
 from flask import current_app as app
+from typing import Optional
 from .product import Product
-from .inventory import InventoryEntry
 
 """
 This class represents a product in a user's cart with the unique attributes such a product would have, such as quantity
@@ -9,6 +9,17 @@ This class represents a product in a user's cart with the unique attributes such
 
 class ProductInCart:
 
+    # completes a statement "WITH changed AS (... RETURNING cart_id, product_id ...)" that changed a line of a cart by
+    # adding (sign '+') or taking away (sign '-') quantity units, bringing the cart's item count and subtotal along
+    UPDATE_CART_SUMMARY = """
+            UPDATE Cart
+            SET item_count = Cart.item_count {sign} {quantity},
+                subtotal = Cart.subtotal {sign} {quantity} * Product.price
+            FROM changed
+            JOIN Product ON Product.id = changed.product_id
+            WHERE Cart.id = changed.cart_id
+            """
+
     def __init__(
             self,
             id: int,
@@ -52,84 +63,96 @@ class ProductInCart:
         )
 
     """
-    Increases the quantity of a product in the cart by 1
+    Increases the quantity of a product in the cart by 1, as long as the seller has enough inventory, and updates the
+    cart's item count and subtotal in the same statement
     """
     @staticmethod
     def increase_quantity(product_in_cart_id: int):  # product_in_cart_id refers to the id in the ProductInCart table
-        product_in_cart = ProductInCart.get(product_in_cart_id)
-
-        product_amount_available = InventoryEntry.get_amount_available(
-            product_in_cart.seller_id,
-            product_in_cart.product.id
-        )
-
-        if product_in_cart.quantity + 1 <= product_amount_available:
-            app.db.execute_with_no_return(
-                """
+        app.db.execute_with_no_return(
+            """
+            WITH changed AS (
                 UPDATE ProductInCart
-                SET quantity = quantity + 1
-                WHERE id = :id
-                """,
-                id=product_in_cart_id,
+                SET quantity = ProductInCart.quantity + 1
+                FROM Sells
+                WHERE ProductInCart.id = :id
+                AND Sells.seller_id = ProductInCart.seller_id
+                AND Sells.product_id = ProductInCart.product_id
+                AND ProductInCart.quantity + 1 <= Sells.inventory
+                RETURNING ProductInCart.cart_id, ProductInCart.product_id
             )
+            """ + ProductInCart.UPDATE_CART_SUMMARY.format(sign='+', quantity='1'),
+            id=product_in_cart_id,
+        )
 
     """
-    Decreases the quantity of a product in the cart by 1
+    Decreases the quantity of a product in the cart by 1, and updates the cart's item count and subtotal in the same
+    statement
     """
     @staticmethod
     def decrease_quantity(product_in_cart_id: int):
         app.db.execute_with_no_return(
             """
-            UPDATE ProductInCart
-            SET quantity = quantity - 1
-            WHERE id = :id
-            AND quantity > 1
-            """,
+            WITH changed AS (
+                UPDATE ProductInCart
+                SET quantity = quantity - 1
+                WHERE id = :id
+                AND quantity > 1
+                RETURNING cart_id, product_id
+            )
+            """ + ProductInCart.UPDATE_CART_SUMMARY.format(sign='-', quantity='1'),
             id=product_in_cart_id
         )
 
     """
-    Removes a product from the cart
+    Removes a product from the cart, and updates the cart's item count and subtotal in the same statement
     """
     @staticmethod
     def remove_from_cart(product_in_cart_id: int):
         app.db.execute_with_no_return(
             """
-            DELETE FROM ProductInCart
-            WHERE id = :id
-            """,
+            WITH changed AS (
+                DELETE FROM ProductInCart
+                WHERE id = :id
+                RETURNING cart_id, product_id, quantity
+            )
+            """ + ProductInCart.UPDATE_CART_SUMMARY.format(sign='-', quantity='changed.quantity'),
             id=product_in_cart_id
         )
 
     """
-    Adds a product to the cart
+    Adds a unit of a product from a seller to the cart with one statement: the cart's line for it is created, or its
+    quantity increased when the cart already has one, as long as the seller has enough inventory, and the cart's item
+    count and subtotal are updated along with it. Returns the new quantity of the line, or None when the seller does
+    not have enough inventory
     """
     @staticmethod
-    def add_to_cart(product_id: int, seller_id: int, cart_id):
+    def add_to_cart(product_id: int, seller_id: int, cart_id) -> Optional[int]:
         rows = app.db.execute(
             """
-            SELECT id
-            FROM ProductInCart
-            WHERE cart_id = :cart_id
-            AND seller_id = :seller_id
-            AND product_id = :product_id
+            WITH changed AS (
+                INSERT INTO ProductInCart(cart_id, product_id, seller_id, quantity)
+                SELECT :cart_id, product_id, seller_id, 1
+                FROM Sells
+                WHERE seller_id = :seller_id
+                AND product_id = :product_id
+                AND inventory >= 1
+                ON CONFLICT (cart_id, product_id, seller_id) DO UPDATE
+                SET quantity = ProductInCart.quantity + 1
+                WHERE ProductInCart.quantity + 1 <= (
+                    SELECT inventory
+                    FROM Sells
+                    WHERE seller_id = EXCLUDED.seller_id
+                    AND product_id = EXCLUDED.product_id
+                )
+                RETURNING cart_id, product_id, quantity
+            ), summary AS (
+            """ + ProductInCart.UPDATE_CART_SUMMARY.format(sign='+', quantity='1') + """
+            )
+            SELECT quantity
+            FROM changed
             """,
-            cart_id =cart_id,
+            cart_id=cart_id,
             seller_id=seller_id,
             product_id=product_id
         )
-        if rows:  # product with same seller already exists in cart
-            product_in_cart_id = rows[0][0]
-            ProductInCart.increase_quantity(product_in_cart_id)
-        else:  # product with this seller must be newly added to cart
-            app.db.execute_with_no_return(
-                """
-                INSERT INTO ProductInCart(cart_id, product_id, seller_id, quantity)
-                VALUES (:cart_id, :product_id, :seller_id, :quantity)
-                """,
-                cart_id=cart_id,
-                product_id=product_id,
-                seller_id=seller_id,
-                quantity=1
-            )
-
+        return rows[0][0] if rows else None
@@ -1,11 +1,7 @@
 from flask import current_app as app
 
 from .product import Product
-
-import io
-import matplotlib.pyplot as plt
-from scipy import stats
-import base64
+from .rating_chart import RatingChart, AVERAGE_BINS
 
 class ProductReview:
     def __init__(self, reviewer_id, rating, review, product_id, seller_id, time_posted, upvotes, reports):
@@ -102,206 +98,124 @@ class ProductReview:
     @staticmethod
     def remove_specific_review_by_user(user_id, id, review_type):
         if review_type == "product":
-            app.db.execute_with_no_return(
+            rows = app.db.execute(
                 '''
                 DELETE FROM Feedback
                 WHERE (reviewer_id = :user_id and product_id = :product_id)
+                RETURNING product_id, seller_id, rating
                 ''',
                 user_id=user_id,
                 product_id=id)
         else:
-            app.db.execute_with_no_return(
+            rows = app.db.execute(
                 '''
                 DELETE FROM Feedback
                 WHERE (reviewer_id = :user_id and seller_id = :seller_id)
+                RETURNING product_id, seller_id, rating
                 ''',
                 user_id=user_id,
                 seller_id=id)
 
+        for product_id, seller_id, rating in rows:
+            ProductReview.update_rating_summary(product_id, seller_id, removed_rating=rating)
+
     """
     Get all summary rating for a given review
     """
     @staticmethod
     def get_summary_rating(id, review_type):
         if review_type == "product":
-            rows = app.db.execute(
-                '''
-                SELECT COUNT(rating), AVG(rating)
-                FROM Feedback
-                WHERE product_id = :id
-                ''',
-                id=id)
-            num_reviews = rows[0][0]
-            avg_rating = float("{:.2f}".format(rows[0][1])) if rows[0][0] != 0 else "No ratings yet"
+            num_reviews, avg_rating, current_product_rating_data_dist = ProductReview.get_rating_summary(id, -1)
 
             if num_reviews == 0:
                 return (num_reviews, avg_rating, "N/A")
 
-            # Gathering current product rating data
-            current_product_rating_rows = app.db.execute(
-                '''
-                SELECT rating
-                FROM Feedback
-                WHERE product_id = :id
-                ''',
-                id=id)
-            current_product_rating_data = [row[0] for row in current_product_rating_rows]
-            current_product_rating_data_dist = {
-                '1': current_product_rating_data.count(1),
-                '2': current_product_rating_data.count(2),
-                '3': current_product_rating_data.count(3),
-                '4': current_product_rating_data.count(4),
-                '5': current_product_rating_data.count(5),
-            }
-
-            # Gathering product category rating data
-            category = Product.get(id).category
-            category_product_rating_rows = app.db.execute(
-                '''
-                SELECT id
-                FROM Product
-                WHERE category = :category
-                ''',
-                category=category
-            )
-            category_product_rating_data = ProductReview.get_average_rating([row[0] for row in category_product_rating_rows], "product")
-            category_product_rating_data = sorted([float(data) for data in category_product_rating_data if data != 'No ratings yet'], reverse=True)
-            category_percentile = stats.percentileofscore(category_product_rating_data, avg_rating)
-            category_ranking = category_product_rating_data.index(avg_rating) + 1
-
-            ## Matplotlib graph code
-            rating_distribution_plot = io.BytesIO()
-            _, _, rating_distribution_patches = plt.hist(current_product_rating_data, [0.5, 1.5, 2.5, 3.5, 4.5, 5.5],
-                                                         facecolor='orange', rwidth=0.5)
-            plt.xticks([1, 2, 3, 4, 5])
-            plt.yticks([0, max(current_product_rating_data_dist.values()) + 1])
-            plt.xlabel("Rating")
-            plt.ylabel("# of Reviews")
-            plt.title("Product Rating Distribution")
-            for rect in rating_distribution_patches:
-                plt.annotate("{:.0f} %".format(100 * rect.get_height() / len(current_product_rating_data)),
-                             xy=(rect.get_x()+rect.get_width()/2, rect.get_height()), xytext=(0, 5),
-                             textcoords='offset points', ha='center', va='bottom')
-            plt.savefig(rating_distribution_plot, format='png')
-            plt.close()
-            rating_distribution_plot.seek(0)
-            rating_distribution_plot_url = base64.b64encode(rating_distribution_plot.getvalue())
-
-            category_percentile_plot = io.BytesIO()
-            _, _, category_percentile_patches = plt.hist(category_product_rating_data, [x / 10 for x in list(range(9, 52, 2))],
-                                                         facecolor='cyan', edgecolor='black')
-            plt.xticks([1, 2, 3, 4, 5])
-            plt.xlabel("Average Ratings")
-            plt.ylabel("Frequency")
-            plt.title("Average Category Rating Distribution")
-            min_dist = 1E8
-            highlighted_bar_index = 0
-            for i, rect in enumerate(category_percentile_patches):
-                temp = abs((rect.get_x() + (rect.get_width() * (1 / 2))) - avg_rating)
-                if temp < min_dist:
-                    min_dist = temp
-                    highlighted_bar_index = i
-            highlighted_rect = category_percentile_patches[highlighted_bar_index]
-            highlighted_rect.set_color('green')
-            highlighted_rect.set_edgecolor('black')
-            plt.annotate("{:.0f}th".format(category_percentile),
-                         xy=(highlighted_rect.get_x()+highlighted_rect.get_width()/2, highlighted_rect.get_height()),
-                         xytext=(0, 0), textcoords='offset points', ha='center', va='bottom', fontsize=11)
-            plt.savefig(category_percentile_plot, format='png')
-            plt.close()
-            category_percentile_plot.seek(0)
-            category_percentile_plot_url = base64.b64encode(category_percentile_plot.getvalue())
+            # Ranking the product against the other products in its category
+            category_ranking, category_percentile, category_rating_counts = ProductReview.get_rating_ranking(id, "product")
+
+            rating_distribution_plot_url = RatingChart.rating_distribution_url("product", current_product_rating_data_dist)
+            category_percentile_plot_url = RatingChart.average_distribution_url(
+                "product", category_rating_counts, avg_rating, category_percentile)
 
             return (num_reviews, avg_rating, f'#{category_ranking}', rating_distribution_plot_url, category_percentile_plot_url)
         else:
-            rows = app.db.execute(
-                '''
-                SELECT COUNT(rating), AVG(rating)
-                FROM Feedback
-                WHERE seller_id = :id
-                ''',
-                id=id)
-
-            num_reviews = rows[0][0]
-            avg_rating = float("{:.2f}".format(rows[0][1])) if rows[0][0] != 0 else "No ratings yet"
+            num_reviews, avg_rating, current_seller_rating_data_dist = ProductReview.get_rating_summary(-1, id)
 
             if num_reviews == 0:
                 return (num_reviews, avg_rating, "N/A")
 
-            # Gathering current seller rating data
-            current_seller_rating_rows = app.db.execute(
-                '''
-                SELECT rating
-                FROM Feedback
-                WHERE seller_id = :id
-                ''',
-                id=id)
-            current_seller_rating_data = [row[0] for row in current_seller_rating_rows]
-            current_seller_rating_data_dist = {
-                '1': current_seller_rating_data.count(1),
-                '2': current_seller_rating_data.count(2),
-                '3': current_seller_rating_data.count(3),
-                '4': current_seller_rating_data.count(4),
-                '5': current_seller_rating_data.count(5),
-            }
-
-            # Gathering all seller rating data
-            seller_rating_rows = app.db.execute(
-                '''
-                SELECT DISTINCT seller_id
-                FROM Sells
-                '''
-            )
-            seller_rating_data = ProductReview.get_average_rating([row[0] for row in seller_rating_rows], "seller")
-            seller_rating_data = sorted([float(data) for data in seller_rating_data if data != 'No ratings yet'], reverse=True)
-            seller_percentile = stats.percentileofscore(seller_rating_data, avg_rating)
-            seller_ranking = seller_rating_data.index(avg_rating) + 1
-
-            ## Matplotlib graph code
-            rating_distribution_plot = io.BytesIO()
-            _, _, rating_distribution_patches = plt.hist(current_seller_rating_data, [0.5, 1.5, 2.5, 3.5, 4.5, 5.5],
-                                                         facecolor='orange', rwidth=0.5)
-            plt.xticks([1, 2, 3, 4, 5])
-            plt.yticks([0, max(current_seller_rating_data_dist.values()) + 1])
-            plt.xlabel("Rating")
-            plt.ylabel("# of Reviews")
-            plt.title("Seller Rating Distribution")
-            for rect in rating_distribution_patches:
-                plt.annotate("{:.0f} %".format(100 * rect.get_height() / len(current_seller_rating_data)),
-                             xy=(rect.get_x()+rect.get_width()/2, rect.get_height()), xytext=(0, 5),
-                             textcoords='offset points', ha='center', va='bottom')
-            plt.savefig(rating_distribution_plot, format='png')
-            plt.close()
-            rating_distribution_plot.seek(0)
-            rating_distribution_plot_url = base64.b64encode(rating_distribution_plot.getvalue())
-
-            overall_seller_percentile_plot = io.BytesIO()
-            _, _, category_percentile_patches = plt.hist(seller_rating_data, [x / 10 for x in list(range(9, 52, 2))],
-                                                         facecolor='cyan', edgecolor='black')
-            plt.xticks([1, 2, 3, 4, 5])
-            plt.xlabel("Average Ratings")
-            plt.ylabel("Frequency")
-            plt.title("Average Seller Rating Distribution")
-            min_dist = 1E8
-            highlighted_bar_index = 0
-            for i, rect in enumerate(category_percentile_patches):
-                temp = abs((rect.get_x() + (rect.get_width() * (1 / 2))) - avg_rating)
-                if temp < min_dist:
-                    min_dist = temp
-                    highlighted_bar_index = i
-            highlighted_rect = category_percentile_patches[highlighted_bar_index]
-            highlighted_rect.set_color('green')
-            highlighted_rect.set_edgecolor('black')
-            plt.annotate("{:.0f}th".format(seller_percentile),
-                         xy=(highlighted_rect.get_x()+highlighted_rect.get_width()/2, highlighted_rect.get_height()),
-                         xytext=(0, 0), textcoords='offset points', ha='center', va='bottom', fontsize=11)
-            plt.savefig(overall_seller_percentile_plot, format='png')
-            plt.close()
-            overall_seller_percentile_plot.seek(0)
-            overall_seller_percentile_plot_url = base64.b64encode(overall_seller_percentile_plot.getvalue())
+            # Ranking the seller against all other sellers
+            seller_ranking, seller_percentile, seller_rating_counts = ProductReview.get_rating_ranking(id, "seller")
+
+            rating_distribution_plot_url = RatingChart.rating_distribution_url("seller", current_seller_rating_data_dist)
+            overall_seller_percentile_plot_url = RatingChart.average_distribution_url(
+                "seller", seller_rating_counts, avg_rating, seller_percentile)
 
             return (num_reviews, avg_rating, f'#{seller_ranking}', rating_distribution_plot_url, overall_seller_percentile_plot_url)
 
+    """
+    Ranks a product against the other rated products of its category, or a seller against all other rated sellers, by
+    average rating (rounded to 2 decimals, as displayed). Everything is computed by the database in one query over
+    RatingSummary, returning:
+        1) the rank, 1 being the highest average (ties share a rank)
+        2) the percentile of the average among all of them, counting ties as half below and half above (the "rank"
+           kind of scipy's percentileofscore)
+        3) how many of the averages fall in each AVERAGE_BINS bar of the average rating distribution chart
+    """
+    @staticmethod
+    def get_rating_ranking(id, review_type):
+        if review_type == "product":
+            population = """
+                SELECT RatingSummary.product_id AS id, ROUND(rating_sum::numeric / num_ratings, 2) AS avg_rating
+                FROM RatingSummary
+                JOIN Product ON Product.id = RatingSummary.product_id
+                WHERE RatingSummary.seller_id = -1
+                AND RatingSummary.num_ratings > 0
+                AND Product.category = (SELECT category FROM Product WHERE id = :id)
+            """
+        else:
+            population = """
+                SELECT seller_id AS id, ROUND(rating_sum::numeric / num_ratings, 2) AS avg_rating
+                FROM RatingSummary
+                WHERE product_id = -1
+                AND num_ratings > 0
+                AND (seller_id IN (SELECT seller_id FROM Sells) OR seller_id = :id)
+            """
+
+        rows = app.db.execute(
+            """
+            WITH averages AS (""" + population + """),
+            ranked AS (
+                SELECT id,
+                       RANK() OVER (ORDER BY avg_rating DESC) AS ranking,
+                       RANK() OVER (ORDER BY avg_rating) - 1 AS num_below,
+                       COUNT(*) OVER (ORDER BY avg_rating) AS num_at_or_below,
+                       COUNT(*) OVER () AS num_total
+                FROM averages
+            ),
+            histogram AS (
+                SELECT width_bucket(avg_rating, :low, :high, :num_bins) AS bar, COUNT(*) AS num_averages
+                FROM averages
+                GROUP BY 1
+            )
+            SELECT ranking,
+                   (num_below + num_at_or_below + 1) * 50.0 / num_total,
+                   ARRAY(SELECT COALESCE(histogram.num_averages, 0)
+                         FROM generate_series(1, :num_bins) AS n
+                         LEFT JOIN histogram ON histogram.bar = n
+                         ORDER BY n)
+            FROM ranked
+            WHERE id = :id
+            """,
+            id=id,
+            low=AVERAGE_BINS[0],
+            high=AVERAGE_BINS[-1],
+            num_bins=len(AVERAGE_BINS) - 1
+        )
+
+        ranking, percentile, counts = rows[0]
+        return (ranking, float(percentile), counts)
+
     """
     Get average rating of all given ids
     """
@@ -313,31 +227,100 @@ class ProductReview:
         if type == "product":
             rows = app.db.execute(
                 """
-                SELECT product_id, AVG(rating)
-                FROM Feedback
-                WHERE product_id != -1
-                GROUP BY product_id
-                """
+                SELECT product_id, rating_sum::numeric / num_ratings
+                FROM RatingSummary
+                WHERE product_id = ANY(:ids)
+                AND seller_id = -1
+                AND num_ratings > 0
+                """,
+                ids=[int(id) for id in ids]
             )
         else:
             rows = app.db.execute(
                 """
-                SELECT seller_id, AVG(rating)
-                FROM Feedback
-                WHERE seller_id != -1
-                GROUP BY seller_id
-                """
+                SELECT seller_id, rating_sum::numeric / num_ratings
+                FROM RatingSummary
+                WHERE seller_id = ANY(:ids)
+                AND product_id = -1
+                AND num_ratings > 0
+                """,
+                ids=[int(id) for id in ids]
             )
 
-        # fast computation of average rating through sorting and dict lookups
-        rows.sort(key=lambda x:x[0])
         rows_dict = {i[0]: i[1] for i in rows}
         for id in ids:
-            avg = rows_dict.get(id)
+            avg = rows_dict.get(int(id))
             ret.append("{:.2f}".format(avg) if avg != None else "No ratings yet")
 
         return ret
 
+    """
+    Get the number of reviews, average rating and per-star rating distribution of one product (seller_id = -1) or
+    one seller (product_id = -1) from the maintained RatingSummary
+    """
+    @staticmethod
+    def get_rating_summary(product_id, seller_id):
+        rows = app.db.execute(
+            """
+            SELECT num_ratings, rating_sum, stars_1, stars_2, stars_3, stars_4, stars_5
+            FROM RatingSummary
+            WHERE product_id = :product_id
+            AND seller_id = :seller_id
+            """,
+            product_id=product_id,
+            seller_id=seller_id)
+
+        if not rows or rows[0][0] == 0:
+            return (0, "No ratings yet", {str(star): 0 for star in range(1, 6)})
+
+        num_ratings, rating_sum = rows[0][0], rows[0][1]
+        avg_rating = float("{:.2f}".format(rating_sum / num_ratings))
+        return (num_ratings, avg_rating, {str(star): rows[0][star + 1] for star in range(1, 6)})
+
+    """
+    Applies a change to one review to the RatingSummary of the product or seller it is about. removed_rating is the
+    rating the review used to have (None for a new review) and added_rating the rating it has now (None for a
+    removed review)
+    """
+    @staticmethod
+    def update_rating_summary(product_id, seller_id, removed_rating=None, added_rating=None):
+        stars = {star: 0 for star in range(1, 6)}
+        num_ratings, rating_sum = 0, 0
+        if removed_rating is not None:
+            stars[int(removed_rating)] -= 1
+            num_ratings -= 1
+            rating_sum -= int(removed_rating)
+        if added_rating is not None:
+            stars[int(added_rating)] += 1
+            num_ratings += 1
+            rating_sum += int(added_rating)
+
+        app.db.execute_with_no_return(
+            """
+            INSERT INTO RatingSummary(product_id, seller_id, num_ratings, rating_sum,
+                                      stars_1, stars_2, stars_3, stars_4, stars_5)
+                VALUES (:product_id, :seller_id, :num_ratings, :rating_sum,
+                        :stars_1, :stars_2, :stars_3, :stars_4, :stars_5)
+            ON CONFLICT (product_id, seller_id) DO UPDATE
+            SET num_ratings = RatingSummary.num_ratings + EXCLUDED.num_ratings,
+                rating_sum = RatingSummary.rating_sum + EXCLUDED.rating_sum,
+                stars_1 = RatingSummary.stars_1 + EXCLUDED.stars_1,
+                stars_2 = RatingSummary.stars_2 + EXCLUDED.stars_2,
+                stars_3 = RatingSummary.stars_3 + EXCLUDED.stars_3,
+                stars_4 = RatingSummary.stars_4 + EXCLUDED.stars_4,
+                stars_5 = RatingSummary.stars_5 + EXCLUDED.stars_5
+            """,
+            product_id=product_id,
+            seller_id=seller_id,
+            num_ratings=num_ratings,
+            rating_sum=rating_sum,
+            stars_1=stars[1],
+            stars_2=stars[2],
+            stars_3=stars[3],
+            stars_4=stars[4],
+            stars_5=stars[5]
+        )
+
     """
     Checking if a user review exists for the given review
     """
@@ -379,11 +362,18 @@ class ProductReview:
         seller_id = review_contents['seller_id']
         time_posted = review_contents['time_posted']
 
-        app.db.execute_with_no_return(
+        rows = app.db.execute(
             """
             UPDATE Feedback
             SET rating = :rating, review = :review, time_posted = :time_posted
+            FROM (
+                SELECT rating
+                FROM Feedback
+                WHERE reviewer_id = :reviewer_id AND product_id = :product_id AND seller_id = :seller_id
+                FOR UPDATE
+            ) AS old
             WHERE reviewer_id = :reviewer_id AND product_id = :product_id AND seller_id = :seller_id
+            RETURNING old.rating
             """,
             reviewer_id=reviewer_id,
             rating=rating,
@@ -393,6 +383,9 @@ class ProductReview:
             time_posted=time_posted
         )
 
+        if rows:
+            ProductReview.update_rating_summary(product_id, seller_id, removed_rating=rows[0][0], added_rating=rating)
+
     """
     Adding a user review to the database
     """
@@ -422,6 +415,8 @@ class ProductReview:
             reports=reports
         )
 
+        ProductReview.update_rating_summary(product_id, seller_id, added_rating=rating)
+
     """
     Checking whether a user has upvoted the given review before
     """
@@ -566,15 +561,18 @@ class ProductReview:
 
         if rows[0][0] >= 5:
             # The system automatically deletes any reviews that have 5 reports
-            app.db.execute_with_no_return(
+            deleted_rows = app.db.execute(
                 """
                 DELETE FROM Feedback
                 WHERE reviewer_id = :reviewer_id AND product_id = :product_id AND seller_id = :seller_id
+                RETURNING rating
                 """,
                 reviewer_id=reviewer_id,
                 product_id=product_id,
                 seller_id=seller_id
             )
+            for deleted_row in deleted_rows:
+                ProductReview.update_rating_summary(product_id, seller_id, removed_rating=deleted_row[0])
 
             # Getting rid of any remaining data from related tables
             app.db.execute_with_no_return(
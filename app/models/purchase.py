@@ -1,10 +1,10 @@
-from typing import Optional
+from typing import List, Optional
 
 from flask import current_app as app
 from flask import render_template
 from .product import Product
 from .product_in_cart import ProductInCart
-from sqlalchemy import text
+from .pagination import keyset, paginate
 from datetime import datetime
 
 """
@@ -41,10 +41,12 @@ class Purchase:
         return round((float(self.final_unit_price) * self.product_in_cart.quantity) - discount, 2)
 
     """
-    Gets all the purchases for a certain cart with all relevant data, which also comes from ProductInCart
+    Gets all the purchases for a certain cart with all relevant data, which also comes from ProductInCart. With
+    paginated set, only the page of purchases the cursor points to is returned (see pagination.py)
     """
     @staticmethod
-    def get_by_cart(cart_id, page_num: Optional[int]=None):
+    def get_by_cart(cart_id, paginated: bool = False, cursor: Optional[str] = None):
+        condition, order_by, params = keyset(['Purchase.product_in_cart_id'], cursor)
         query_string = '''
             SELECT 
             Purchase.product_in_cart_id as product_in_cart_id, 
@@ -62,34 +64,33 @@ class Purchase:
             ON ProductInCart.id=Purchase.product_in_cart_id
             WHERE Purchase.cart_id = :cart_id
             '''
-        if page_num:
-            query_string = '''
-                SELECT 
-                Purchase.product_in_cart_id as product_in_cart_id, 
-                Purchase.time_purchased as time_purchased, 
-                Purchase.is_fulfilled as is_fulfilled, 
-                Purchase.time_of_fulfillment as time_of_fulfillment, 
-                Purchase.cart_id as cart_id, 
-                Purchase.user_id as user_id,
-                Purchase.final_unit_price as final_unit_price,
-                ProductInCart.product_id as product_id,
-                ProductInCart.seller_id as seller_id, 
-                ProductInCart.quantity as quantity
-                FROM Purchase
-                JOIN ProductInCart
-                ON ProductInCart.id=Purchase.product_in_cart_id
-                WHERE Purchase.cart_id = :cart_id
-                LIMIT 20
-                OFFSET ((:page_num - 1) * 20)
-                '''
+        if paginated:
+            query_string += '''
+            AND ''' + condition + '''
+            ORDER BY ''' + order_by + '''
+            LIMIT :page_limit
+            '''
         rows = app.db.execute(
             query_string,
             cart_id=cart_id,
-            page_num=page_num
+            **params
         )
+        products = Product.get_many([row[7] for row in rows])
 
-        return [
-            Purchase(
+        def build(row):
+            (
+                product_in_cart_id,
+                time_purchased,
+                is_fulfilled,
+                time_of_fulfillment,
+                cart_id,
+                user_id,
+                final_unit_price,
+                product_id,
+                seller_id,
+                quantity,
+            ) = row
+            return Purchase(
                 id=product_in_cart_id,
                 time_purchased=time_purchased,
                 is_fulfilled=is_fulfilled,
@@ -102,133 +103,66 @@ class Purchase:
                     cart_id=cart_id,
                     seller_id=seller_id,
                     quantity=quantity,
-                    product=Product.get(product_id)
-            )) for (
-                product_in_cart_id,
-                time_purchased,
-                is_fulfilled,
-                time_of_fulfillment,
-                cart_id,
-                user_id,
-                final_unit_price,
-                product_id,
-                seller_id,
-                quantity,
-            ) in rows] if rows else []
+                    product=products.get(product_id)
+            ))
+
+        if paginated:
+            return paginate(rows, cursor, key=lambda row: (row[0],), build=build)
+        return [build(row) for row in rows]
 
     """
-    This method inserts a new row into the Purchase table without committing it to allow for rollbacks while 
-    purchasing a cart
+    Marks the given purchases (ProductInCart ids) of a seller as fulfilled, with one UPDATE however many there are, and
+    then marks fulfilled every cart they are in that has nothing left to fulfill, with one more. Purchases that are not
+    the seller's or are already fulfilled are left alone. Returns how many purchases were fulfilled.
+    The carts are locked first so that sellers fulfilling the last purchases of the same cart at the same time take
+    turns, and the last of them sees the others' purchases fulfilled when checking the cart
     """
     @staticmethod
-    def insert_new_purchase_without_commit(conn, product_in_cart_id, user_id, cart_id, final_unit_price):
-        conn.execute(text(
-            """
-            INSERT INTO Purchase(product_in_cart_id, user_id, cart_id, final_unit_price)
-            VALUES (:product_in_cart_id, :user_id, :cart_id, :final_unit_price)
-            """),
-            {
-                "product_in_cart_id": product_in_cart_id,
-                "user_id": user_id,
-                "cart_id": cart_id,
-                "final_unit_price": final_unit_price
-            }
-        )
-
-    @staticmethod
-    def get_seller_incoming_orders(seller_id: int):
-        rows = app.db.execute(
-            # (buyer information including address, date order placed, total amount/number of items, and overall fulfillment status)
+    def mark_as_fulfilled(seller_id: int, product_in_cart_ids: List[int]) -> int:
+        if not product_in_cart_ids:
+            return 0
+        app.db.execute(
             """
-            SELECT Users.first_name, Users.last_name, Users.address, Purchase.time_purchased, ProductInCart.quantity, Purchase.is_fulfilled, Purchase.product_in_cart_id, Purchase.cart_id
-            FROM Purchase
-            JOIN ProductInCart ON ProductInCart.id = Purchase.product_in_cart_id
-            JOIN Users ON Users.id = Purchase.user_id
-            WHERE is_fulfilled = false
-              AND ProductInCart.seller_id = :seller_id
-            ORDER BY Purchase.time_purchased DESC
+            SELECT id
+            FROM Cart
+            WHERE id IN (
+                SELECT cart_id
+                FROM Purchase
+                WHERE product_in_cart_id = ANY(:product_in_cart_ids)
+            )
+            ORDER BY id
+            FOR UPDATE
             """,
-            seller_id=seller_id
+            product_in_cart_ids=product_in_cart_ids
         )
-
-        return [
-            {
-                'first_name': row[0],
-                'last_name': row[1],
-                'address': row[2],
-                'timestamp': row[3],
-                'quantity': row[4],
-                'fulfilled': row[5],
-                'product_in_cart_id': row[6],
-                'cart_id': row[7]
-            } for row in rows
-        ]
-
-    @staticmethod
-    def get_seller_fulfilled_orders(seller_id: int):
-        rows = app.db.execute(
-            # (buyer information including address, date order placed, total amount/number of items, and overall fulfillment status)
-            """
-            SELECT Users.first_name, Users.last_name, Users.address, Purchase.time_purchased, ProductInCart.quantity, Purchase.is_fulfilled, Purchase.product_in_cart_id
-            FROM Purchase
-            JOIN ProductInCart ON ProductInCart.id = Purchase.product_in_cart_id
-            JOIN Users ON Users.id = Purchase.user_id
-            WHERE is_fulfilled = true
-              AND ProductInCart.seller_id = :seller_id
-            ORDER BY Purchase.time_purchased DESC
-            """,
-            seller_id=seller_id
-        )
-
-        return [
-            {
-                'first_name': row[0],
-                'last_name': row[1],
-                'address': row[2],
-                'timestamp': row[3],
-                'quantity': row[4],
-                'fulfilled': row[5],
-                'product_in_cart_id': row[6],
-            } for row in rows
-        ]
-
-    """
-    This method updates a purchase's fulfillment status which could change the cart fulfillment status as well
-    """
-    @staticmethod
-    def mark_as_fulfilled(id, cart_id):
-        app.db.execute_with_no_return(
+        fulfilled = app.db.execute(
             """
             UPDATE Purchase
-            SET is_fulfilled = :is_fulfilled, time_of_fulfillment = :time_of_fulfillment
-            WHERE product_in_cart_id = :product_in_cart_id
+            SET is_fulfilled = True, time_of_fulfillment = :time_of_fulfillment
+            FROM ProductInCart
+            WHERE ProductInCart.id = Purchase.product_in_cart_id
+            AND Purchase.product_in_cart_id = ANY(:product_in_cart_ids)
+            AND ProductInCart.seller_id = :seller_id
+            AND NOT Purchase.is_fulfilled
+            RETURNING Purchase.cart_id
             """,
-            product_in_cart_id=id,
-            is_fulfilled=True,
+            product_in_cart_ids=product_in_cart_ids,
+            seller_id=seller_id,
             time_of_fulfillment=datetime.now()
         )
-
-        unfulfilled_purchases_in_cart = app.db.execute(
-            """
-            SELECT product_in_cart_id 
-            FROM Purchase
-            WHERE cart_id = :cart_id
-            AND is_fulfilled = :is_fulfilled
-            """,
-            cart_id=cart_id,
-            is_fulfilled=False
-        )
-        if not unfulfilled_purchases_in_cart:
+        if fulfilled:
             app.db.execute_with_no_return(
                 """
-                UPDATE CART
-                SET is_fulfilled = :is_fulfilled
-                WHERE id = :cart_id
+                UPDATE Cart
+                SET is_fulfilled = True
+                WHERE id = ANY(:cart_ids)
+                AND NOT EXISTS (
+                    SELECT 1
+                    FROM Purchase
+                    WHERE Purchase.cart_id = Cart.id
+                    AND NOT Purchase.is_fulfilled
+                )
                 """,
-                cart_id=cart_id,
-                is_fulfilled=True,
+                cart_ids=sorted({row[0] for row in fulfilled})
             )
-
-
-
-
+        return len(fulfilled)
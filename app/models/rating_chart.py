@@ -0,0 +1,141 @@
+from flask import current_app as app, url_for
+from matplotlib.figure import Figure
+from functools import lru_cache
+import hashlib
+import hmac
+import io
+
+"""
+Renders the rating charts shown on product and seller pages. Each chart is fully described by a small key: the star
+counts of one product or seller for the rating distribution, or the binned average ratings of all products in the
+category (or all sellers) plus the bar to highlight for the average rating distribution. Rendered PNGs are cached by
+that key, and pages link to a chart through a URL that encodes the key, so when a review changes the histogram (and
+with it the URL) changes too and the stale chart is simply never requested again. That also makes every chart URL safe
+for browsers and proxies to cache.
+
+Chart URLs are signed: the key is signed with the app's SECRET_KEY, and the chart routes only render a key whose
+signature matches, so clients cannot make the server draw (and cache) charts for counts the site never showed.
+
+Charts are drawn on standalone matplotlib Figures rather than through pyplot, whose global current-figure state is not
+safe to share between concurrent requests.
+"""
+
+CHART_CACHE_SIZE = 512
+CHART_MAX_AGE_SECONDS = 24 * 60 * 60
+MAX_COUNT = 10 ** 9  # no bar of a chart can count more reviews or averages than this
+
+STARS = [1, 2, 3, 4, 5]
+AVERAGE_BINS = [x / 10 for x in range(9, 52, 2)]  # 0.9, 1.1, ..., 5.1
+AVERAGE_BIN_WIDTH = 0.2
+
+TITLES = {
+    'product': ('Product Rating Distribution', 'Average Category Rating Distribution'),
+    'seller': ('Seller Rating Distribution', 'Average Seller Rating Distribution'),
+}
+
+
+class RatingChart:
+
+    """
+    URL of the rating distribution chart for the star counts (a dict of '1'..'5' -> count) of one product or seller
+    """
+    @staticmethod
+    def rating_distribution_url(subject, rating_dist):
+        counts = [rating_dist[str(star)] for star in STARS]
+        key = RatingChart.key('rating_distribution', subject, counts)
+        return url_for('charts.rating_distribution', subject=subject, counts=RatingChart._join(counts),
+                       sig=RatingChart.sign(key))
+
+    """
+    URL of the chart of how average ratings are distributed, given the number of averages falling in each AVERAGE_BINS
+    bar, with the bar holding avg_rating highlighted and labelled with its percentile
+    """
+    @staticmethod
+    def average_distribution_url(subject, counts, avg_rating, percentile):
+        highlight = RatingChart.highlighted_bar(avg_rating)
+        percentile = int('{:.0f}'.format(percentile))
+        key = RatingChart.key('average_distribution', subject, counts, highlight, percentile)
+        return url_for('charts.average_distribution', subject=subject, counts=RatingChart._join(counts),
+                       highlight=highlight, percentile=percentile, sig=RatingChart.sign(key))
+
+    """
+    The key that fully describes a chart: its kind, subject, counts and any further parameters, in a canonical form
+    """
+    @staticmethod
+    def key(kind, subject, counts, *params):
+        return ':'.join([kind, subject, RatingChart._join(counts)] + [str(int(param)) for param in params])
+
+    """
+    Signature of a chart key, which the chart URLs carry so that only charts the site links to are rendered
+    """
+    @staticmethod
+    def sign(key):
+        return hmac.new(app.config['SECRET_KEY'].encode(), key.encode(), hashlib.sha256).hexdigest()[:32]
+
+    """
+    Whether signature is the signature of the chart key
+    """
+    @staticmethod
+    def verify(key, signature):
+        return signature is not None and hmac.compare_digest(RatingChart.sign(key), signature)
+
+    """
+    Index of the average-rating bar whose centre is closest to avg_rating
+    """
+    @staticmethod
+    def highlighted_bar(avg_rating):
+        centres = [(left + right) / 2 for left, right in zip(AVERAGE_BINS, AVERAGE_BINS[1:])]
+        return min(range(len(centres)), key=lambda i: abs(centres[i] - avg_rating))
+
+    """
+    PNG of the rating distribution for the given star counts (a tuple of 5 counts)
+    """
+    @staticmethod
+    @lru_cache(maxsize=CHART_CACHE_SIZE)
+    def render_rating_distribution(subject, counts):
+        figure = Figure()
+        ax = figure.subplots()
+        bars = ax.bar(STARS, counts, width=0.5, color='orange')
+        ax.set_xticks(STARS)
+        ax.set_yticks([0, max(counts) + 1])
+        ax.set_xlabel("Rating")
+        ax.set_ylabel("# of Reviews")
+        ax.set_title(TITLES[subject][0])
+        total = sum(counts)
+        for rect in bars:
+            ax.annotate("{:.0f} %".format(100 * rect.get_height() / total),
+                        xy=(rect.get_x() + rect.get_width() / 2, rect.get_height()), xytext=(0, 5),
+                        textcoords='offset points', ha='center', va='bottom')
+        return RatingChart._png(figure)
+
+    """
+    PNG of the average rating distribution for the given bar counts (a tuple with one count per AVERAGE_BINS bar), with
+    bar number highlight coloured in and labelled as the percentile-th percentile
+    """
+    @staticmethod
+    @lru_cache(maxsize=CHART_CACHE_SIZE)
+    def render_average_distribution(subject, counts, highlight, percentile):
+        figure = Figure()
+        ax = figure.subplots()
+        bars = ax.bar(AVERAGE_BINS[:-1], counts, width=AVERAGE_BIN_WIDTH, align='edge', color='cyan', edgecolor='black')
+        ax.set_xticks(STARS)
+        ax.set_xlabel("Average Ratings")
+        ax.set_ylabel("Frequency")
+        ax.set_title(TITLES[subject][1])
+        highlighted_rect = bars[highlight]
+        highlighted_rect.set_color('green')
+        highlighted_rect.set_edgecolor('black')
+        ax.annotate("{}th".format(percentile),
+                    xy=(highlighted_rect.get_x() + highlighted_rect.get_width() / 2, highlighted_rect.get_height()),
+                    xytext=(0, 0), textcoords='offset points', ha='center', va='bottom', fontsize=11)
+        return RatingChart._png(figure)
+
+    @staticmethod
+    def _png(figure):
+        plot = io.BytesIO()
+        figure.savefig(plot, format='png')
+        return plot.getvalue()
+
+    @staticmethod
+    def _join(counts):
+        return ','.join(str(int(count)) for count in counts)
@@ -0,0 +1,283 @@
+from flask import current_app as app
+from typing import List, Optional
+from datetime import datetime, timedelta
+
+from .product import Product
+from .product_in_cart import ProductInCart
+from .purchase import Purchase
+from .pagination import Cursor, PAGE_SIZE, keyset, paginate
+
+DAILY_ROLLUP_DAYS = 30
+TOP_PRODUCTS = 10
+ORDER_KEY_TYPES = [datetime, int]  # orders are listed by (time_purchased, cart_id)
+
+# what each order list keeps of a seller's purchases
+STATUS_CONDITIONS = {
+    'incoming': 'NOT Purchase.is_fulfilled',
+    'fulfilled': 'Purchase.is_fulfilled',
+}
+
+"""
+This class represents one order (purchased cart) as a seller sees it: only the lines of the cart that the seller sold,
+which the order lists keep as Purchases
+"""
+
+
+class SellerOrder:
+
+    def __init__(
+            self,
+            cart_id: int,
+            time_purchased: datetime,
+            item_count: int,
+            revenue: float,
+            buyer_first_name: str,
+            buyer_last_name: str,
+            buyer_address: str,
+            purchases: Optional[List[Purchase]] = None
+    ):
+        self.cart_id = cart_id
+        self.time_purchased = time_purchased
+        self.item_count = item_count
+        self.revenue = revenue
+        self.buyer_first_name = buyer_first_name
+        self.buyer_last_name = buyer_last_name
+        self.buyer_address = buyer_address
+        self.purchases = purchases or []
+
+
+"""
+This class holds the queries of a seller's dashboard. Everything is worked out in the database from the seller's
+purchases (Purchase(seller_id, ...) indexes) and lines (ProductInCart(seller_id) index), so a page load fetches one
+page of orders or a few rows of totals however much the seller has sold. Revenue is counted at the unit prices the
+products were bought at, before coupon discounts
+"""
+
+
+class SellerDashboard:
+
+    """
+    Gets one page (see pagination.py) of a seller's orders, most recent first, with the seller's lines of each order.
+    status 'incoming' keeps the orders with lines still to fulfill (and only those lines), 'fulfilled' the orders with
+    fulfilled lines
+    """
+    @staticmethod
+    def get_orders(seller_id: int, status: str, cursor: Optional[str] = None) -> List[SellerOrder]:
+        status_condition = STATUS_CONDITIONS[status]
+        # the page's carts are read off the Purchase(seller_id, time_purchased, cart_id) index (see migration 0009),
+        # so that only their lines are grouped into orders instead of every order the seller ever had
+        condition, order_by, params = keyset(['Purchase.time_purchased', 'Purchase.cart_id'], cursor, descending=True,
+                                             types=ORDER_KEY_TYPES)
+        _, page_order_by, _ = keyset(['page.time_purchased', 'page.cart_id'], cursor, descending=True,
+                                     types=ORDER_KEY_TYPES)
+        rows = SellerDashboard._get_order_rows(
+            seller_id,
+            status_condition,
+            """
+            SELECT DISTINCT Purchase.time_purchased, Purchase.cart_id
+            FROM Purchase
+            WHERE Purchase.seller_id = :seller_id
+            AND """ + status_condition + """
+            AND """ + condition + """
+            ORDER BY """ + order_by + """
+            LIMIT :page_limit
+            """,
+            page_order_by,
+            **params
+        )
+        orders = paginate(rows, cursor, key=lambda row: (row[1], row[0]), build=lambda row: SellerOrder(*row))
+
+        orders_by_cart = {order.cart_id: order for order in orders}
+        for purchase in SellerDashboard._get_purchases(seller_id, status_condition, list(orders_by_cart)):
+            orders_by_cart[purchase.cart_id].purchases.append(purchase)
+        return orders
+
+    """
+    Gets the seller's incoming orders that came in after the one the `since` token (see new_orders_cursor) points to,
+    plus the orders of cart_ids (the carts the order feed announced, which may have been bought a moment before the
+    newest order already shown when their checkouts committed in a different order). Only the PAGE_SIZE oldest of them
+    are returned, listed most recent first, together with the token to pass the next time, which points to the newest
+    order returned so far, and whether more orders are waiting after it
+    """
+    @staticmethod
+    def get_new_orders(seller_id: int, since: Optional[str], cart_ids: List[int]):
+        since_cursor = Cursor.decode(since, ORDER_KEY_TYPES) or Cursor([datetime.min, 0])
+        since_time, since_cart_id = since_cursor.key
+
+        status_condition = STATUS_CONDITIONS['incoming']
+        rows = SellerDashboard._get_order_rows(
+            seller_id,
+            status_condition,
+            """
+            SELECT time_purchased, cart_id
+            FROM (
+                (SELECT DISTINCT Purchase.time_purchased, Purchase.cart_id
+                 FROM Purchase
+                 WHERE Purchase.seller_id = :seller_id
+                 AND """ + status_condition + """
+                 AND (Purchase.time_purchased, Purchase.cart_id) > (:since_time, :since_cart_id)
+                 ORDER BY Purchase.time_purchased, Purchase.cart_id
+                 LIMIT :page_limit)
+                UNION
+                (SELECT Purchase.time_purchased, Purchase.cart_id
+                 FROM Purchase
+                 WHERE Purchase.cart_id = ANY(:cart_ids)
+                 AND Purchase.seller_id = :seller_id
+                 AND """ + status_condition + """)
+            ) AS new_orders
+            ORDER BY time_purchased, cart_id
+            LIMIT :page_limit
+            """,
+            'page.time_purchased, page.cart_id',
+            since_time=since_time,
+            since_cart_id=since_cart_id,
+            cart_ids=cart_ids[:PAGE_SIZE],
+            page_limit=PAGE_SIZE + 1
+        )
+        # the window is taken oldest first, so that the token never moves past an order that was not returned
+        more = len(rows) > PAGE_SIZE
+        orders = [SellerOrder(*row) for row in reversed(rows[:PAGE_SIZE])]
+
+        orders_by_cart = {order.cart_id: order for order in orders}
+        for purchase in SellerDashboard._get_purchases(seller_id, status_condition, list(orders_by_cart)):
+            orders_by_cart[purchase.cart_id].purchases.append(purchase)
+
+        newest = max([(since_time, since_cart_id)] + [(order.time_purchased, order.cart_id) for order in orders])
+        return orders, SellerDashboard.new_orders_cursor(*newest), more
+
+    """
+    Gets the rows of the SellerOrders whose (time_purchased, cart_id) the page query selects, in order_by order, by
+    adding up the seller's lines of just those carts that meet status_condition
+    """
+    @staticmethod
+    def _get_order_rows(seller_id: int, status_condition: str, page: str, order_by: str, **params):
+        return app.db.execute(
+            """
+            SELECT page.cart_id, page.time_purchased,
+                   SUM(ProductInCart.quantity) AS item_count,
+                   SUM(ProductInCart.quantity * Purchase.final_unit_price) AS revenue,
+                   Users.first_name, Users.last_name, Users.address
+            FROM (""" + page + """) AS page
+            JOIN Purchase ON Purchase.seller_id = :seller_id
+                         AND Purchase.time_purchased = page.time_purchased
+                         AND Purchase.cart_id = page.cart_id
+            JOIN ProductInCart ON ProductInCart.id = Purchase.product_in_cart_id
+            JOIN Users ON Users.id = Purchase.user_id
+            WHERE """ + status_condition + """
+            GROUP BY page.time_purchased, page.cart_id, Users.id
+            ORDER BY """ + order_by,
+            seller_id=seller_id,
+            **params
+        )
+
+    """
+    Returns the token get_new_orders takes to get the orders that come in after the one bought at time_purchased as
+    cart_id, e.g. the newest one on a seller's incoming orders page
+    """
+    @staticmethod
+    def new_orders_cursor(time_purchased: datetime, cart_id: int) -> str:
+        return Cursor([time_purchased, cart_id]).encode()
+
+    """
+    Gets the seller's lines of the given carts that meet status_condition, as Purchases
+    """
+    @staticmethod
+    def _get_purchases(seller_id: int, status_condition: str, cart_ids: List[int]) -> List[Purchase]:
+        if not cart_ids:
+            return []
+        rows = app.db.execute(
+            """
+            SELECT Purchase.product_in_cart_id, Purchase.time_purchased, Purchase.is_fulfilled,
+                   Purchase.time_of_fulfillment, Purchase.cart_id, Purchase.user_id, Purchase.final_unit_price,
+                   ProductInCart.product_id, ProductInCart.quantity
+            FROM Purchase
+            JOIN ProductInCart ON ProductInCart.id = Purchase.product_in_cart_id
+            WHERE Purchase.cart_id = ANY(:cart_ids)
+            AND ProductInCart.seller_id = :seller_id
+            AND """ + status_condition + """
+            ORDER BY Purchase.cart_id, Purchase.product_in_cart_id
+            """,
+            cart_ids=cart_ids,
+            seller_id=seller_id
+        )
+        products = Product.get_many([row[7] for row in rows])
+        return [
+            Purchase(
+                *row[:7],
+                product_in_cart=ProductInCart(
+                    id=row[0],
+                    product=products.get(row[7]),
+                    cart_id=row[4],
+                    seller_id=seller_id,
+                    quantity=row[8]
+                )
+            ) for row in rows
+        ]
+
+    """
+    Gets the seller's overall counts: orders and units sold, revenue, and the orders and lines still to fulfill
+    """
+    @staticmethod
+    def get_summary(seller_id: int):
+        return app.db.execute(
+            """
+            SELECT COUNT(DISTINCT Purchase.cart_id) AS order_count,
+                   COALESCE(SUM(ProductInCart.quantity), 0) AS item_count,
+                   COALESCE(SUM(ProductInCart.quantity * Purchase.final_unit_price), 0) AS revenue,
+                   COUNT(DISTINCT Purchase.cart_id) FILTER (WHERE NOT Purchase.is_fulfilled) AS incoming_order_count,
+                   COUNT(*) FILTER (WHERE NOT Purchase.is_fulfilled) AS incoming_line_count
+            FROM ProductInCart
+            JOIN Purchase ON Purchase.product_in_cart_id = ProductInCart.id
+            WHERE ProductInCart.seller_id = :seller_id
+            """,
+            seller_id=seller_id
+        )[0]
+
+    """
+    Gets the seller's orders, units sold and revenue for each of the last `days` days that had sales, most recent first
+    """
+    @staticmethod
+    def get_daily_rollup(seller_id: int, days: int = DAILY_ROLLUP_DAYS):
+        return app.db.execute(
+            """
+            SELECT Purchase.time_purchased::date AS day,
+                   COUNT(DISTINCT Purchase.cart_id) AS order_count,
+                   SUM(ProductInCart.quantity) AS item_count,
+                   SUM(ProductInCart.quantity * Purchase.final_unit_price) AS revenue
+            FROM ProductInCart
+            JOIN Purchase ON Purchase.product_in_cart_id = ProductInCart.id
+            WHERE ProductInCart.seller_id = :seller_id
+            AND Purchase.time_purchased >= :since
+            GROUP BY day
+            ORDER BY day DESC
+            """,
+            seller_id=seller_id,
+            since=(datetime.now() - timedelta(days=days - 1)).date()
+        )
+
+    """
+    Gets the seller's `limit` best selling products by revenue, with their orders, units sold and revenue
+    """
+    @staticmethod
+    def get_product_rollup(seller_id: int, limit: int = TOP_PRODUCTS):
+        return app.db.execute(
+            """
+            SELECT sales.product_id, Product.name, sales.order_count, sales.item_count, sales.revenue
+            FROM (
+                SELECT ProductInCart.product_id,
+                       COUNT(DISTINCT Purchase.cart_id) AS order_count,
+                       SUM(ProductInCart.quantity) AS item_count,
+                       SUM(ProductInCart.quantity * Purchase.final_unit_price) AS revenue
+                FROM ProductInCart
+                JOIN Purchase ON Purchase.product_in_cart_id = ProductInCart.id
+                WHERE ProductInCart.seller_id = :seller_id
+                GROUP BY ProductInCart.product_id
+                ORDER BY revenue DESC, ProductInCart.product_id
+                LIMIT :limit
+            ) AS sales
+            JOIN Product ON Product.id = sales.product_id
+            ORDER BY sales.revenue DESC, sales.product_id
+            """,
+            seller_id=seller_id,
+            limit=limit
+        )
@@ -1,11 +1,14 @@
 from flask_login import UserMixin
-from flask import current_app as app
+from flask import current_app as app, session
 from werkzeug.security import generate_password_hash, check_password_hash
 from typing import Optional
-from sqlalchemy import text
+import time
 
 from .. import login
 
+SESSION_IDENTITY_KEY = 'user_identity'
+SESSION_IDENTITY_TTL_SECONDS = 5 * 60  # how long an edit made in another browser can go unnoticed
+
 
 class User(UserMixin):
     def __init__(
@@ -93,11 +96,52 @@ RETURNING id
             return None
 
     """
-    This method is used to grab all of the user's info when given a user ID.
+    This method is used to grab a user's identity (id, email and name) when given a user ID. It comes from app.cache,
+    whose shared tier other processes can read, so the password hash, balance and address are left out (as None);
+    get_account reads all of the user's info.
     """
     @staticmethod
-    @login.user_loader
     def get(id):
+        return app.cache.get('user', int(id), User._load_identity)
+
+    """
+    This method loads the logged-in user for Flask-Login on every request. Its identity fields (not the password or
+    balance, which are left as None) are kept in the signed session cookie for SESSION_IDENTITY_TTL_SECONDS, so most
+    requests do not touch the Users table at all. Pages that show or depend on the balance read it fresh with
+    get_balance or get_account.
+    """
+    @staticmethod
+    @login.user_loader
+    def load_session_user(id):
+        identity = session.get(SESSION_IDENTITY_KEY)
+        if identity and identity['id'] == int(id) and identity['loaded_at'] + SESSION_IDENTITY_TTL_SECONDS > time.time():
+            return User(identity['id'], identity['email'], identity['first_name'], identity['last_name'],
+                        password=None, balance=None, address=None)
+        user = User.get(id)
+        if user is not None:
+            session[SESSION_IDENTITY_KEY] = {
+                'id': user.id,
+                'email': user.email,
+                'first_name': user.first_name,
+                'last_name': user.last_name,
+                'loaded_at': time.time(),
+            }
+        return user
+
+    """
+    This method drops the identity kept in the session, so that the next request reloads it (after the user edited
+    it, or logged out).
+    """
+    @staticmethod
+    def forget_session_identity():
+        session.pop(SESSION_IDENTITY_KEY, None)
+
+    """
+    This method reads all of the user's info straight from the database, bypassing the caches, for pages that show
+    the balance.
+    """
+    @staticmethod
+    def get_account(id):
         rows = app.db.execute(
             """
             SELECT id, email, first_name, last_name, password, balance, address
@@ -108,57 +152,50 @@ RETURNING id
         return User(*(rows[0])) if rows else None
 
     """
-    This method is used to determine whether the user has enough money
-    after a given amount is subtracted from their balance.
+    This method reads the user's current balance straight from the database.
     """
-    def has_enough_money(self, total_price):
+    @staticmethod
+    def get_balance(id):
         return app.db.execute(
             """
             SELECT balance
             FROM Users
             WHERE id = :id
             """,
-            id=self.id,
-        )[0][0] >= total_price
+            id=id,
+        )[0][0]
 
-    """
-    This method is used to decrease balance without committing to allow for rollback when purchasing a cart
-    """
-    def decrease_balance_without_commit(self, connection, total_price):
-        connection.execute(text(
+    @staticmethod
+    def _load_identity(id):
+        rows = app.db.execute(
             """
-            UPDATE Users
-            SET balance = balance - :total_price
-                        WHERE id = :user_id
-            """),
-            {
-                "total_price": total_price,
-                "user_id": self.id
-            },
-        )
+            SELECT id, email, first_name, last_name
+            FROM Users
+            WHERE id = :id
+            """,
+            id=id)
+        return User(*(rows[0]), password=None, balance=None, address=None) if rows else None
 
     """
-    This method is used to increase balance without committing to allow for rollback when purchasing a cart
+    This method is used to determine whether the user has enough money
+    after a given amount is subtracted from their balance.
     """
-    def increase_balance_without_commit(self, connection, total_price):
-        connection.execute(text(
+    def has_enough_money(self, total_price):
+        return app.db.execute(
             """
-            UPDATE Users
-            SET balance = balance + :total_price
-            WHERE id = :user_id
-            """),
-            {
-                "total_price": total_price,
-                "user_id": self.id
-            },
-        )
+            SELECT balance
+            FROM Users
+            WHERE id = :id
+            """,
+            id=self.id,
+        )[0][0] >= total_price
 
     """
     This method is used to subtract off a given amount from the user's balance.
     It returns the new balance.
     """
     def decrement_balance(self, amount):
-        return app.db.execute(
+        result = app.db.execute(
             """
             UPDATE Users
             SET balance = balance - :amount
@@ -169,13 +206,15 @@ RETURNING id
             id=self.id,
             amount=amount
         )[0][0]
+        app.cache.invalidate('user', self.id)
+        return result
 
     """
     This method is used to add a given amount to the user's balance.
     It returns the new balance.
     """
     def increment_balance(self, amount):
-        return app.db.execute(
+        result = app.db.execute(
             """
             UPDATE Users
             SET balance = balance + :amount
@@ -185,13 +224,15 @@ RETURNING id
             id=self.id,
             amount=amount
         )[0][0]
+        app.cache.invalidate('user', self.id)
+        return result
 
     """
     This method is used to update the user's email. It returns a boolean
     so that the update can be confirmed.
     """
     def edit_email(self, email) -> bool:
-        return app.db.execute(
+        result = app.db.execute(
             """
             UPDATE Users
             SET email = :email
@@ -200,14 +241,17 @@ RETURNING id
             """,
             id=self.id,
             email=email,
-        )[0][0] == email
+        )[0][0]
+        app.cache.invalidate('user', self.id)
+        User.forget_session_identity()
+        return result == email
 
     """
     This method is used to update the user's first name. It returns a boolean
     so that the update can be confirmed.
     """
     def edit_fname(self, first_name) -> bool:
-        return app.db.execute(
+        result = app.db.execute(
             """
             UPDATE Users
             SET first_name = :first_name
@@ -216,14 +260,17 @@ RETURNING id
             """,
             id=self.id,
             first_name=first_name,
-        )[0][0] == first_name
+        )[0][0]
+        app.cache.invalidate('user', self.id)
+        User.forget_session_identity()
+        return result == first_name
 
     """
     This method is used to update the user's last name. It returns a boolean
     so that the update can be confirmed.
     """
     def edit_lname(self, last_name) -> bool:
-        return app.db.execute(
+        result = app.db.execute(
             """
             UPDATE Users
             SET last_name = :last_name
@@ -232,14 +279,17 @@ RETURNING id
             """,
             id=self.id,
             last_name=last_name,
-        )[0][0] == last_name
+        )[0][0]
+        app.cache.invalidate('user', self.id)
+        User.forget_session_identity()
+        return result == last_name
 
     """
     This method is used to update the user's address. It returns a boolean
     so that the update can be confirmed.
     """
     def edit_address(self, address) -> bool:
-        return app.db.execute(
+        result = app.db.execute(
             """
             UPDATE Users
             SET address = :address
@@ -248,14 +298,16 @@ RETURNING id
             """,
             id=self.id,
             address = address
-        )[0][0] == address
+        )[0][0]
+        app.cache.invalidate('user', self.id)
+        return result == address
         
     """
     This method is used to update the user's password. It returns a boolean
     so that the update can be confirmed.
     """
     def edit_password(self, password) -> bool:
-        return app.db.execute(
+        result = app.db.execute(
             """
             UPDATE Users
             SET password = :password
@@ -264,7 +316,9 @@ RETURNING id
             """,
             id=self.id,
             password = generate_password_hash(password)
-        )[0][0] == self.id
+        )[0][0]
+        app.cache.invalidate('user', self.id)
+        return result == self.id
 
     """
     This method gets all of the users that are sellers and relevant information
@@ -0,0 +1,108 @@
+import queue
+import select
+import threading
+import time
+from contextlib import contextmanager
+
+
+class OrderFeed:
+    """Tells the sellers watching their incoming orders (the
+    /incoming_orders/feed stream) about each order placed with them as soon
+    as its checkout commits, so that their pages fetch just the new orders
+    instead of being reloaded.
+
+    Checkout.order_cart publishes the cart and its sellers from inside its
+    transaction.  How that reaches the watching requests depends on
+    ORDER_FEED:
+        postgres    (default) a NOTIFY on the CHANNEL channel, which Postgres
+                    delivers only if the transaction commits, to every
+                    process.  Each process runs one thread that LISTENs on a
+                    connection of its own and hands the notifications to its
+                    subscribers.
+        local       handed straight to the subscribers of this process once
+                    the transaction has committed; for tests and a single
+                    development server.
+    A subscriber is a queue of the ids of the carts ordered from its seller."""
+
+    CHANNEL = 'seller_orders'
+    LISTEN_POLL_SECONDS = 5  # how often the listener checks it is still wanted
+    RECONNECT_SECONDS = 1
+
+    def __init__(self, app):
+        self.backend = app.config.get('ORDER_FEED') or 'postgres'
+        if self.backend not in ('postgres', 'local'):
+            raise ValueError('Unsupported ORDER_FEED: ' + self.backend)
+        self._db = app.db
+        self._subscribers = {}  # seller_id -> set of queues
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def publish(self, seller_ids, cart_id):
+        """Announce that cart_id was ordered from seller_ids, once the current
+        unit of work commits."""
+        if self.backend == 'local':
+            self._db.after_commit(lambda: [self._deliver(seller_id, cart_id) for seller_id in seller_ids])
+            return
+        self._db.execute(
+            """
+            SELECT pg_notify(:channel, seller_id || ':' || :cart_id)
+            FROM unnest(:seller_ids) AS seller_id
+            """,
+            channel=self.CHANNEL,
+            seller_ids=list(seller_ids),
+            cart_id=str(cart_id)
+        )
+
+    @contextmanager
+    def subscription(self, seller_id):
+        """Yield a queue that receives the id of every cart ordered from
+        seller_id until the block exits."""
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(seller_id, set()).add(subscriber)
+            if self.backend == 'postgres' and (self._listener is None or not self._listener.is_alive()):
+                self._listener = threading.Thread(target=self._listen, name='order-feed', daemon=True)
+                self._listener.start()
+        try:
+            yield subscriber
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(seller_id, set())
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    self._subscribers.pop(seller_id, None)
+
+    def _deliver(self, seller_id, cart_id):
+        with self._lock:
+            subscribers = list(self._subscribers.get(seller_id, ()))
+        for subscriber in subscribers:
+            subscriber.put(cart_id)
+
+    def _listen(self):
+        """Listener thread: LISTEN on a connection of its own, reconnecting
+        after errors, until no request is subscribed any more."""
+        while True:
+            try:
+                raw = self._db.engine.raw_connection()
+            except Exception:
+                time.sleep(self.RECONNECT_SECONDS)
+                continue
+            try:
+                connection = raw.connection  # the psycopg2 connection
+                connection.autocommit = True
+                connection.cursor().execute('LISTEN ' + self.CHANNEL)
+                while True:
+                    with self._lock:
+                        if not self._subscribers:
+                            self._listener = None
+                            return
+                    if select.select([connection], [], [], self.LISTEN_POLL_SECONDS) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        seller_id, cart_id = connection.notifies.pop(0).payload.split(':')
+                        self._deliver(int(seller_id), int(cart_id))
+            except Exception:
+                time.sleep(self.RECONNECT_SECONDS)
+            finally:
+                raw.invalidate()  # the connection is LISTENing and in autocommit, do not pool it
@@ -1,18 +1,26 @@
+import queue
+import time
+
 from app.models.purchase import Purchase
 from flask_login import current_user
-from flask import render_template, redirect, url_for, request
+from flask import render_template, redirect, url_for, request, flash, jsonify, Response, current_app, \
+    get_template_attribute
 from flask_wtf import FlaskForm
 from wtforms import SelectField, SubmitField
 from wtforms.validators import ValidationError, DataRequired
 from flask_babel import _, lazy_gettext as _l
-from datetime import datetime, timedelta
 
 from .models.cart import Cart
+from .models.seller_dashboard import SellerDashboard
+from .errors import NOTHING_TO_FULFILL, PURCHASES_FULFILLED
 
 from flask import Blueprint
 
 bp = Blueprint('order', __name__)
 
+FEED_HEARTBEAT_SECONDS = 15
+FEED_MAX_SECONDS = 5 * 60  # how long one feed request may hold its worker thread before the browser reconnects
+
 
 @bp.route('/view_orders')
 def view_orders():
@@ -21,15 +29,14 @@ def view_orders():
     """
 
     if current_user.is_authenticated:
-        page_num = int(request.args.get('page', default=1))
+        cursor = request.args.get('cursor')
 
         # need all past carts
-        purchased_carts = Cart.get_purchased_carts(current_user.id, page_num)
+        purchased_carts = Cart.get_purchased_carts(current_user.id, cursor)
 
         return render_template(
             'orders.html',
-            purchased_carts=purchased_carts,
-            page_num=page_num
+            purchased_carts=purchased_carts
         )
     return redirect(url_for('users.login'))
 
@@ -64,7 +71,7 @@ def filters_for_orders():
             fulfill = form.fulfill.data
             time_period = form.time_period.data
             return redirect(url_for('order.filtered_orders', 
-            fulfill=fulfill, time_period=time_period, page = 1))
+            fulfill=fulfill, time_period=time_period))
         return render_template('order_filters.html', form=form)
     return redirect(url_for('users.login'))
 
@@ -74,81 +81,153 @@ This method filters the purchase history and displays it to the user.
 @bp.route('/filtered_orders/')
 def filtered_orders():
     if current_user.is_authenticated:
-        page_num = int(request.args.get('page'))
+        cursor = request.args.get('cursor')
         fulfill = request.args.get('fulfill')
         time_period = request.args.get('time_period')
 
-        # need all past carts
-        purchased_carts = Cart.get_purchased_carts(current_user.id, page_num)
-
-        #Filtering for fulfilled carts
-        if fulfill == '1':
-            fulfilled_carts = []
-            for some_cart in purchased_carts:
-                if some_cart.is_fulfilled:
-                    fulfilled_carts.append(some_cart)
-            purchased_carts = fulfilled_carts
-        #Filtering for unfulfilled carts
-        elif fulfill == '2':
-            unfulfilled_carts = []
-            for some_cart in purchased_carts:
-                if not some_cart.is_fulfilled:
-                    unfulfilled_carts.append(some_cart)
-            purchased_carts = unfulfilled_carts
-        elif fulfill == '0':
-            purchased_carts = purchased_carts
-        
-        if time_period != '0':
-            recent_carts = []
-            for some_cart in purchased_carts:
-                #If the time that has elapsed between when the cart was purchased
-                #and now is less than the time given, add the cart
-                time_now = datetime.now()
-                elapsed_time = time_now - some_cart.time_purchased
-                recent_time = timedelta(days = int(time_period))
-                if elapsed_time <= recent_time:
-                    recent_carts.append(some_cart)
-            purchased_carts = recent_carts
-        elif time_period == '0':
-            purchased_carts = purchased_carts
-            
+        # "1" keeps the fulfilled carts and "2" the unfulfilled ones; a time period is a number of days
+        fulfilled = {'1': True, '2': False}.get(fulfill)
+        purchased_within_days = int(time_period) if time_period in ('1', '2', '5', '10') else None
+
+        purchased_carts = Cart.get_filtered_purchased_carts(
+            current_user.id,
+            fulfilled=fulfilled,
+            purchased_within_days=purchased_within_days,
+            cursor=cursor
+        )
+
         return render_template(
             'filtered_orders.html',
             purchased_carts=purchased_carts,
-            page_num=page_num,
+            page=purchased_carts,
             fulfill=fulfill,
             time_period=time_period
         )
     return redirect(url_for('users.login'))
 
+"""
+This method shows a seller the totals of their sales: overall, for each of the last days and for their best selling
+products
+"""
+@bp.route('/seller_dashboard', methods=['GET'])
+def seller_dashboard():
+    if not current_user.is_authenticated:
+        return redirect(url_for('index.index'))
+
+    return render_template(
+            'seller_dashboard.html',
+            summary=SellerDashboard.get_summary(current_user.id),
+            daily_rollup=SellerDashboard.get_daily_rollup(current_user.id),
+            product_rollup=SellerDashboard.get_product_rollup(current_user.id))
+
+"""
+These methods show a seller one page of their orders with lines still to fulfill, or with fulfilled lines
+"""
 @bp.route('/incoming_orders', methods=['GET'])
 def incoming_orders():
     if not current_user.is_authenticated:
         return redirect(url_for('index.index'))
 
-    orders = Purchase.get_seller_incoming_orders(current_user.id)
+    cursor = request.args.get('cursor')
+    orders = SellerDashboard.get_orders(current_user.id, 'incoming', cursor)
+
+    # the first page follows the order feed, fetching the orders that come in after its newest one
+    new_orders_cursor = None
+    if not cursor:
+        new_orders_cursor = SellerDashboard.new_orders_cursor(orders[0].time_purchased, orders[0].cart_id) \
+            if orders else ''
 
     return render_template(
             'incoming_orders.html',
-            incoming_orders=orders)
+            incoming_orders=orders,
+            new_orders_cursor=new_orders_cursor)
+
+"""
+This method streams the ids of the carts ordered from the seller, as server-sent events, as soon as their checkouts
+commit (see app/order_feed.py). A comment is sent every FEED_HEARTBEAT_SECONDS to keep the connection open. The stream
+holds a worker thread while it is open, so it ends after FEED_MAX_SECONDS and the browser's EventSource opens a new one
+"""
+@bp.route('/incoming_orders/feed', methods=['GET'])
+def incoming_orders_feed():
+    if not current_user.is_authenticated:
+        return redirect(url_for('index.index'))
+
+    seller_id = current_user.id
+    order_feed = current_app.order_feed
+
+    def stream():
+        deadline = time.monotonic() + FEED_MAX_SECONDS
+        with order_feed.subscription(seller_id) as ordered_carts:
+            yield 'retry: 5000\n\n'
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    cart_id = ordered_carts.get(timeout=min(FEED_HEARTBEAT_SECONDS, remaining))
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield 'event: order\ndata: {}\n\n'.format(cart_id)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+"""
+This method returns, as JSON, the seller's incoming orders that came in after the `since` cursor or are in the cart_id
+carts the feed announced, each rendered as rows of the incoming orders table, the cursor to pass next time, and
+whether more new orders are waiting to be fetched with it
+"""
+@bp.route('/incoming_orders/new', methods=['GET'])
+def new_incoming_orders():
+    if not current_user.is_authenticated:
+        return redirect(url_for('index.index'))
+
+    orders, since, more = SellerDashboard.get_new_orders(
+        current_user.id, request.args.get('since'), request.args.getlist('cart_id', type=int))
+    incoming_order = get_template_attribute('incoming_order.html', 'incoming_order')
+
+    return jsonify(
+            since=since,
+            more=more,
+            orders=[{'cart_id': order.cart_id, 'html': str(incoming_order(order))} for order in orders])
 
 @bp.route('/fulfilled_orders', methods=['GET'])
 def fulfilled_orders():
     if not current_user.is_authenticated:
         return redirect(url_for('index.index'))
 
-    orders = Purchase.get_seller_fulfilled_orders(current_user.id)
+    orders = SellerDashboard.get_orders(current_user.id, 'fulfilled', request.args.get('cursor'))
 
     return render_template(
             'fulfilled_orders.html',
             fulfilled_orders=orders)
 
 
-@bp.route('/order/fulfill/<id>/<cart_id>', methods=['POST'])
-def fulfill(id, cart_id):
+"""
+This method fulfills one of the seller's purchases
+"""
+@bp.route('/order/fulfill/<int:id>', methods=['POST'])
+def fulfill(id):
+    if not current_user.is_authenticated:
+        return redirect(url_for('index.index'))
+
+    Purchase.mark_as_fulfilled(current_user.id, [id])
+
+    return redirect(request.referrer or url_for('order.incoming_orders'))
+
+"""
+This method fulfills all the purchases the seller selected (the product_in_cart_id fields of the form) at once
+"""
+@bp.route('/order/fulfill', methods=['POST'])
+def fulfill_selected():
     if not current_user.is_authenticated:
         return redirect(url_for('index.index'))
-    
-    Purchase.mark_as_fulfilled(id, cart_id)
 
-    return redirect(url_for('order.incoming_orders'))
+    product_in_cart_ids = request.form.getlist('product_in_cart_id', type=int)
+    if not product_in_cart_ids:
+        flash(NOTHING_TO_FULFILL)
+    else:
+        flash(PURCHASES_FULFILLED.format(Purchase.mark_as_fulfilled(current_user.id, product_in_cart_ids)))
+
+    return redirect(request.referrer or url_for('order.incoming_orders'))
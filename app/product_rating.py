@@ -31,9 +31,10 @@ def view_reviews():
         seller_reviews, reviewed_seller_ids, reviewed_seller_names = [], [], []
 
         # Gets all the reviews from the databases by calling appropriate functions, and formats them correctly
+        reviewed_products = p.get_many([review.product_id for review in reviews if review.product_id != -1])
         for review in reviews:
             if review.product_id != -1:
-                reviewed_product_names.append(p.get(review.product_id).name)
+                reviewed_product_names.append(reviewed_products[review.product_id].name)
                 reviewed_product_ids.append(review.product_id)
                 product_reviews.append(review)
             else:
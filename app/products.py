@@ -8,78 +8,75 @@ from .models.user import User
 from flask import Blueprint
 bp = Blueprint('products', __name__)
 
-product_sellers = {1: 'Beyu Blue', 2: 'The Loop', 3: 'McDonalds', 4: 'Panda Express', 5: 'Il Forno',
-                   6: 'Sazón'}
-
 @bp.route('/product', methods=['GET'])
 def view_product():
     vender_id = int(request.args.get('id'))
-    page_num = int(request.args.get('page'))
-    products = Product.get_specific(vender_id, page_num)
+    cursor = request.args.get('cursor')
+    products = Product.get_specific(vender_id, cursor)
     categories = Product.get_categories()
     average_ratings = ProductReview.get_average_rating([product.id for product in products], "product")
-    return render_template('product.html', vender_id=vender_id, product_sellers=product_sellers, 
+    return render_template('product.html', vender_id=vender_id, product_sellers=Product.get_seller_affiliations(), 
                             avail_products=products, categories=categories, average_ratings=average_ratings,
-                            page_num=page_num, pag_tag="/product?id=" + str(vender_id) + "&page=", max_pages=len(products))
+                            pag_tag="/product?id=" + str(vender_id) + "&cursor=")
 
 @bp.route('/filter', methods=['GET'])
 def filtered_cat():
     vender_id = int(request.args.get('id'))
-    page_num = int(request.args.get('page'))
+    cursor = request.args.get('cursor')
     spec_category = request.args.get('cat')
-    products = Product.filteredCat(vender_id, spec_category, page_num)
+    products = Product.filteredCat(vender_id, spec_category, cursor)
     categories = Product.get_categories()
     average_ratings = ProductReview.get_average_rating([product.id for product in products], "product")
-    return render_template('product.html', vender_id=vender_id, product_sellers=product_sellers, 
+    return render_template('product.html', vender_id=vender_id, product_sellers=Product.get_seller_affiliations(), 
                             avail_products=products, categories=categories, average_ratings=average_ratings,
-                            page_num=page_num, pag_tag="/filter?id=" + str(vender_id) + "&cat=" + spec_category + "&page=", max_pages=len(products))
+                            pag_tag="/filter?id=" + str(vender_id) + "&cat=" + spec_category + "&cursor=")
 
 @bp.route('/filter-price', methods=['GET'])
 def filtered_price():
     vender_id = int(request.args.get('id'))
-    page_num = int(request.args.get('page'))
-    products = Product.filteredPrice(vender_id, page_num)
+    cursor = request.args.get('cursor')
+    products = Product.filteredPrice(vender_id, cursor)
     categories = Product.get_categories()
     average_ratings = ProductReview.get_average_rating([product.id for product in products], "product")
-    return render_template('product.html', vender_id=vender_id, product_sellers=product_sellers, 
+    return render_template('product.html', vender_id=vender_id, product_sellers=Product.get_seller_affiliations(), 
                             avail_products=products, categories=categories, average_ratings=average_ratings,
-                            page_num=page_num, pag_tag="/filter-price?id=" + str(vender_id) + "&page=", max_pages=len(products))  
+                            pag_tag="/filter-price?id=" + str(vender_id) + "&cursor=")  
 
 @bp.route('/filter-rat', methods=['GET'])
 def filtered_rating():
     vender_id = int(request.args.get('id'))
-    page_num = int(request.args.get('page'))
+    cursor = request.args.get('cursor')
     stars = int(request.args.get('stars'))
-    products = Product.filteredRating(stars, page_num)
+    products = Product.filteredRating(stars, cursor)
     categories = Product.get_categories()
     average_ratings = ProductReview.get_average_rating([product.id for product in products], "product")
-    return render_template('product.html', vender_id=vender_id, product_sellers=product_sellers, 
+    return render_template('product.html', vender_id=vender_id, product_sellers=Product.get_seller_affiliations(), 
                             avail_products=products, categories=categories, average_ratings=average_ratings,
-                            page_num=page_num, pag_tag="/filter-rat?id=" + str(vender_id) + "&stars=" + str(stars) + "&page=", max_pages=len(products)) 
+                            pag_tag="/filter-rat?id=" + str(vender_id) + "&stars=" + str(stars) + "&cursor=") 
 
 @bp.route('/search', methods=['GET'])
 def search_filter():
     vender_id = int(request.args.get('id'))
-    page_num = int(request.args.get('page'))
+    cursor = request.args.get('cursor')
     search = request.args.get('search')
-    products = Product.search_filter(search, page_num)
+    products = Product.search_filter(search, cursor)
     categories = Product.get_categories()
     average_ratings = ProductReview.get_average_rating([product.id for product in products], "product")
-    return render_template('product.html', vender_id=vender_id, product_sellers=product_sellers, 
+    return render_template('product.html', vender_id=vender_id, product_sellers=Product.get_seller_affiliations(), 
                             avail_products=products, categories=categories, average_ratings=average_ratings,
-                            page_num=page_num, pag_tag="/search?id=" + str(vender_id) + "&search=" + search + "&page=", max_pages=len(products))   
+                            pag_tag="/search?id=" + str(vender_id) + "&search=" + search + "&cursor=")   
 
 @bp.route('/id-search', methods=['GET'])
 def search_id():
     vender_id = int(request.args.get('id'))
-    page_num = int(request.args.get('page'))
+    cursor = request.args.get('cursor')
     search = request.args.get('search')
-    products = Product.search_id(search, page_num)
+    products = Product.search_id(search, cursor)
     categories = Product.get_categories()
     average_ratings = ProductReview.get_average_rating([product.id for product in products], "product")
-    return render_template('product.html', vender_id=vender_id, product_sellers=product_sellers, 
+    return render_template('product.html', vender_id=vender_id, product_sellers=Product.get_seller_affiliations(), 
                             avail_products=products, categories=categories, average_ratings=average_ratings,
-                            page_num=page_num, pag_tag="/id-search?id=" + str(vender_id) + "&search=" + search + "&page=", max_pages=len(products))  
+                            pag_tag="/id-search?id=" + str(vender_id) + "&search=" + search + "&cursor=")  
 
 @bp.route('/view', methods=['GET'])
 def ind_view():
@@ -94,7 +91,7 @@ def ind_view():
         user_review_reports = ProductReview.get_user_review_reports(current_user.id)
         user_product_reports = [(user_review_report[1], user_review_report[2]) for user_review_report in user_review_reports]
     return render_template('ind_prod.html', product_info=product, sellers=sellers, 
-                            product_sellers=product_sellers, reviews=reviews,
+                            product_sellers=Product.get_seller_affiliations(), reviews=reviews,
                             summary_ratings=summary_ratings, upvote_exists=upvote_exists,
                             user_product_reports=user_product_reports)
     
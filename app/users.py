@@ -7,8 +7,8 @@ from wtforms.validators import ValidationError, DataRequired, Email, EqualTo, Nu
 from flask_babel import _, lazy_gettext as _l
 
 from .models.user import User
+from .models.product import Product
 from .models.product_review import ProductReview
-from .products import product_sellers
 
 from flask import Blueprint
 bp = Blueprint('users', __name__)
@@ -114,6 +114,7 @@ After logging out, the user is redirected to the home page.
 @bp.route('/logout')
 def logout():
     logout_user()
+    User.forget_session_identity()
     return redirect(url_for('index.index'))
 
 """
@@ -122,7 +123,7 @@ This method allows a logged-in user to view their account information page.
 @bp.route('/view_account')
 def view_account():
     if current_user.is_authenticated:
-        return render_template('edit_acct_info/account.html')
+        return render_template('edit_acct_info/account.html', account=User.get_account(current_user.id))
     return redirect(url_for('users.login'))
 
 """
@@ -150,7 +151,7 @@ def view_public_profile(public_user_id):
             return render_template(
                 'public_seller_profile.html',
                 seller = User.get_seller_info(public_user_id),
-                product_sellers = product_sellers,
+                product_sellers = Product.get_seller_affiliations(),
                 reviews=reviews,
                 summary_ratings=summary_ratings,
                 upvote_exists=upvote_exists,
@@ -0,0 +1,45 @@
+"""
+One-off job that stores the total, item count and discount of the orders bought before migration 0007 on their Cart
+rows, in batches (committing after each one) so that it can run while the site is up.
+
+Run it once after upgrading the database:
+    python backfill_order_totals.py
+It can be stopped and started again at any time; it picks up the orders that still have no total.
+"""
+import argparse
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv('.flaskenv')
+
+from app import create_app  # noqa: E402 (needs the environment loaded above)
+from app.models.cart import Cart, ORDER_TOTALS_BATCH_SIZE  # noqa: E402
+
+
+def backfill(app, batch_size, pause):
+    totalled = 0
+    with app.app_context():
+        while True:
+            count = Cart.backfill_order_totals(batch_size)
+            app.db.commit()
+            totalled += count
+            if count < batch_size:
+                break
+            time.sleep(pause)  # let other work in between batches
+
+    print('totalled {} order{}'.format(totalled, '' if totalled == 1 else 's'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=ORDER_TOTALS_BATCH_SIZE,
+                        help='how many orders to total per transaction')
+    parser.add_argument('--pause', type=float, default=0.1, help='seconds to wait between batches')
+    args = parser.parse_args()
+
+    backfill(create_app(), args.batch_size, args.pause)
+
+
+if __name__ == '__main__':
+    main()
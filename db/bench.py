@@ -0,0 +1,51 @@
+"""
+Helpers shared by the benchmark scripts in this directory (bench_*.py).
+
+Benchmarks build their data in a scratch schema that shadows the real tables through the search_path, so the model code
+under test runs unchanged against it, and drop the schema again when they are done.
+"""
+from contextlib import contextmanager
+import time
+
+
+@contextmanager
+def scratch_schema(app, name, keep=False):
+    """Create schema name and put it first on the search_path of the current app context's connection for the
+    duration of the block. The schema is dropped afterwards unless keep is set."""
+    app.db.execute_with_no_return('DROP SCHEMA IF EXISTS ' + name + ' CASCADE')
+    app.db.execute_with_no_return('CREATE SCHEMA ' + name)
+    app.db.execute_with_no_return('SET search_path TO ' + name + ', public')
+    app.db.commit()
+    try:
+        yield
+    finally:
+        app.db.rollback()
+        app.db.execute_with_no_return('SET search_path TO public')
+        if not keep:
+            app.db.execute_with_no_return('DROP SCHEMA ' + name + ' CASCADE')
+        app.db.commit()
+
+
+def latencies(run, inputs):
+    """Call run(x) for every x in inputs and return how long each call took, in milliseconds."""
+    samples = []
+    for x in inputs:
+        start = time.perf_counter()
+        run(x)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentile(samples, p):
+    """The p-th percentile (0-100) of samples, by the nearest-rank method."""
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def report(rows):
+    """Print a table of (name, samples) rows with their p50, p99 and mean latency."""
+    print('{:<28} {:>10} {:>10} {:>10}'.format('', 'p50 (ms)', 'p99 (ms)', 'mean (ms)'))
+    for name, samples in rows:
+        print('{:<28} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+            name, percentile(samples, 50), percentile(samples, 99), sum(samples) / len(samples)))
@@ -0,0 +1,102 @@
+"""
+Benchmark of the featured coupon on the index page: Coupon.get_random_coupon against the query it replaced, which
+fetched every valid coupon into Python to pick one.
+
+Builds a Coupon table of generated coupons (1M by default, about half of them expired) in a scratch schema, with
+products and sellers for them to name, then times picking a random coupon both ways. The new sampler is timed twice:
+with its pool of valid codes already sampled (as for every request but one per COUPON_POOL_TTL_SECONDS), and with the
+pool resampled on every call.
+
+Run it from the repository root against a database created with create.sql:
+    python -m db.bench_coupons --coupons 1000000 --picks 200
+"""
+import argparse
+import datetime
+import random
+
+from dotenv import load_dotenv
+
+load_dotenv('.flaskenv')
+
+from app import create_app  # noqa: E402 (needs the environment loaded above)
+from app.models import metadata_cache  # noqa: E402
+from app.models.coupon import Coupon  # noqa: E402
+from db.bench import scratch_schema, latencies, report  # noqa: E402
+
+# the query get_random_coupon used before, whose rows were handed to random.choice
+LEGACY_RANDOM_COUPON = '''
+SELECT code, expiration_date, product_id, seller_id, percent_off
+FROM Coupon
+WHERE expiration_date >= :now
+'''
+
+
+def build_coupons(app, count):
+    for table in ['Users', 'Product', 'Coupon']:
+        app.db.execute_with_no_return('CREATE TABLE ' + table + ' (LIKE public.' + table + ' INCLUDING ALL)')
+    app.db.execute_with_no_return(
+        """
+        INSERT INTO Users(id, email, password, first_name, last_name, balance, address)
+        SELECT n, 'seller' || n || '@example.com', 'x', 'First', 'Last', 0, ''
+        FROM generate_series(1, 1000) AS n
+        """
+    )
+    app.db.execute_with_no_return(
+        """
+        INSERT INTO Product(id, name, description, category, price, is_available, creator_id, image)
+        SELECT n, 'Product ' || n, '', 'Sides', 5, True, 1, 'na.png'
+        FROM generate_series(1, 10000) AS n
+        """
+    )
+    # expiration dates spread over the 60 days around today, so about half have expired
+    app.db.execute_with_no_return(
+        """
+        INSERT INTO Coupon(code, expiration_date, product_id, seller_id, percent_off)
+        SELECT md5(n::text), now() + (random() * 60 - 30) * interval '1 day', 1 + n % 10000, 1 + n % 1000, 50
+        FROM generate_series(1, :count) AS n
+        """,
+        count=count
+    )
+    for table in ['Users', 'Product', 'Coupon']:
+        app.db.execute_with_no_return('ANALYZE ' + table)
+    app.db.commit()
+
+
+def legacy_random_coupon(app):
+    rows = app.db.execute(LEGACY_RANDOM_COUPON, now=datetime.datetime.now())
+    return random.choice(rows)
+
+
+def resampled_random_coupon():
+    metadata_cache.invalidate(metadata_cache.COUPON_POOL)
+    return Coupon.get_random_coupon()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--coupons', type=int, default=1000000, help='number of coupons to generate')
+    parser.add_argument('--picks', type=int, default=200, help='number of random coupons to time')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch schema afterwards')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context(), scratch_schema(app, 'bench_coupons', keep=args.keep):
+        print('Generating {} coupons...'.format(args.coupons))
+        build_coupons(app, args.coupons)
+
+        picks = range(args.picks)
+        # warm up the buffer cache for both
+        legacy_random_coupon(app)
+        resampled_random_coupon()
+
+        legacy = latencies(lambda _: legacy_random_coupon(app), picks)
+        resampled = latencies(lambda _: resampled_random_coupon(), picks)
+        pooled = latencies(lambda _: Coupon.get_random_coupon(), picks)
+        app.db.rollback()
+
+    report([('fetch all valid (before)', legacy), ('resample pool every call', resampled),
+            ('pooled (after)', pooled)])
+
+
+if __name__ == '__main__':
+    main()
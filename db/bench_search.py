@@ -0,0 +1,107 @@
+"""
+Benchmark of product search: Product.search_filter against the LIKE query it replaced.
+
+Builds a catalog of generated products (1M by default) in a scratch schema with the same columns and search indexes as
+Product, then runs the same set of search terms (whole words, word prefixes, misspelled words and inner substrings of
+names) through both queries and prints their p50/p99 latencies.
+
+Run it from the repository root against a migrated database (db/setup.sh, or `cd db && alembic upgrade head`):
+    python -m db.bench_search --products 1000000 --queries 200
+"""
+import argparse
+import random
+
+from dotenv import load_dotenv
+
+load_dotenv('.flaskenv')
+
+from app import create_app  # noqa: E402 (needs the environment loaded above)
+from app.models.product import Product  # noqa: E402
+from db.bench import scratch_schema, latencies, report  # noqa: E402
+
+WORDS = ['spicy', 'chicken', 'burger', 'vegan', 'salad', 'grilled', 'cheese', 'pepperoni', 'pizza', 'mango',
+         'smoothie', 'iced', 'coffee', 'latte', 'chocolate', 'chip', 'cookie', 'garlic', 'bread', 'tofu', 'noodle',
+         'bowl', 'orange', 'sesame', 'teriyaki', 'beef', 'burrito', 'black', 'bean', 'soup', 'tomato', 'basil',
+         'pesto', 'pasta', 'caesar', 'wrap', 'strawberry', 'lemonade', 'matcha', 'bagel', 'cream', 'waffle', 'fries',
+         'sweet', 'potato', 'honey', 'mustard', 'turkey', 'avocado', 'toast']
+
+# the query search_filter used before it was backed by indexes
+LEGACY_SEARCH = '''
+SELECT DISTINCT id, name, description, category, price, is_available, creator_id, image
+FROM Product
+WHERE LOWER(name) LIKE '%' || :search || '%' OR UPPER(name) LIKE '%' || :search || '%' OR name LIKE '%' || :search || '%'
+LIMIT 20
+OFFSET ((:page_num - 1) * 20)
+'''
+
+
+def random_words(count):
+    pick = "words[1 + floor(random() * cardinality(words))::int]"
+    return " || ' ' || ".join([pick] * count)
+
+
+def build_catalog(app, count):
+    app.db.execute_with_no_return(
+        'CREATE TABLE Product (LIKE public.Product INCLUDING DEFAULTS INCLUDING GENERATED)')
+    app.db.execute_with_no_return(
+        """
+        INSERT INTO Product(id, name, description, category, price, is_available, creator_id, image)
+        SELECT n, initcap(""" + random_words(3) + """), """ + random_words(10) + """,
+               (ARRAY['Appetizers', 'Entrées', 'Sides', 'Desserts', 'Beverages'])[1 + n % 5],
+               round((1 + random() * 20)::numeric, 2), True, 0, 'na.png'
+        FROM generate_series(1, :count) AS n, (SELECT CAST(:words AS TEXT[]) AS words) AS word_list
+        """,
+        count=count,
+        words=WORDS
+    )
+    app.db.execute_with_no_return('CREATE INDEX ON Product USING GIN (search_vector)')
+    app.db.execute_with_no_return('CREATE INDEX ON Product USING GIN (name gin_trgm_ops)')
+    app.db.execute_with_no_return('ANALYZE Product')
+    app.db.commit()
+
+
+def search_terms(count, seed):
+    rng = random.Random(seed)
+    terms = []
+    for i in range(count):
+        word = rng.choice(WORDS)
+        kind = i % 4
+        if kind == 1:  # prefix, as typed so far
+            word = word[:max(3, len(word) - 2)]
+        elif kind == 2:  # one letter wrong
+            position = rng.randrange(len(word))
+            word = word[:position] + rng.choice('aeioustr') + word[position + 1:]
+        elif kind == 3:  # inside a word
+            word = word[1:-1] if len(word) > 4 else word
+        terms.append(word)
+    return terms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=1000000, help='number of products to generate')
+    parser.add_argument('--queries', type=int, default=200, help='number of search terms to time')
+    parser.add_argument('--seed', type=int, default=316, help='seed for picking the search terms')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch schema afterwards')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context(), scratch_schema(app, 'bench_search', keep=args.keep):
+        print('Generating {} products...'.format(args.products))
+        build_catalog(app, args.products)
+
+        terms = search_terms(args.queries, args.seed)
+        # warm up the cache so both queries are measured against the same buffer state
+        for term in terms[:10]:
+            app.db.execute(LEGACY_SEARCH, search=term, page_num=1)
+            Product.search_filter(term)
+
+        legacy = latencies(lambda term: app.db.execute(LEGACY_SEARCH, search=term, page_num=1), terms)
+        ranked = latencies(lambda term: Product.search_filter(term), terms)
+        app.db.rollback()
+
+    report([('LIKE (before)', legacy), ('full-text + trigram (after)', ranked)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+Regression check that the hot model queries are answered through an index.
+
+Copies the tables (with all their indexes, i.e. as migrated) into a scratch schema, fills them with generated data of
+realistic shape, and then calls each model method under check with app.db.execute swapped for a version that EXPLAINs
+the statement instead of running it. Every plan must read the table under check through an index (an Index, Index
+Only or Bitmap Index Scan) rather than a sequential scan. Exits non-zero if any of them does not.
+
+Run it from the repository root against a migrated database (db/setup.sh, or `cd db && alembic upgrade head`):
+    python -m db.check_indexes --scale 1
+"""
+import argparse
+import sys
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv('.flaskenv')
+
+from app import create_app  # noqa: E402 (needs the environment loaded above)
+from app.models.cart import Cart  # noqa: E402
+from app.models.coupon import Coupon  # noqa: E402
+from app.models.inventory import InventoryEntry  # noqa: E402
+from app.models.product import Product  # noqa: E402
+from app.models.product_review import ProductReview  # noqa: E402
+from app.models.purchase import Purchase  # noqa: E402
+from app.models.seller_dashboard import SellerDashboard  # noqa: E402
+from app.models.user import User  # noqa: E402
+from db.bench import scratch_schema  # noqa: E402
+
+TABLES = ['Users', 'Product', 'Sells', 'Coupon', 'Cart', 'ProductInCart', 'Purchase', 'Feedback']
+
+INDEX_SCANS = {'Index Scan', 'Index Only Scan', 'Bitmap Index Scan', 'Bitmap Heap Scan'}
+
+# ids below are picked from the middle of the generated ranges
+USER_ID = 1234
+SELLER_ID = 123
+PRODUCT_ID = 4321
+CART_ID = 54321
+SELLER_AFFILIATION = 3
+
+# (what is checked, table that must be read through an index, model call issuing the query)
+CHECKS = [
+    ('Cart.get_id_of_current_cart', 'cart', lambda: Cart.get_id_of_current_cart(USER_ID)),
+    ('Cart.get_purchased_carts', 'cart', lambda: Cart.get_purchased_carts(USER_ID)),
+    ('Cart.get_filtered_purchased_carts', 'cart',
+     lambda: Cart.get_filtered_purchased_carts(USER_ID, fulfilled=False, purchased_within_days=10)),
+    ('Cart.get_products_in_cart', 'productincart',
+     lambda: Cart(CART_ID, USER_ID, False).get_products_in_cart(paginated=True)),
+    ('Cart.is_product_by_seller_in_cart', 'productincart',
+     lambda: Cart(CART_ID, USER_ID, True).is_product_by_seller_in_cart(PRODUCT_ID, SELLER_ID)),
+    ('Purchase.get_by_cart', 'purchase', lambda: Purchase.get_by_cart(CART_ID, paginated=True)),
+    ('SellerDashboard.get_orders (incoming)', 'purchase',
+     lambda: SellerDashboard.get_orders(SELLER_ID, 'incoming')),
+    ('SellerDashboard.get_orders (fulfilled)', 'purchase',
+     lambda: SellerDashboard.get_orders(SELLER_ID, 'fulfilled')),
+    ('SellerDashboard.get_daily_rollup', 'productincart', lambda: SellerDashboard.get_daily_rollup(SELLER_ID)),
+    ('Product.get_specific', 'sells', lambda: Product.get_specific(SELLER_AFFILIATION)),
+    ('InventoryEntry.get_all_entries_by_seller', 'sells',
+     lambda: InventoryEntry.get_all_entries_by_seller(None, seller_id=SELLER_ID)),
+    ('User.get_sellers', 'sells', lambda: User.get_sellers(PRODUCT_ID)),
+    ('ProductReview.get_reviews (product)', 'feedback', lambda: ProductReview.get_reviews(PRODUCT_ID, 'product')),
+    ('ProductReview.get_reviews (seller)', 'feedback', lambda: ProductReview.get_reviews(SELLER_ID, 'seller')),
+    ('Coupon.get_current_coupon_for_product_seller', 'coupon',
+     lambda: Coupon.get_current_coupon_for_product_seller(PRODUCT_ID, SELLER_ID)),
+    ('Coupon.get_current_coupons_for_product_sellers', 'coupon',
+     lambda: Coupon.get_current_coupons_for_product_sellers([(PRODUCT_ID + k, SELLER_ID + k) for k in range(20)])),
+]
+
+
+def generate_data(app, scale):
+    users, products, carts = 20000 * scale, 20000 * scale, 200000 * scale
+    for table in TABLES:
+        app.db.execute_with_no_return(
+            'CREATE TABLE ' + table + ' (LIKE public.' + table + ' INCLUDING ALL)')
+
+    statements = [
+        """
+        INSERT INTO Users(id, email, password, first_name, last_name, balance, address)
+        SELECT n, 'user' || n || '@example.com', 'x', 'First', 'Last', 100, ''
+        FROM generate_series(1, :users) AS n
+        """,
+        """
+        INSERT INTO Product(id, name, description, category, price, is_available, creator_id, image)
+        SELECT n, 'Product ' || n, 'Description of product ' || n,
+               (ARRAY['Appetizers', 'Entrées', 'Sides', 'Desserts', 'Beverages'])[1 + n % 5],
+               round((1 + random() * 20)::numeric, 2), True, 1 + n % 1000, 'na.png'
+        FROM generate_series(1, :products) AS n
+        """,
+        # every product is sold by 3 of the first 1000 users; a seller belongs to one of the 6 venues
+        """
+        INSERT INTO Sells(seller_affiliation, seller_id, product_id, inventory, is_available)
+        SELECT 1 + seller_id % 6, seller_id, n, 100, random() < 0.9
+        FROM generate_series(1, :products) AS n,
+             LATERAL (SELECT 1 + (n * 7 + k * 13) % 1000 AS seller_id FROM generate_series(0, 2) AS k) AS sellers
+        """,
+        """
+        INSERT INTO Coupon(code, expiration_date, product_id, seller_id, percent_off)
+        SELECT 'CODE' || n, now() + (n % 30 - 20) * interval '1 day', 1 + n % :products, 1 + (n * 7) % 1000, 50
+        FROM generate_series(1, :products * 5) AS n
+        """,
+        # the first :users carts are the users' current carts, the rest past orders
+        """
+        INSERT INTO Cart(id, user_id, is_current, time_purchased, is_fulfilled)
+        SELECT n, 1 + n % :users, n <= :users,
+               CASE WHEN n > :users THEN now() - n * interval '1 minute' END, random() < 0.5
+        FROM generate_series(1, :carts) AS n
+        """,
+        """
+        INSERT INTO ProductInCart(id, cart_id, product_id, seller_id, quantity)
+        SELECT (c - 1) * 3 + k + 1, c, 1 + (c * 31 + k) % :products, 1 + (c * 17 + k) % 1000, 1 + k
+        FROM generate_series(1, :carts) AS c, generate_series(0, 2) AS k
+        """,
+        """
+        INSERT INTO Purchase(product_in_cart_id, user_id, time_purchased, is_fulfilled, cart_id, final_unit_price,
+                             seller_id)
+        SELECT ProductInCart.id, Cart.user_id, Cart.time_purchased, Cart.is_fulfilled, Cart.id, 5,
+               ProductInCart.seller_id
+        FROM ProductInCart
+        JOIN Cart ON Cart.id = ProductInCart.cart_id
+        WHERE NOT Cart.is_current
+        """,
+        # half product reviews (seller_id = -1), half seller reviews (product_id = -1)
+        """
+        INSERT INTO Feedback(reviewer_id, rating, review, product_id, seller_id, upvotes, reports)
+        SELECT 1 + n % :users, 1 + n % 5, 'review',
+               CASE WHEN n % 2 = 0 THEN 1 + (n / :users) * 97 % :products ELSE -1 END,
+               CASE WHEN n % 2 = 1 THEN 1 + (n / :users) * 89 % 1000 ELSE -1 END,
+               n % 50, 0
+        FROM generate_series(1, :users * 10) AS n
+        ON CONFLICT DO NOTHING
+        """,
+    ]
+    for statement in statements:
+        app.db.execute_with_no_return(statement, users=users, products=products, carts=carts)
+    for table in TABLES:
+        app.db.execute_with_no_return('ANALYZE ' + table)
+    app.db.commit()
+
+
+@contextmanager
+def explaining(app):
+    """
+    While active, app.db.execute EXPLAINs each statement instead of running it, collecting the plans and returning no
+    rows to the caller
+    """
+    plans = []
+    execute = app.db.execute
+
+    def explain(sqlstr, **kwargs):
+        plans.append(execute('EXPLAIN (FORMAT JSON) ' + sqlstr, **kwargs)[0][0][0]['Plan'])
+        return []
+
+    app.db.execute = explain
+    try:
+        yield plans
+    finally:
+        del app.db.execute  # back to the DB class's method
+
+
+def scans_of(plan, table):
+    if plan.get('Relation Name') == table:
+        yield plan['Node Type'], plan.get('Index Name')
+    for child in plan.get('Plans', []):
+        yield from scans_of(child, table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=1, help='multiplies the amount of generated data')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch schema afterwards')
+    args = parser.parse_args()
+
+    app = create_app()
+    failures = []
+    with app.app_context(), scratch_schema(app, 'check_indexes', keep=args.keep):
+        generate_data(app, args.scale)
+
+        for name, table, call in CHECKS:
+            with explaining(app) as plans:
+                call()
+            scans = [scan for plan in plans for scan in scans_of(plan, table)]
+            ok = bool(scans) and all(node_type in INDEX_SCANS for node_type, _ in scans)
+            print('{:<5} {:<45} {}'.format('ok' if ok else 'FAIL', name, ', '.join(
+                node_type + (' using ' + index if index else '') for node_type, index in scans) or 'no scan of ' + table))
+            if not ok:
+                failures.append(name)
+
+    if failures:
+        print('{} quer{} not using an index: {}'.format(
+            len(failures), 'y' if len(failures) == 1 else 'ies', ', '.join(failures)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
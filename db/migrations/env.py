@@ -0,0 +1,41 @@
+"""
+Alembic environment for the schema migrations. Migrations are written as plain SQL (op.execute), like the rest of the
+app's queries, so no SQLAlchemy metadata is used; the database URL comes from the app's Config, i.e. from the DB_*
+variables in .flaskenv.
+"""
+import os
+import sys
+from logging.config import fileConfig
+
+from alembic import context
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+repository_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, repository_root)
+load_dotenv(os.path.join(repository_root, '.flaskenv'))
+
+from app.config import Config  # noqa: E402 (needs the environment loaded above)
+
+if context.config.config_file_name is not None:
+    fileConfig(context.config.config_file_name)
+
+
+def run_migrations_offline():
+    context.configure(url=Config.SQLALCHEMY_DATABASE_URI, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    engine = create_engine(Config.SQLALCHEMY_DATABASE_URI, future=True)
+    with engine.connect() as connection:
+        context.configure(connection=connection)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
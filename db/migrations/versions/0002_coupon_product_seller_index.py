@@ -0,0 +1,34 @@
+"""Index for looking up the current coupon of a (product, seller) pair
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+    Coupon(product_id, seller_id, expiration_date)   the current coupon of a product from one seller
+                                                     (Coupon.get_current_coupon_for_product_seller, and
+                                                     get_current_coupons_for_product_sellers for a page of them);
+                                                     this replaces coupon_product_expiration_index, since no query
+                                                     looks up a product's coupons across all of its sellers anymore
+"""
+from alembic import op
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS coupon_product_seller_expiration_index '
+                   'ON Coupon(product_id, seller_id, expiration_date)')
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS coupon_product_expiration_index')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS coupon_product_expiration_index '
+                   'ON Coupon(product_id, expiration_date)')
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS coupon_product_seller_expiration_index')
@@ -0,0 +1,144 @@
+"""Range-partition Coupon by expiration month and archive expired coupons
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+Coupon becomes a table partitioned by month of expiration_date, so that the queries for valid coupons
+(expiration_date >= now) only read the partitions of the current and coming months. The partitions are named
+coupon_YYYY_MM and created by ensure_coupon_partition(month), which the migration calls for the next few months and
+reap_coupons.py keeps calling ahead of time; coupons falling outside of them land in coupon_default until their
+month's partition is created, which moves them over. Expired coupons are moved to CouponArchive (by reap_coupons.py
+from then on), where purchased carts can still find the coupon they used.
+
+The primary key of a partitioned table has to include the partition key, so it becomes (code, expiration_date), and
+Cart.coupon_applied can no longer reference Coupon(code) with a foreign key; a cart's coupon is looked up in Coupon
+first and in CouponArchive after that (Coupon.get).
+
+The table is rebuilt inside one transaction, which blocks access to coupons while it runs; run it while the site is
+quiet.
+"""
+from alembic import op
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+PARTITION_MONTHS_AHEAD = 3
+
+
+def upgrade():
+    op.execute('ALTER TABLE Cart DROP CONSTRAINT IF EXISTS cart_coupon_applied_fkey')
+    op.execute('ALTER TABLE Coupon RENAME TO coupon_unpartitioned')
+    op.execute('ALTER TABLE coupon_unpartitioned RENAME CONSTRAINT coupon_pkey TO coupon_unpartitioned_pkey')
+    op.execute('ALTER INDEX coupon_product_seller_expiration_index '
+               'RENAME TO coupon_unpartitioned_product_seller_expiration_index')
+
+    op.execute("""
+    CREATE TABLE Coupon (
+        code VARCHAR(255) NOT NULL,
+        expiration_date timestamp without time zone NOT NULL,
+        product_id INT NOT NULL,
+        seller_id INT NOT NULL,
+        percent_off INT NOT NULL,
+        PRIMARY KEY (code, expiration_date),
+        FOREIGN KEY (seller_id, product_id) REFERENCES Sells(seller_id, product_id) ON DELETE CASCADE,
+        CHECK (percent_off > 0 AND percent_off <= 100)
+    ) PARTITION BY RANGE (expiration_date)
+    """)
+    op.execute('CREATE INDEX coupon_product_seller_expiration_index ON Coupon(product_id, seller_id, expiration_date)')
+    op.execute('CREATE TABLE coupon_default PARTITION OF Coupon DEFAULT')
+
+    # creates the partition for the month starting at month_start unless it exists already, moving over any of its
+    # coupons that went to the default partition in the meantime
+    op.execute("""
+    CREATE FUNCTION ensure_coupon_partition(month_start date) RETURNS void AS $$
+    DECLARE
+        partition_name text := 'coupon_' || to_char(month_start, 'YYYY_MM');
+        month_end date := (month_start + interval '1 month')::date;
+    BEGIN
+        IF to_regclass(partition_name) IS NOT NULL THEN
+            RETURN;
+        END IF;
+        EXECUTE format('CREATE TABLE %I (LIKE Coupon INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+        EXECUTE format('WITH moved AS (DELETE FROM coupon_default WHERE expiration_date >= %L AND expiration_date < %L '
+                       'RETURNING *) INSERT INTO %I SELECT * FROM moved', month_start, month_end, partition_name);
+        EXECUTE format('ALTER TABLE Coupon ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                       partition_name, month_start, month_end);
+    END;
+    $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+    SELECT ensure_coupon_partition(month_start::date)
+    FROM generate_series(date_trunc('month', now()),
+                         date_trunc('month', now()) + interval '{} months',
+                         interval '1 month') AS month_start
+    """.format(PARTITION_MONTHS_AHEAD))
+
+    op.execute("""
+    CREATE TABLE CouponArchive (
+        code VARCHAR(255) PRIMARY KEY,
+        expiration_date timestamp without time zone NOT NULL,
+        product_id INT NOT NULL,
+        seller_id INT NOT NULL,
+        percent_off INT NOT NULL,
+        archived_at timestamp without time zone NOT NULL DEFAULT now()
+    )
+    """)
+
+    op.execute("""
+    INSERT INTO Coupon(code, expiration_date, product_id, seller_id, percent_off)
+    SELECT code, expiration_date, product_id, seller_id, percent_off
+    FROM coupon_unpartitioned
+    WHERE expiration_date >= now()
+    """)
+    op.execute("""
+    INSERT INTO CouponArchive(code, expiration_date, product_id, seller_id, percent_off)
+    SELECT code, expiration_date, product_id, seller_id, percent_off
+    FROM coupon_unpartitioned
+    WHERE expiration_date < now()
+    """)
+    op.execute('DROP TABLE coupon_unpartitioned')
+
+
+def downgrade():
+    op.execute("""
+    CREATE TABLE coupon_unpartitioned (
+        code VARCHAR(255) PRIMARY KEY,
+        expiration_date timestamp without time zone NOT NULL,
+        product_id INT NOT NULL,
+        seller_id INT NOT NULL,
+        percent_off INT NOT NULL,
+        FOREIGN KEY (seller_id, product_id) REFERENCES Sells(seller_id, product_id) ON DELETE CASCADE,
+        CHECK (percent_off > 0 AND percent_off <= 100)
+    )
+    """)
+    # archived coupons whose product is no longer sold by the seller cannot come back
+    op.execute("""
+    INSERT INTO coupon_unpartitioned(code, expiration_date, product_id, seller_id, percent_off)
+    SELECT code, expiration_date, product_id, seller_id, percent_off
+    FROM Coupon
+    UNION ALL
+    SELECT code, expiration_date, product_id, seller_id, percent_off
+    FROM CouponArchive
+    WHERE EXISTS (SELECT 1 FROM Sells
+                  WHERE Sells.seller_id = CouponArchive.seller_id AND Sells.product_id = CouponArchive.product_id)
+    ON CONFLICT (code) DO NOTHING
+    """)
+    op.execute("""
+    UPDATE Cart
+    SET coupon_applied = NULL
+    WHERE coupon_applied IS NOT NULL
+    AND NOT EXISTS (SELECT 1 FROM coupon_unpartitioned WHERE code = Cart.coupon_applied)
+    """)
+    op.execute('DROP TABLE CouponArchive')
+    op.execute('DROP TABLE Coupon')
+    op.execute('DROP FUNCTION ensure_coupon_partition(date)')
+
+    op.execute('ALTER TABLE coupon_unpartitioned RENAME TO Coupon')
+    op.execute('ALTER TABLE Coupon RENAME CONSTRAINT coupon_unpartitioned_pkey TO coupon_pkey')
+    op.execute('CREATE INDEX coupon_product_seller_expiration_index ON Coupon(product_id, seller_id, expiration_date)')
+    op.execute('ALTER TABLE Cart ADD CONSTRAINT cart_coupon_applied_fkey '
+               'FOREIGN KEY (coupon_applied) REFERENCES Coupon(code)')
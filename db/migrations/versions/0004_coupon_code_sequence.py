@@ -0,0 +1,69 @@
+"""Generate coupon codes from a sequence
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+
+Coupon codes used to be random letters, checked against the table one attempt at a time until an unused one came up.
+Now each code is coupon_code(nextval('coupon_code_seq')): the sequence number put through a permutation of the 40-bit
+numbers and written as 8 base32 characters. Different sequence numbers always give different codes, so new codes are
+unique without being looked up first. The old codes are 10 to 12 characters long, so they can never clash with the new
+ones.
+
+The permutation is a Feistel network of COUPON_CODE_ROUNDS rounds over the two 20-bit halves, whose round function is
+SHA-256 of a round key and the right half. The round keys are random bytes the migration stores in CouponCodeKey, so
+they live only in the database: without them, knowing some codes tells nothing about the codes issued before or after.
+They must never change once codes have been issued, or new codes could repeat old ones.
+"""
+import secrets
+
+from alembic import op
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+COUPON_CODE_ROUNDS = 4
+
+
+def upgrade():
+    op.execute('CREATE SEQUENCE coupon_code_seq MINVALUE 0 START 0 MAXVALUE 1099511627775')  # 2^40 - 1
+    op.execute("""
+    CREATE TABLE CouponCodeKey (
+        round INT PRIMARY KEY,
+        key BYTEA NOT NULL
+    )
+    """)
+    op.execute(
+        'INSERT INTO CouponCodeKey(round, key) VALUES '
+        + ', '.join("({}, '\\x{}'::bytea)".format(i, secrets.token_hex(32)) for i in range(COUPON_CODE_ROUNDS))
+    )
+    op.execute("""
+    CREATE FUNCTION coupon_code(n bigint) RETURNS text AS $$
+    DECLARE
+        l int := (n >> 20) & 1048575;
+        r int := n & 1048575;
+        round_key bytea;
+        t int;
+        scrambled bigint;
+    BEGIN
+        FOR round_key IN SELECT key FROM CouponCodeKey ORDER BY round LOOP
+            t := r;
+            r := l # ('x' || substr(encode(sha256(round_key || int4send(r)), 'hex'), 1, 5))::bit(20)::int;
+            l := t;
+        END LOOP;
+        scrambled := (l::bigint << 20) | r;
+        RETURN (SELECT string_agg(substr('abcdefghijklmnopqrstuvwxyz234567', ((scrambled >> (5 * i)) & 31)::int + 1, 1),
+                                  '' ORDER BY i DESC)
+                FROM generate_series(0, 7) AS i);
+    END;
+    $$ LANGUAGE plpgsql STABLE
+    """)
+
+
+def downgrade():
+    op.execute('DROP FUNCTION coupon_code(bigint)')
+    op.execute('DROP TABLE CouponCodeKey')
+    op.execute('DROP SEQUENCE coupon_code_seq')
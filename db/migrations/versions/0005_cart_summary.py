@@ -0,0 +1,42 @@
+"""Keep each cart's item count and subtotal on the Cart row
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+
+    Cart.item_count     the number of units in the cart (the sum of its lines' quantities)
+    Cart.subtotal       what the units in a current cart cost at the products' current prices, before any coupon
+
+The ProductInCart methods that change a cart's lines update these in the same statement (ProductInCart.add_to_cart,
+increase_quantity, decrease_quantity, remove_from_cart), and Product.update_price updates the subtotals of the current
+carts holding the product, so the cart page and the checkout guard read them instead of adding up the lines.
+"""
+from alembic import op
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('ALTER TABLE Cart ADD COLUMN item_count INT NOT NULL DEFAULT 0, '
+               'ADD COLUMN subtotal DECIMAL(12,2) NOT NULL DEFAULT 0')
+    op.execute("""
+    UPDATE Cart
+    SET item_count = totals.item_count,
+        subtotal = CASE WHEN Cart.is_current THEN totals.subtotal ELSE 0 END
+    FROM (
+        SELECT ProductInCart.cart_id, SUM(ProductInCart.quantity) AS item_count,
+               SUM(ProductInCart.quantity * Product.price) AS subtotal
+        FROM ProductInCart
+        JOIN Product ON Product.id = ProductInCart.product_id
+        GROUP BY ProductInCart.cart_id
+    ) AS totals
+    WHERE Cart.id = totals.cart_id
+    """)
+
+
+def downgrade():
+    op.execute('ALTER TABLE Cart DROP COLUMN item_count, DROP COLUMN subtotal')
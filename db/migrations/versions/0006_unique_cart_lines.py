@@ -0,0 +1,82 @@
+"""One line per (cart, product, seller)
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+
+ProductInCart.add_to_cart used to look for the cart's line of a product before inserting one, so two clicks at the same
+time could both insert. The duplicated lines are merged here into the oldest of them: the quantities are added up and,
+for carts already purchased, the merged line's purchase keeps the same total (its unit price becomes the
+quantity-weighted average) and only counts as fulfilled if all of the merged purchases were. The other lines and their
+purchases are deleted.
+
+The unique constraint on (cart_id, product_id, seller_id) then lets add_to_cart upsert with INSERT ... ON CONFLICT, and
+its index replaces product_in_cart_cart_product_seller_index from 0001, which has the same columns. Merged lines are
+not split up again by the downgrade.
+"""
+from alembic import op
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+    CREATE TEMPORARY TABLE duplicate_line ON COMMIT DROP AS
+    SELECT id, MIN(id) OVER (PARTITION BY cart_id, product_id, seller_id) AS keep_id, quantity
+    FROM ProductInCart
+    WHERE (cart_id, product_id, seller_id) IN (
+        SELECT cart_id, product_id, seller_id
+        FROM ProductInCart
+        GROUP BY cart_id, product_id, seller_id
+        HAVING COUNT(*) > 1
+    )
+    """)
+    op.execute("""
+    UPDATE Purchase
+    SET final_unit_price = merged.final_unit_price,
+        is_fulfilled = merged.is_fulfilled,
+        time_of_fulfillment = merged.time_of_fulfillment
+    FROM (
+        SELECT duplicate_line.keep_id,
+               SUM(duplicate_line.quantity * Purchase.final_unit_price) / SUM(duplicate_line.quantity)
+                   AS final_unit_price,
+               BOOL_AND(Purchase.is_fulfilled) AS is_fulfilled,
+               CASE WHEN BOOL_AND(Purchase.is_fulfilled) THEN MAX(Purchase.time_of_fulfillment) END
+                   AS time_of_fulfillment
+        FROM duplicate_line
+        JOIN Purchase ON Purchase.product_in_cart_id = duplicate_line.id
+        GROUP BY duplicate_line.keep_id
+    ) AS merged
+    WHERE Purchase.product_in_cart_id = merged.keep_id
+    """)
+    op.execute("""
+    UPDATE ProductInCart
+    SET quantity = merged.quantity
+    FROM (
+        SELECT keep_id, SUM(quantity) AS quantity
+        FROM duplicate_line
+        GROUP BY keep_id
+    ) AS merged
+    WHERE ProductInCart.id = merged.keep_id
+    """)
+    # the purchases of the deleted lines go with them (ON DELETE CASCADE)
+    op.execute("""
+    DELETE FROM ProductInCart
+    USING duplicate_line
+    WHERE ProductInCart.id = duplicate_line.id
+    AND duplicate_line.id <> duplicate_line.keep_id
+    """)
+
+    op.execute('ALTER TABLE ProductInCart ADD CONSTRAINT product_in_cart_line_unique '
+               'UNIQUE (cart_id, product_id, seller_id)')
+    op.execute('DROP INDEX IF EXISTS product_in_cart_cart_product_seller_index')
+
+
+def downgrade():
+    op.execute('CREATE INDEX IF NOT EXISTS product_in_cart_cart_product_seller_index '
+               'ON ProductInCart(cart_id, product_id, seller_id)')
+    op.execute('ALTER TABLE ProductInCart DROP CONSTRAINT product_in_cart_line_unique')
@@ -0,0 +1,31 @@
+"""Keep each order's total and discount on the Cart row
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+
+    Cart.total_price    what was paid for a purchased cart, NULL for current carts and orders not totalled yet
+    Cart.discount       how much the coupon took off that total
+
+For purchased carts Cart.subtotal (see 0005) now holds what the units cost at the prices they were bought at, before
+the coupon, so that subtotal - discount = total_price. Checkout.order_cart sets all three, together with item_count,
+when the cart is bought, so the order history and order pages read them instead of adding up the purchases.
+
+Orders bought before this migration are totalled by backfill_order_totals.py (see Cart.backfill_order_totals), in
+batches so that the Cart table is not locked all at once; until then their total is worked out from their purchases.
+"""
+from alembic import op
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('ALTER TABLE Cart ADD COLUMN total_price DECIMAL(12,2), ADD COLUMN discount DECIMAL(12,2)')
+
+
+def downgrade():
+    op.execute('ALTER TABLE Cart DROP COLUMN total_price, DROP COLUMN discount')
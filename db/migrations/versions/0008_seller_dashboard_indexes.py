@@ -0,0 +1,42 @@
+"""Indexes for the seller dashboard
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+
+    ProductInCart(seller_id)                         the lines a seller sold, which every SellerDashboard query
+                                                     starts from
+    Purchase(product_in_cart_id) WHERE NOT is_fulfilled
+                                                     the purchases still to fulfill, a small part of Purchase, joined
+                                                     to the seller's lines for the incoming orders and the counts of
+                                                     what is left to fulfill
+
+Built CONCURRENTLY, like the indexes of 0001, so that migrating a live database does not block checkouts.
+"""
+from alembic import op
+
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    'product_in_cart_seller_index':
+        'ProductInCart(seller_id)',
+    'purchase_unfulfilled_index':
+        'Purchase(product_in_cart_id) WHERE NOT is_fulfilled',
+}
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, definition in INDEXES.items():
+            op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS ' + name + ' ON ' + definition)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS ' + name)
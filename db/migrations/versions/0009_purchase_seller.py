@@ -0,0 +1,59 @@
+"""Keep the seller of each purchase on the Purchase row
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+
+    Purchase.seller_id                               copy of ProductInCart.seller_id, which Checkout.order_cart sets
+                                                     when it records the purchase
+    Purchase(seller_id, time_purchased DESC, cart_id DESC)
+                                                     a seller's orders, most recent first (SellerDashboard.get_orders)
+    Purchase(seller_id, time_purchased DESC, cart_id DESC) WHERE NOT is_fulfilled
+                                                     a seller's incoming orders, most recent first (get_orders), and
+                                                     the ones newer than those shown (get_new_orders)
+
+A seller's orders are listed by (time_purchased, cart_id) of their purchases, but the seller of a purchase used to be
+known only through its ProductInCart line, so no index could list a seller's purchases in that order and every page
+had to group the seller's whole history first. With these indexes a page of orders is picked by reading just its
+carts' keys from the index.
+
+The existing purchases are updated in one transaction, which blocks checkouts while it runs; run it while the site is
+quiet. The indexes are then built CONCURRENTLY, like those of 0001.
+"""
+from alembic import op
+
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    'purchase_seller_time_index':
+        'Purchase(seller_id, time_purchased DESC, cart_id DESC)',
+    'purchase_seller_unfulfilled_time_index':
+        'Purchase(seller_id, time_purchased DESC, cart_id DESC) WHERE NOT is_fulfilled',
+}
+
+
+def upgrade():
+    op.execute('ALTER TABLE Purchase ADD COLUMN seller_id INT')
+    op.execute("""
+    UPDATE Purchase
+    SET seller_id = ProductInCart.seller_id
+    FROM ProductInCart
+    WHERE ProductInCart.id = Purchase.product_in_cart_id
+    """)
+    op.execute('ALTER TABLE Purchase ALTER COLUMN seller_id SET NOT NULL')
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, definition in INDEXES.items():
+            op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS ' + name + ' ON ' + definition)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS ' + name)
+    op.execute('ALTER TABLE Purchase DROP COLUMN seller_id')
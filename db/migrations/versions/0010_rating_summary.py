@@ -0,0 +1,56 @@
+"""Keep per-product and per-seller rating aggregates in RatingSummary
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18
+
+    RatingSummary.product_id    the product these ratings are for (-1 for a seller summary, as in Feedback)
+    RatingSummary.seller_id     the seller these ratings are for (-1 for a product summary, as in Feedback)
+    RatingSummary.num_ratings   the number of reviews
+    RatingSummary.rating_sum    the sum of the ratings of those reviews
+    RatingSummary.stars_1 ... stars_5
+                                how many of those reviews gave 1 ... 5 stars
+
+ProductReview applies the change of every review it adds, edits or removes to its RatingSummary row in the same unit
+of work, and the product and seller pages read their averages and star counts from there instead of aggregating
+Feedback. The migration fills the table from the existing reviews, holding off review writes (SHARE lock on Feedback)
+until it commits so that none of them is missed.
+"""
+from alembic import op
+
+
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+    CREATE TABLE RatingSummary (
+        product_id INT NOT NULL,
+        seller_id INT NOT NULL,
+        num_ratings INT NOT NULL DEFAULT 0,
+        rating_sum INT NOT NULL DEFAULT 0,
+        stars_1 INT NOT NULL DEFAULT 0,
+        stars_2 INT NOT NULL DEFAULT 0,
+        stars_3 INT NOT NULL DEFAULT 0,
+        stars_4 INT NOT NULL DEFAULT 0,
+        stars_5 INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (product_id, seller_id)
+    )
+    """)
+    op.execute('LOCK TABLE Feedback IN SHARE MODE')
+    op.execute("""
+    INSERT INTO RatingSummary(product_id, seller_id, num_ratings, rating_sum,
+                              stars_1, stars_2, stars_3, stars_4, stars_5)
+    SELECT product_id, seller_id, COUNT(*), SUM(rating),
+           COUNT(*) FILTER (WHERE rating = 1), COUNT(*) FILTER (WHERE rating = 2), COUNT(*) FILTER (WHERE rating = 3),
+           COUNT(*) FILTER (WHERE rating = 4), COUNT(*) FILTER (WHERE rating = 5)
+    FROM Feedback
+    GROUP BY product_id, seller_id
+    """)
+
+
+def downgrade():
+    op.execute('DROP TABLE RatingSummary')
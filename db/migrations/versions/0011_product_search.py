@@ -0,0 +1,52 @@
+"""Index product search
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18
+
+    Product.search_vector                            full-text search document over name (weight A) and description
+                                                     (weight B), a generated column the database keeps up to date
+    Product USING GIN (search_vector)                full-text matches of a search (Product.search_filter)
+    Product USING GIN (name gin_trgm_ops)            names containing the search, or with a word similar to it; needs
+                                                     the pg_trgm extension
+
+Adding the generated column rewrites Product in one transaction, which blocks access to products while it runs; run it
+while the site is quiet. The indexes are then built CONCURRENTLY, like those of 0001.
+"""
+from alembic import op
+
+
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    'product_search_vector_index':
+        'Product USING GIN (search_vector)',
+    'product_name_trgm_index':
+        'Product USING GIN (name gin_trgm_ops)',
+}
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute("""
+    ALTER TABLE Product ADD COLUMN search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', name), 'A')
+        || setweight(to_tsvector('english', COALESCE(description, '')), 'B')
+    ) STORED
+    """)
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, definition in INDEXES.items():
+            op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS ' + name + ' ON ' + definition)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS ' + name)
+    op.execute('ALTER TABLE Product DROP COLUMN search_vector')
+    op.execute('DROP EXTENSION IF EXISTS pg_trgm')
@@ -4,7 +4,9 @@ mypath=`realpath $0`
 mybase=`dirname $mypath`
 cd $mybase
 
+set -a  # export the settings so that alembic (migrations/env.py) sees them too
 source ../.flaskenv
+set +a
 dbname=$DB_NAME
 
 if [[ -n `psql -lqt | cut -d \| -f 1 | grep -w "$dbname"` ]]; then
@@ -14,3 +16,5 @@ createdb $dbname
 
 psql -af create.sql $dbname
 psql -af load.sql $dbname
+
+alembic upgrade head
@@ -0,0 +1,164 @@
+"""
+Stress test for concurrent checkouts against one hot product.
+
+Creates a batch of throwaway buyers, puts one unit of the same product (sold by the same seller) in each of their
+carts, limits that seller's inventory to fewer units than there are buyers and then checks all of the carts out at the
+same moment from parallel threads. Afterwards it asserts that the inventory never went negative, that exactly as many
+checkouts succeeded as there were units in stock, and that every success (and only those) left a purchase behind.
+The buyers, their carts and purchases are deleted and the product's inventory restored at the end.
+
+Run it from the repository root against a loaded database:
+    python -m db.stress_checkout --buyers 50 --stock 20
+"""
+import argparse
+import sys
+import threading
+import uuid
+
+from dotenv import load_dotenv
+
+load_dotenv('.flaskenv')
+
+from app import create_app  # noqa: E402 (needs the environment loaded above)
+from app.models.cart import Cart  # noqa: E402
+from app.models.checkout import Checkout  # noqa: E402
+from app.models.product_in_cart import ProductInCart  # noqa: E402
+
+
+def pick_hot_product(app):
+    rows = app.db.execute(
+        """
+        SELECT Sells.seller_id, Sells.product_id, Sells.inventory, Product.price
+        FROM Sells
+        JOIN Product ON Product.id = Sells.product_id
+        WHERE Sells.is_available
+        ORDER BY Sells.seller_id, Sells.product_id
+        LIMIT 1
+        """
+    )
+    return rows[0]
+
+
+def create_buyers(app, count, balance):
+    run_id = uuid.uuid4().hex[:8]
+    return [row[0] for row in app.db.execute(
+        """
+        INSERT INTO Users(email, password, first_name, last_name, balance, address)
+        SELECT 'stress-' || :run_id || '-' || n || '@example.com', 'x', 'Stress', 'Buyer ' || n, :balance, ''
+        FROM generate_series(1, :count) AS n
+        RETURNING id
+        """,
+        run_id=run_id,
+        count=count,
+        balance=balance
+    )]
+
+
+def fill_carts(app, buyer_ids, seller_id, product_id):
+    cart_ids = []
+    for buyer_id in buyer_ids:
+        cart = Cart.get_current_cart(buyer_id)
+        ProductInCart.add_to_cart(product_id, seller_id, cart.id)
+        cart_ids.append(cart.id)
+    return cart_ids
+
+
+def checkout_in_parallel(app, cart_ids):
+    results = {}
+    start = threading.Barrier(len(cart_ids))
+
+    def buy(cart_id):
+        start.wait()
+        with app.app_context():
+            try:
+                results[cart_id] = Checkout.order_cart(Cart.get_cart_by_id(cart_id))
+            except Exception as e:  # report, don't hide, unexpected database errors
+                results[cart_id] = 'error: {}'.format(e)
+
+    threads = [threading.Thread(target=buy, args=(cart_id,)) for cart_id in cart_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def clean_up(app, buyer_ids, seller_id, product_id, inventory, seller_balance):
+    app.db.execute_with_no_return(
+        "DELETE FROM Purchase WHERE user_id = ANY(:ids)", ids=buyer_ids)
+    app.db.execute_with_no_return(
+        "DELETE FROM ProductInCart WHERE cart_id IN (SELECT id FROM Cart WHERE user_id = ANY(:ids))", ids=buyer_ids)
+    app.db.execute_with_no_return(
+        "DELETE FROM Cart WHERE user_id = ANY(:ids)", ids=buyer_ids)
+    app.db.execute_with_no_return(
+        "DELETE FROM Users WHERE id = ANY(:ids)", ids=buyer_ids)
+    app.db.execute_with_no_return(
+        "UPDATE Sells SET inventory = :inventory WHERE seller_id = :seller_id AND product_id = :product_id",
+        inventory=inventory, seller_id=seller_id, product_id=product_id)
+    app.db.execute_with_no_return(
+        "UPDATE Users SET balance = :balance WHERE id = :seller_id", balance=seller_balance, seller_id=seller_id)
+    app.db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--buyers', type=int, default=50, help='number of parallel checkouts')
+    parser.add_argument('--stock', type=int, default=20, help='units of the hot product in stock')
+    parser.add_argument('--isolation', default=None, help='override CHECKOUT_ISOLATION_LEVEL')
+    args = parser.parse_args()
+
+    app = create_app()
+    if args.isolation:
+        app.config['CHECKOUT_ISOLATION_LEVEL'] = args.isolation
+
+    with app.app_context():
+        seller_id, product_id, original_inventory, price = pick_hot_product(app)
+        seller_balance = app.db.execute("SELECT balance FROM Users WHERE id = :id", id=seller_id)[0][0]
+        buyer_ids = create_buyers(app, args.buyers, balance=float(price) * 10)
+        cart_ids = fill_carts(app, buyer_ids, seller_id, product_id)
+        app.db.execute_with_no_return(
+            "UPDATE Sells SET inventory = :stock WHERE seller_id = :seller_id AND product_id = :product_id",
+            stock=args.stock, seller_id=seller_id, product_id=product_id)
+        app.db.commit()
+
+    print('Checking out {} carts in parallel against product {} (seller {}) with {} in stock'.format(
+        args.buyers, product_id, seller_id, args.stock))
+    results = checkout_in_parallel(app, cart_ids)
+
+    with app.app_context():
+        final_inventory = app.db.execute(
+            "SELECT inventory FROM Sells WHERE seller_id = :seller_id AND product_id = :product_id",
+            seller_id=seller_id, product_id=product_id)[0][0]
+        purchases = app.db.execute(
+            "SELECT COUNT(*) FROM Purchase WHERE user_id = ANY(:ids)", ids=buyer_ids)[0][0]
+        clean_up(app, buyer_ids, seller_id, product_id, original_inventory, seller_balance)
+
+    successes = sum(1 for error in results.values() if error is None)
+    errors = sorted({error for error in results.values() if error and error.startswith('error')})
+    expected = min(args.buyers, args.stock)
+    print('successful checkouts: {} (expected {})'.format(successes, expected))
+    print('purchases recorded:   {}'.format(purchases))
+    print('inventory left:       {} (expected {})'.format(final_inventory, args.stock - expected))
+    for error in errors:
+        print(error)
+
+    failures = []
+    if final_inventory < 0:
+        failures.append('inventory went negative')
+    if successes != expected:
+        failures.append('number of successful checkouts does not match the stock')
+    if purchases != successes:
+        failures.append('purchases recorded do not match successful checkouts')
+    if final_inventory != args.stock - successes:
+        failures.append('inventory does not match successful checkouts')
+    if errors:
+        failures.append('checkouts failed with database errors')
+    for failure in failures:
+        print('FAIL: ' + failure)
+    if failures:
+        sys.exit(1)
+    print('OK: no oversell')
+
+
+if __name__ == '__main__':
+    main()
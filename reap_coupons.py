@@ -0,0 +1,62 @@
+"""
+Maintenance job for the Coupon table: creates the coming months' partitions, moves expired coupons to CouponArchive in
+batches (committing after each one) and drops the partitions of past months once they are empty.
+
+Run it once, e.g. nightly from cron:
+    python reap_coupons.py
+or keep it running in the background, repeating every hour:
+    python reap_coupons.py --every 3600
+"""
+import argparse
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv('.flaskenv')
+
+from app import create_app  # noqa: E402 (needs the environment loaded above)
+from app.models.coupon_maintenance import CouponMaintenance, ARCHIVE_BATCH_SIZE, PARTITION_MONTHS_AHEAD  # noqa: E402
+
+
+def reap(app, batch_size, months_ahead, pause):
+    with app.app_context():
+        CouponMaintenance.ensure_partitions(months_ahead)
+        app.db.commit()
+
+        archived = 0
+        while True:
+            moved = CouponMaintenance.archive_expired(batch_size)
+            app.db.commit()
+            archived += moved
+            if moved < batch_size:
+                break
+            time.sleep(pause)  # let other work in between batches
+
+        dropped = CouponMaintenance.drop_empty_partitions()
+        app.db.commit()
+
+    print('archived {} expired coupon{}, dropped {} empty partition{}{}'.format(
+        archived, '' if archived == 1 else 's', len(dropped), '' if len(dropped) == 1 else 's',
+        ' (' + ', '.join(dropped) + ')' if dropped else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE,
+                        help='how many expired coupons to move per transaction')
+    parser.add_argument('--months-ahead', type=int, default=PARTITION_MONTHS_AHEAD,
+                        help='how many months past the current one to create partitions for')
+    parser.add_argument('--pause', type=float, default=0.1, help='seconds to wait between batches')
+    parser.add_argument('--every', type=float, help='keep running, repeating every this many seconds')
+    args = parser.parse_args()
+
+    app = create_app()
+    while True:
+        reap(app, args.batch_size, args.months_ahead, args.pause)
+        if args.every is None:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    main()